@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : bench_read_band_in_log.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+"""
+Benchmark `read_band_in_log` against the previous readlines-based reader on a synthetic nscf log.
+
+Usage:
+```
+python bench_read_band_in_log.py --size-mb 2048 --nbands 2000
+```
+Each reader runs in a fresh process, peak RSS of that process is reported.
+"""
+import argparse
+import multiprocessing
+import pathlib
+import resource
+import tempfile
+import time
+
+import numpy as np
+from bandapi.io.abacus.out import BandValuePattern, read_band_in_log
+
+
+def legacy_read_band_in_log(log_file, _nspin=1):
+    with open(log_file, "r") as f:
+        content = f.readlines()
+    kpath = []
+    bandValue = BandValuePattern.findall("".join(content))
+    with open(log_file, "r") as f:
+        line = f.readline()
+        while line:
+            if "nkstot" in line:
+                knum = int(line.split("=")[-1])
+                f.readline()
+                f.readline()
+                for kpoint_idx in range(knum):
+                    kpoint_line = f.readline()
+                    kpath.append(kpoint_line)
+            line = f.readline()
+    kpathArray = np.array(list([item.split()[1:4] for item in kpath]), dtype=float)
+    bandArray = np.array(list([item.split()[_nspin] for item in bandValue]), dtype=float).reshape([_nspin, knum, -1])
+    return kpathArray, bandArray
+
+
+def write_synthetic_log(log_file, size_mb, nbands):
+    line_size = len(" spin1_final_band 1000 -12.3456789\n")
+    nk = max(1, int(size_mb * 1024 ** 2 / line_size / nbands))
+    rng = np.random.default_rng(0)
+    with open(log_file, "w") as f:
+        f.write(f" nkstot = {nk}\n\n KPOINTS DIRECT_X DIRECT_Y DIRECT_Z WEIGHT\n")
+        f.writelines(f" {ik + 1} {ik / nk:.6f} 0.000000 0.000000 {1 / nk:.6f}\n" for ik in range(nk))
+        for ik in range(nk):
+            energies = np.sort(rng.uniform(-20, 20, nbands))
+            f.write(f" k-points{ik + 1}({nk}): {ik / nk:.6f} 0.000000 0.000000\n")
+            f.write("".join(f" spin1_final_band {ib + 1} {value:.8f}\n" for ib, value in enumerate(energies)))
+    return nk
+
+
+def _run(name, log_file, queue):
+    start = time.perf_counter()
+    if name == "legacy":
+        _, bandArray = legacy_read_band_in_log(log_file)
+    else:
+        _, bandArray = read_band_in_log(log_file)
+    queue.put((time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, bandArray.shape))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=float, default=256)
+    parser.add_argument("--nbands", type=int, default=1000)
+    parser.add_argument("--workdir", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        log_file = pathlib.Path(workdir) / "running_nscf.log"
+        nk = write_synthetic_log(log_file, args.size_mb, args.nbands)
+        print(f"log: {log_file.stat().st_size / 1024 ** 2:.1f} MB, nk={nk}, nbands={args.nbands}")
+        ctx = multiprocessing.get_context("spawn")
+        for name in ["legacy", "streaming"]:
+            queue = ctx.Queue()
+            process = ctx.Process(target=_run, args=(name, log_file, queue))
+            process.start()
+            elapsed, peak_mb, shape = queue.get()
+            process.join()
+            print(f"{name:>10}: {elapsed:8.2f} s, peak RSS {peak_mb:9.1f} MB, shape {shape}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : bench_write_abacus_stru.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+"""
+Benchmark STRU writing of `write_abacus_stru` against the previous per-atom string concatenation.
+
+Usage:
+```
+python bench_write_abacus_stru.py --natoms 100 10000 1000000
+```
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+from bandapi.io.abacus.stru import generate_atomic_positions_lines, write_abacus_stru
+
+
+def legacy_generate_atomic_positions_lines(stru_para_dict):
+    lines = "ATOMIC_POSITIONS\n"
+    lines += f"{stru_para_dict['coordinate_type']}\n\n"
+    for idx, ele in enumerate(stru_para_dict["atom_type_list"]):
+        lines += f"{ele}\n"
+        lines += f"{stru_para_dict['magnetism_list'][idx]}\n"
+        lines += f"{stru_para_dict['number_of_atoms_list'][idx]}\n"
+        for atom in stru_para_dict["pos_list"][idx]:
+            lines += f"{atom[0]} {atom[1]} {atom[2]} {int(atom[3])} {int(atom[4])} {int(atom[5])}\n"
+    return lines
+
+
+def make_stru_para_dict(natoms, ntype=4):
+    rng = np.random.default_rng(0)
+    number_of_atoms_list = [len(item) for item in np.array_split(np.arange(natoms), ntype)]
+    return {
+        "label_list": [f"X{idx}" for idx in range(ntype)],
+        "mass_list": [1.0] * ntype,
+        "pseudo_file_list": [f"X{idx}.upf" for idx in range(ntype)],
+        "lattice_constant": 10.0,
+        "lattice_matrix": np.eye(3),
+        "coordinate_type": "Direct",
+        "atom_type_list": [f"X{idx}" for idx in range(ntype)],
+        "magnetism_list": [0.0] * ntype,
+        "number_of_atoms_list": number_of_atoms_list,
+        "pos_list": [np.concatenate([rng.uniform(size=(num, 3)), np.ones([num, 3])], axis=-1) for num in number_of_atoms_list],
+    }
+
+
+def timeit(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--natoms", type=int, nargs="+", default=[100, 1000, 10000, 100000, 1000000])
+    parser.add_argument("--skip-legacy-above", type=int, default=100000, help="legacy writer is slow for large cells")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        for natoms in args.natoms:
+            stru_para_dict = make_stru_para_dict(natoms)
+            new = timeit(generate_atomic_positions_lines, stru_para_dict)
+            write = timeit(write_abacus_stru, workdir, stru_para_dict)
+            if natoms <= args.skip_legacy_above:
+                legacy = f"{timeit(legacy_generate_atomic_positions_lines, stru_para_dict):10.4f} s"
+            else:
+                legacy = "   skipped"
+            print(f"natoms={natoms:>8}: legacy {legacy}, bulk {new:10.4f} s, write_abacus_stru {write:10.4f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -11,11 +11,13 @@ import pathlib
 import dpdispatcher
 import paramiko.ssh_exception
 from bandapi.flow.abacus.matproj import AbacusFlowFromMatProj
+from bandapi.flow.campaign import CampaignQueue
 
 ABACUS_COMMAND = r"/home/ubuntu/abacus-develop/build/abacus"
 CPU_NUM = 8
 API_KEY = ""
 LOCAL_ROOT = pathlib.Path(r"./dispatcher")
+BATCH_SIZE = 1  # ids claimed by this worker at once.
 
 machine = {
     "batch_type": "shell",
@@ -50,13 +52,16 @@ else:
 #     "mp-149"
 # ]
 
+# Run this script as many workers as you like, on hosts sharing this directory.
+# Each id is claimed by one worker at a time; ids of a crashed worker are claimed again after its lease expires.
+queue = CampaignQueue(r"campaign.sqlite", lease_seconds=3600)
+queue.add(taskid)
+
 while 1:
     try:
-        for smalllist in taskid:
-            if (pathlib.Path(r"lock")/smalllist in list(pathlib.Path(r"lock").iterdir())):
-                continue
-            else:
-                (pathlib.Path(r"lock")/smalllist).touch()
+        with queue.lease(batch_size=BATCH_SIZE) as ids:
+            if not ids:
+                break
             flow = AbacusFlowFromMatProj(
                 API_KEY=API_KEY,
                 machine=machine,
@@ -67,7 +72,7 @@ while 1:
                     "nscf-band",
                     # "band-data"
                 ],
-                task_content=[smalllist],
+                task_content=ids,
                 task_setup={
                     "potential_name": "SG15",
                     "dr2": 1.0e-6, # dr2 parameter of ABACUS, see its document.
@@ -76,15 +81,20 @@ while 1:
                     "remote_command": ABACUS_COMMAND, # see above comment
                     "kpathrange": 15, # kpath density of band-structure calculation (only).
                     "flow_work_root": LOCAL_ROOT, # local path of flow
-                    "submission_check_period": 1, # check time of tasks.
+                    "state_db": "flowstate.sqlite", # finished materials are recorded here for quick restart. Build it once for an existing flow by `python -m bandapi.flow.statedb rebuild flowstate.sqlite <flow_work_root>`.
+                    "submission_check_period": {"initial": 5, "maximum": 120}, # check time of tasks, growing from 5s to 120s.
+                    "runtime_hints": {"scf-charge": 300, "nscf-band": 120}, # expected seconds of a task, a check is placed right after it.
                     # "nstep": 10,
                     "clean": False, # if False, file on remote server won't be delete by dpdispatcher after calculations.(For frequently stop and unstable network connection.)
                     "kpointfix":True # if True, kpoint with will be fix as Gamma:[kpointscope,kpointscope,kpointscope]
+                },
+                matproj_settings={
+                    "cache": "structure_cache", # structures fetched once are read from here in later runs.
+                    # "offline": True, # if True, only cached structures are used and no request is sent.
                 }
             )
 
             flow.submit()
-            (pathlib.Path(r"lock") / smalllist).unlink()
-    except paramiko.ssh_exception.SSHException:
+    except paramiko.ssh_exception.SSHException:  # ids are given back to the queue and retried
         pass
 
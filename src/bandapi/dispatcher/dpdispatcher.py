@@ -6,11 +6,20 @@
 # ALL RIGHTS ARE RESERVED UNLESS STATED.
 # ====================================== #
 
+import asyncio
+import functools
+import time
+
+from bandapi.dispatcher.polling import PollingPolicy, make_watcher
+
 try:
-    from dpdispatcher import Machine, Resources, Task, Submission, dlog
-    import time
+    from dpdispatcher import Machine, Resources, Task, Submission
 except ImportError:
     raise ImportError("Please install dpdispatcher by `pip install dpdispatcher`")
+try:
+    from dpdispatcher.dlog import dlog
+except ImportError:  # dpdispatcher before dlog module
+    from dpdispatcher import dlog
 
 class Submission(Submission):
     def run_submission(self, *, exit_on_submit=False, clean=True, period=40):
@@ -20,7 +29,11 @@ class Submission(Submission):
         Third, run the submission defined previously.
         Forth, wait until the tasks in the submission finished and download the result file to local directory.
         if exit_on_submit is True, submission will exit.
+
+        `period` is seconds between checks, or a PollingPolicy (or its dict) for backoff and runtime hints.
+        For LocalContext, waiting ends early when a task tag file is written.
         """
+        policy = PollingPolicy.from_setting(period)
         if not self.belonging_jobs:
             self.generate_jobs()
         self.try_recover_from_json()
@@ -31,28 +44,95 @@ class Submission(Submission):
             self.upload_jobs()
             self.handle_unexpected_submission_state()
             self.submission_to_json()
-        time.sleep(1)
-        while not self.check_all_finished():
-            if exit_on_submit is True:
-                dlog.info(f"submission succeeded: {self.submission_hash}")
-                dlog.info(f"at {self.machine.context.remote_root}")
-                return self.serialize()
-            try:
-                time.sleep(period)
-            except (Exception, KeyboardInterrupt, SystemExit) as e:
-                self.submission_to_json()
-                dlog.exception(e)
-                dlog.info(f"submission exit: {self.submission_hash}")
-                dlog.info(f"at {self.machine.context.remote_root}")
-                dlog.debug(self.serialize())
-                raise e
-            else:
-                self.handle_unexpected_submission_state()
-            finally:
-                pass
+        watcher = None if exit_on_submit else make_watcher(self.machine, policy)
+        if watcher is None:
+            time.sleep(min(1, policy.initial))
+        policy.reset()
+        try:
+            while not self.check_all_finished():
+                if exit_on_submit is True:
+                    dlog.info(f"submission succeeded: {self.submission_hash}")
+                    dlog.info(f"at {self.machine.context.remote_root}")
+                    return self.serialize()
+                try:
+                    interval = policy.next_interval()
+                    if watcher is not None:
+                        watcher.wait(interval)
+                    else:
+                        time.sleep(interval)
+                except (Exception, KeyboardInterrupt, SystemExit) as e:
+                    self.submission_to_json()
+                    dlog.exception(e)
+                    dlog.info(f"submission exit: {self.submission_hash}")
+                    dlog.info(f"at {self.machine.context.remote_root}")
+                    dlog.debug(self.serialize())
+                    raise e
+                else:
+                    self.handle_unexpected_submission_state()
+        finally:
+            if watcher is not None:
+                watcher.stop()
         self.handle_unexpected_submission_state()
         self.submission_to_json()
         self.download_jobs()
         if clean:
             self.clean_jobs()
         return self.serialize()
+
+    async def async_run_submission(self, *, exit_on_submit=False, clean=True, period=40, executor=None):
+        """Same to `run_submission`, but awaitable.
+        Blocking steps (recovering, uploading, status checks, downloading and cleaning) run in `executor`
+        and waiting between checks is `asyncio.sleep`, so one event loop drives many submissions at once.
+
+        :param executor: concurrent.futures.Executor, default executor of event loop if None.
+        """
+        policy = PollingPolicy.from_setting(period)
+        loop = asyncio.get_running_loop()
+
+        def run(func, *args, **kwargs):
+            return loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+        if not self.belonging_jobs:
+            await run(self.generate_jobs)
+        await run(self.try_recover_from_json)
+        if await run(self.check_all_finished):
+            dlog.info('info:check_all_finished: True')
+        else:
+            dlog.info('info:check_all_finished: False')
+            await run(self.upload_jobs)
+            await run(self.handle_unexpected_submission_state)
+            await run(self.submission_to_json)
+        watcher = None if exit_on_submit else make_watcher(self.machine, policy)
+        if watcher is None:
+            await asyncio.sleep(min(1, policy.initial))
+        policy.reset()
+        try:
+            while not await run(self.check_all_finished):
+                if exit_on_submit is True:
+                    dlog.info(f"submission succeeded: {self.submission_hash}")
+                    dlog.info(f"at {self.machine.context.remote_root}")
+                    return self.serialize()
+                try:
+                    interval = policy.next_interval()
+                    if watcher is not None:
+                        await watcher.await_change(interval)
+                    else:
+                        await asyncio.sleep(interval)
+                except (Exception, KeyboardInterrupt, SystemExit, asyncio.CancelledError) as e:
+                    self.submission_to_json()
+                    dlog.exception(e)
+                    dlog.info(f"submission exit: {self.submission_hash}")
+                    dlog.info(f"at {self.machine.context.remote_root}")
+                    dlog.debug(self.serialize())
+                    raise e
+                else:
+                    await run(self.handle_unexpected_submission_state)
+        finally:
+            if watcher is not None:
+                watcher.stop()
+        await run(self.handle_unexpected_submission_state)
+        await run(self.submission_to_json)
+        await run(self.download_jobs)
+        if clean:
+            await run(self.clean_jobs)
+        return self.serialize()
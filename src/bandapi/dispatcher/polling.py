@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : polling.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+import asyncio
+import pathlib
+import random
+import threading
+import time
+
+USE_WATCHDOG = False
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    USE_WATCHDOG = True
+except ImportError:
+    pass
+
+"""
+When to check status of a submission.
+
+`PollingPolicy` gives intervals between checks, growing exponentially with jitter and shortened to
+expected finishing times of tasks (runtime hints).
+`TagFileWatcher` wakes the waiting earlier when dpdispatcher writes a `*_tag_finished` file, for `LocalContext`
+whose remote root is on this machine. It uses `watchdog` if installed, otherwise a local scan shared by all
+submissions of a root.
+"""
+
+TagFilePattern = "*tag_finished"
+
+
+class PollingPolicy:
+    def __init__(self, initial=5, maximum=300, factor=2.0, jitter=0.1, runtime_hints=None, minimum=1, watch=True):
+        """
+        :param float initial: seconds of first interval.
+        :param float maximum: seconds of the longest interval.
+        :param float factor: interval is multiplied by it after each check, 1 for fixed period.
+        :param float jitter: interval is scaled randomly within `1 +/- jitter`, so many submissions do not check at once.
+        :param runtime_hints: expected seconds of tasks, a check is placed right after each of them.
+        :param float minimum: seconds of the shortest interval.
+        :param bool watch: wait for tag files of `LocalContext` by `TagFileWatcher`.
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.minimum = minimum
+        self.watch = watch
+        self.runtime_hints = sorted(float(item) for item in (runtime_hints or []))
+        self.reset()
+
+    @classmethod
+    def from_setting(cls, setting, **kwargs):
+        """
+        :param setting: PollingPolicy; a number for fixed period like former `submission_check_period`;
+            or dict of keyword arguments.
+        """
+        if isinstance(setting, cls):
+            return setting
+        if isinstance(setting, dict):
+            return cls(**{**setting, **kwargs})
+        return cls(**{"initial": setting, "maximum": setting, "factor": 1.0, "jitter": 0.0, "minimum": 0, **kwargs})
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Policy of a flow state: setting `submission_check_period` is seconds between checks,
+        or a dict of `PollingPolicy` arguments; setting `runtime_hints` is expected seconds of a task,
+        or a dict of state -> seconds.
+
+        :param state: FlowState
+        """
+        period = state.get_state_settings("submission_check_period", 5)
+        runtime_hints = state.get_state_settings("runtime_hints", None)
+        if isinstance(runtime_hints, dict):
+            runtime_hints = runtime_hints.get(state.get_state(), None)
+        if runtime_hints is None:
+            return cls.from_setting(period)
+        return cls.from_setting(period, runtime_hints=[runtime_hints])
+
+    def reset(self):
+        self._start = time.monotonic()
+        self._current = self.initial
+
+    def next_interval(self) -> float:
+        """
+        :return: seconds to wait before next check.
+        """
+        interval = min(self._current, self.maximum)
+        self._current = min(self._current * self.factor, self.maximum)
+        elapsed = time.monotonic() - self._start
+        upcoming = [hint - elapsed for hint in self.runtime_hints if hint - elapsed > 0]
+        if upcoming:
+            interval = min(interval, upcoming[0] + self.minimum)
+        if self.jitter:
+            interval *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(interval, self.minimum)
+
+
+class _TagFileMonitor:
+    def __init__(self, root, pattern):
+        """
+        One watchdog observer, or one scanning thread, of a root shared by all `TagFileWatcher` of it.
+        """
+        self.root = root
+        self.pattern = pattern
+        self.watchers = set()
+        self._seen = set()
+        self._observer = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._seen = set(self.root.rglob(self.pattern))
+        if USE_WATCHDOG:
+            monitor = self
+
+            class Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    if not event.is_directory and pathlib.PurePath(getattr(event, "dest_path", "") or event.src_path).match(monitor.pattern):
+                        monitor.notify()
+
+            self._observer = Observer()
+            self._observer.schedule(Handler(), self.root.as_posix(), recursive=True)
+            self._observer.start()
+        else:
+            self._thread = threading.Thread(target=self._scan_loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def scan_interval(self):
+        return min((watcher.scan_interval for watcher in list(self.watchers)), default=TagFileWatcher.ScanInterval)
+
+    def _scan_loop(self):
+        while not self._stop.wait(self.scan_interval()):
+            found = set(self.root.rglob(self.pattern))
+            new = found - self._seen
+            self._seen = found
+            if new:
+                self.notify()
+
+    def notify(self):
+        for watcher in list(self.watchers):
+            watcher._notify()
+
+
+_monitors = {}
+_monitors_lock = threading.Lock()
+
+
+class TagFileWatcher:
+    ScanInterval = 5.0
+
+    def __init__(self, root, pattern=TagFilePattern, scan_interval=ScanInterval):
+        """
+        Watch new tag files under `root`.
+
+        Watchers of the same root share one `watchdog` observer, or without `watchdog` one thread scanning the root
+        every `scan_interval` seconds (the shortest of the watchers), so many waiting submissions cost no more
+        than one. `await_change` waits on an `asyncio.Event` set from that thread, it holds no executor thread.
+
+        :param root: directory to watch recursively, remote root of `LocalContext`.
+        :param str pattern: glob of tag files.
+        :param float scan_interval: seconds between scans when `watchdog` is not installed.
+        """
+        self.root = pathlib.Path(root).absolute()
+        self.pattern = pattern
+        self.scan_interval = scan_interval
+        self._event = threading.Event()
+        self._loop = None
+        self._async_event = None
+        self._monitor = None
+
+    def start(self):
+        key = (self.root, self.pattern)
+        with _monitors_lock:
+            monitor = _monitors.get(key)
+            if monitor is None:
+                monitor = _monitors[key] = _TagFileMonitor(self.root, self.pattern)
+                monitor.watchers.add(self)
+                monitor.start()
+            monitor.watchers.add(self)
+        self._monitor = monitor
+        return self
+
+    def stop(self):
+        if self._monitor is None:
+            return
+        with _monitors_lock:
+            self._monitor.watchers.discard(self)
+            if not self._monitor.watchers:
+                _monitors.pop((self.root, self.pattern), None)
+                self._monitor.stop()
+        self._monitor = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _notify(self):
+        self._event.set()
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._async_event.set)
+            except RuntimeError:  # loop closed
+                pass
+
+    def wait(self, timeout) -> bool:
+        """
+        Block until a new tag file appears or timeout.
+
+        :return: True if a tag file appeared.
+        """
+        appeared = self._event.wait(timeout)
+        self._event.clear()
+        return appeared
+
+    async def await_change(self, timeout) -> bool:
+        """
+        Awaitable `wait`, on the running event loop without blocking a thread.
+
+        :return: True if a tag file appeared.
+        """
+        if self._loop is None:
+            self._async_event = asyncio.Event()
+            self._loop = asyncio.get_running_loop()
+        if not self._event.is_set():
+            try:
+                await asyncio.wait_for(self._async_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._async_event.clear()
+        return self.wait(0)
+
+
+def make_watcher(machine, policy: PollingPolicy):
+    """
+    :return: started TagFileWatcher for `LocalContext` if policy watches, else None.
+    """
+    context = getattr(machine, "context", None)
+    if not policy.watch or context is None or type(context).__name__ != "LocalContext":
+        return None
+    return TagFileWatcher(context.remote_root).start()
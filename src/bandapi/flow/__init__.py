@@ -6,6 +6,7 @@
 # ALL RIGHTS ARE RESERVED UNLESS STATED.
 # ====================================== #
 import abc
+import asyncio
 
 import dpdispatcher
 from bandapi.flow.state import FlowStateControl
@@ -42,14 +43,12 @@ class Flow():
         """
         if kwargs["use_dpdispatcher"]:
             from bandapi.dispatcher.dpdispatcher import Machine, Resources
-            self.machine: dpdispatcher.Machine = Machine.load_from_dict(
-                {**Default_Machine, **kwargs["machine"]}
-            )
+            self.machine_dict = {**Default_Machine, **kwargs["machine"]}
+            self.machine: dpdispatcher.Machine = Machine.load_from_dict(self.machine_dict)
 
             kwargs.pop("machine", None)
-            self.resource: dpdispatcher.Resources = Resources.load_from_dict(
-                {**Default_Resource, **kwargs["resource"]}
-            )
+            self.resource_dict = {**Default_Resource, **kwargs["resource"]}
+            self.resource: dpdispatcher.Resources = Resources.load_from_dict(self.resource_dict)
             kwargs.pop("resource", None)
 
         else:
@@ -136,6 +135,77 @@ class Flow():
                 logger.info(f"Submission break condition. [state]: {thisstate}.")
                 break
 
+    async def arun_dispatch(self, executor=None):
+        """
+        Awaitable `run_dispatch`. Subclass should override it to wait without blocking a thread,
+        by default `run_dispatch` runs in `executor`.
+
+        :return:
+        """
+        await asyncio.get_running_loop().run_in_executor(executor, self.run_dispatch)
+
+    async def _asubmit_once(self, executor=None):
+        loop = asyncio.get_running_loop()
+        thisstate = self.flow_state_controler.flow_list[self.flow_state_controler.flow_list_flag]
+        logger.info(f"Working submit on [state]: {thisstate}, [task]: {self.flow_state_controler.task_content}")
+        await loop.run_in_executor(executor, self.prepare)
+        await loop.run_in_executor(executor, self.gather_submission)
+        await self.arun_dispatch(executor=executor)
+        await loop.run_in_executor(executor, self.run_end)
+        logger.info(f"Submission done of [state]: {thisstate}.")
+
+    async def asubmit(self, always_loop=False, executor=None):
+        """
+        Awaitable `submit`. File preparing and post-processing run in `executor`,
+        and dispatching is awaited by `arun_dispatch`, so many flows can be submitted in one event loop,
+        see `submit_flows`.
+
+        :param always_loop:
+        :param executor: concurrent.futures.Executor, default executor of event loop if None.
+        :return:
+        """
+        await self._asubmit_once(executor=executor)
+        while self.submit_loop_condition or always_loop:
+            await self._asubmit_once(executor=executor)
+            if self.submit_break_condition:
+                logger.info(f"Submission break condition. [state]: {self.flow_state_controler.flow_list[self.flow_state_controler.flow_list_flag]}.")
+                break
+
+    def pipeline(self, max_concurrent=None, dag=None):
+        """
+        Scheduler of this flow with (material, state) nodes instead of state-wide barriers, see `bandapi.flow.dag`.
+
+        :param int max_concurrent: number of nodes running at the same time, None for all.
+        :param FlowDAG dag: default to a chain of `task_flow_list` for each material.
+        :return: DAGScheduler
+        """
+        from bandapi.flow.dag import DAGScheduler
+        return DAGScheduler(
+            flow_state_class=self.flow_state_controler._flow_state_class,
+            flow_list=self.flow_state_controler.flow_list,
+            task_content=self.flow_state_controler.task_content,
+            machine=self.machine_dict,
+            resource=self.resource_dict,
+            task_setup=self.flow_state_controler.flow_settings,
+            max_concurrent=max_concurrent,
+            dag=dag
+        )
+
+    def submit_pipeline(self, max_concurrent=None, executor=None):
+        """
+        Submit with per-material pipelining: the next state of a material starts as soon as its own previous state
+        is finished, instead of waiting for all materials like `submit`.
+
+        :return: dict of FlowNode -> status.
+        """
+        return self.pipeline(max_concurrent=max_concurrent).run(executor=executor)
+
+    async def asubmit_pipeline(self, max_concurrent=None, executor=None):
+        """
+        Awaitable `submit_pipeline`.
+        """
+        return await self.pipeline(max_concurrent=max_concurrent).arun(executor=executor)
+
     @property
     def submit_loop_condition(self):
         """
@@ -151,3 +221,45 @@ class Flow():
         :return:
         """
         return self.flow_state_controler.submit_break_condition
+
+
+async def submit_flows(flows, max_concurrent=None, executor=None, return_exceptions=True, **kwargs):
+    """
+    Submit many flows concurrently in the running event loop.
+
+    :param flows: iterable of Flow, or of callables returning Flow which are created in `executor` when their turn comes.
+    :param int max_concurrent: number of flows submitting at the same time, None for all.
+    :param executor: concurrent.futures.Executor for blocking work of flows.
+    :param bool return_exceptions: exception of one flow is returned in its place instead of cancelling others.
+    :param kwargs: passed to `Flow.asubmit`.
+    :return: list of results (None or exception) in order of flows.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent) if max_concurrent else None
+
+    async def run(flow):
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            if not isinstance(flow, Flow):
+                flow = await asyncio.get_running_loop().run_in_executor(executor, flow)
+            await flow.asubmit(executor=executor, **kwargs)
+        except Exception as e:
+            logger.error(f"Flow {flow} failed: {e!r}")
+            raise
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    return await asyncio.gather(*[run(flow) for flow in flows], return_exceptions=return_exceptions)
+
+
+def run_flows(flows, max_concurrent=None, **kwargs):
+    """
+    Blocking entry of `submit_flows`.
+
+    Usage:
+    ```
+    run_flows([functools.partial(AbacusFlowFromMatProj, task_content=[mp_id], ...) for mp_id in taskid], max_concurrent=200)
+    ```
+    """
+    return asyncio.run(submit_flows(flows, max_concurrent=max_concurrent, **kwargs))
@@ -13,20 +13,31 @@ default_settings = {
     "kpathscope": 20,
     "nstep": 20,
     "nbands": None,
-    "kpointfix": False
+    "kpointfix": False,
+    "symmetry_mode": None,
+    "symprec": 1e-5,
 }
 
+import glob
 import pathlib
 
 import ase.symbols
 from ase.atoms import Atoms
 from bandapi.flow.abacus import default_settings
-from bandapi.flow.abacus.utils import write_stur,write_abacus_input,write_abacus_kpt
+from bandapi.flow.abacus.utils import SharedPseudoDir, write_stur,write_abacus_input,write_abacus_kpt,prase_atoms2strudict
+from bandapi.io.abacus.out import check_abacus_log
+from bandapi.io.abacus.potential import AbacusPotential
+from bandapi.io.abacus.task import render_abacus_task
+from bandapi.flow.cache import ResultCache, task_cache_key
+from bandapi.flow.flowlog import Logger
 from bandapi.flow.state import FlowState
 
+logger = Logger(__name__)
+
 
 class AbacusState(FlowState):
     _state = "Undefined"
+    _result_patterns = ["OUT.ABACUS/running_*.log"]
 
     def __init__(self, task_content, flow_work_root, **kwargs):
         super(AbacusState, self).__init__(task_content=task_content, flow_work_root=flow_work_root, **kwargs)
@@ -38,7 +49,9 @@ class AbacusState(FlowState):
     def _write_stur(self, subname: pathlib.Path, atoms: Atoms, potential_name: str, flowrootdir=None):
         if flowrootdir is None:
             flowrootdir = self.flow_work_root
-        write_stur(atoms, flowrootdir / self._state / subname, potential_name)
+        write_stur(atoms, flowrootdir / self._state / subname, potential_name,
+                   pseudo_root=flowrootdir / SharedPseudoDir if self.use_shared_pseudo() else None,
+                   pseudo_store=self.get_state_settings("pseudo_store", None))
 
     def _write_input(self, subname: pathlib.Path, atoms: Atoms, flowrootdir=None):
         if flowrootdir is None:
@@ -54,6 +67,146 @@ class AbacusState(FlowState):
         write_abacus_kpt(task_root=(flowrootdir / self._state / subname).as_posix(),
                          kpt_para_dict=kpt_args)
 
+    def render_task(self, atoms: Atoms):
+        """
+        Render INPUT, KPT and STRU of atoms in memory, see `bandapi.io.abacus.task`.
+
+        :param ase.Atoms atoms:
+        :return: dict of file name -> bytes
+        """
+        return render_abacus_task(
+            input_para_dict=self.get_input_args(atoms=atoms),
+            kpt_para_dict=self.get_kpt_args(atoms=atoms),
+            stru_para_dict=prase_atoms2strudict(atoms, self.get_state_settings("potential_name")),
+        )
+
+    def use_shared_pseudo(self):
+        """
+        With setting `share_pseudo`, pseudopotential files are linked once into `flow_work_root/pseudo/`
+        and uploaded as common files of submission, instead of one copy per task.
+        `dispatch_work_base` should be `flow_work_root` for this.
+        """
+        return bool(self.get_state_settings("share_pseudo", False))
+
+    def get_pseudo_dir(self):
+        """
+        `pseudo_dir` of INPUT, relative to task directory `state/subdir/`.
+        """
+        return f"../../{SharedPseudoDir}/" if self.use_shared_pseudo() else "./"
+
+    def get_pseudo_file_list(self, atoms: Atoms):
+        """
+        :return: names of pseudopotential files of atoms, in order of atom types.
+        """
+        numbers = list(dict.fromkeys(atoms.get_atomic_numbers().tolist()))
+        return [potfile.name for potfile in AbacusPotential(pot_name=self.get_state_settings("potential_name")).paths(numbers)]
+
+    def get_task_pseudo_files(self, atoms: Atoms):
+        """
+        Pseudopotential files to upload with each task, none if they are shared.
+        """
+        return [] if self.use_shared_pseudo() else self.get_pseudo_file_list(atoms)
+
+    def get_forward_common_files(self):
+        """
+        Shared pseudopotential files of all materials, relative to `flow_work_root`.
+        """
+        if not self.use_shared_pseudo():
+            return []
+        names = set()
+        for atoms in self.task_content.values():
+            names.update(self.get_pseudo_file_list(atoms))
+        return [f"{SharedPseudoDir}/{name}" for name in sorted(names)]
+
+    def get_result_cache(self):
+        """
+        Result cache of setting `result_cache` (directory), bounded by `result_cache_max_bytes`
+        and `result_cache_max_entries`, see `bandapi.flow.cache`.
+
+        :return: ResultCache or None if not set.
+        """
+        cache_root = self.get_state_settings("result_cache", None)
+        if cache_root is None:
+            return None
+        if getattr(self, "_result_cache", None) is None:
+            self._result_cache = ResultCache(
+                cache_root,
+                max_bytes=self.get_state_settings("result_cache_max_bytes", None),
+                max_entries=self.get_state_settings("result_cache_max_entries", None),
+            )
+        return self._result_cache
+
+    def get_cache_files(self, subdir, atoms):
+        """
+        Input files of task which key the result cache, they are upload files of task.
+
+        :return: dict of name -> path
+        """
+        task_root = self.flow_work_root / self._state / subdir
+        files = {}
+        for name in self.bake_upload_files(atoms):
+            if name.endswith("/"):
+                for item in glob.glob((task_root / name / "*").as_posix()):
+                    files[pathlib.Path(item).relative_to(task_root).as_posix()] = item
+            else:
+                files[name] = task_root / name
+        if self.use_shared_pseudo():
+            for name in self.get_pseudo_file_list(atoms):
+                files[name] = self.flow_work_root / SharedPseudoDir / name
+        return files
+
+    def use_cached_result(self, subdir, atoms, command):
+        """
+        Copy cached `OUT.ABACUS` of the same task into task directory if it is cached,
+        otherwise remember the key to store the result in `store_results`.
+
+        :return: True if cached result is used and no task is needed.
+        """
+        cache = self.get_result_cache()
+        if cache is None:
+            return False
+        key = task_cache_key(self.get_cache_files(subdir, atoms), command=command)
+        if cache.restore(key, self.flow_work_root / self._state / subdir / "OUT.ABACUS"):
+            logger.info(f"Use cached result of [state]: {self._state}, [task]: {subdir}, [key]: {key}.")
+            return True
+        if not hasattr(self, "_cache_pending"):
+            self._cache_pending = {}
+        self._cache_pending[subdir] = key
+        return False
+
+    def pending_subdirs(self):
+        """
+        Materials not finished before, according to `check_exist_status` of `flow_begin_test`.
+        """
+        if not hasattr(self, "check_exist_status"):
+            return []
+        return [subdir for subdir in self.task_content if not self.check_exist_status.get(subdir, None)]
+
+    @staticmethod
+    def log_finished(task_root, log_pattern="running_*.log", converged=None, not_converged=None):
+        """
+        :return: True if a log in `task_root/OUT.ABACUS` finished normally, see `check_abacus_log`.
+        """
+        logs = glob.glob((pathlib.Path(task_root) / "OUT.ABACUS" / log_pattern).as_posix())
+        return any(check_abacus_log(item, converged=converged, not_converged=not_converged) for item in logs)
+
+    @classmethod
+    def task_finished(cls, task_root):
+        """
+        Whether result of task is complete, so it can be cached and the next state can use it.
+        Default to a normally finished running log, states check their own outputs.
+        """
+        return cls.log_finished(task_root)
+
+    def store_results(self):
+        cache = self.get_result_cache()
+        if cache is None:
+            return
+        for subdir, key in getattr(self, "_cache_pending", {}).items():
+            if self.result_finished(subdir):
+                cache.put(key, self.flow_work_root / self._state / subdir / "OUT.ABACUS", meta={"state": self._state, "task": subdir})
+        self._cache_pending = {}
+
     def get_input_args(self, atoms):
         """
         Subclass of AbacusState must implement this.
@@ -6,6 +6,7 @@
 # ALL RIGHTS ARE RESERVED UNLESS STATED.
 # ====================================== #
 import glob
+import json
 import pathlib
 import re
 import shutil
@@ -16,10 +17,12 @@ import ase.symbols
 import numpy as np
 from bandapi.dispatcher.dpdispatcher import Task
 from bandapi.flow.abacus import default_settings
+from bandapi.flow.abacus.symmetry import SymmetryModes, reduce_kpt_args, symmetrize_atoms
+from bandapi.flow.flowlog import Logger
 from bandapi.flow.state import FlowStateControl
 from bandapi.flow.task_content import NamedAtomsContentDict
-from bandapi.io.abacus.out import read_stru
-from bandapi.io.abacus.potential import AbacusPotential
+from bandapi.io.abacus.chg import PackedSuffix, UnpackScript, pack_abacus_chg
+from bandapi.io.abacus.out import RelaxConvergedPattern, ScfConvergedPattern, ScfNotConvergedPattern, read_stru
 
 """
 Abacus has calculation state as following:
@@ -33,6 +36,9 @@ Abacus has calculation state as following:
 """
 from bandapi.flow.abacus import AbacusState
 
+logger = Logger(__name__)
+
+
 class AbacusScfState(AbacusState):
     _state = "scf"
 
@@ -42,32 +48,81 @@ class AbacusScfState(AbacusState):
         :param NamedAtomsContentDict task_content:
         :return:
         """
+        kpoint_reduction = {}
         for subdir, atoms in task_content.items():
             if hasattr(self, "check_exist_status"):
                 self.check_exist_status: dict
                 if not self.check_exist_status.get(subdir, None):
                     atoms: ase.Atoms
+                    atoms = self.symmetrize(atoms)
                     self._write_stur(subname=subdir, atoms=atoms, potential_name=self.get_state_settings("potential_name"))
                     self._write_kpt(subname=subdir, atoms=atoms)
                     self._write_input(subname=subdir, atoms=atoms)
+                    if self.get_symmetry_mode() is not None:
+                        kpoint_reduction[subdir] = self.report_kpoint_reduction(subdir, atoms)
+        if kpoint_reduction:
+            with open(self.flow_work_root / self._state / "kpoint_reduction.json", "w") as f:
+                json.dump(kpoint_reduction, f, indent=2)
+
+    def get_symmetry_mode(self):
+        """
+        Setting `symmetry_mode`, see `bandapi.flow.abacus.symmetry`.
+        """
+        mode = self.get_state_settings("symmetry_mode", default_settings["symmetry_mode"])
+        if mode not in SymmetryModes:
+            raise ValueError(f"Unknown symmetry_mode {mode}, it should be one of {SymmetryModes}.")
+        return mode
+
+    def get_symmetry_flag(self):
+        """
+        `symmetry` of INPUT, 1 for both symmetry modes: irreducible k-points need symmetrized charge density.
+        """
+        return 0 if self.get_symmetry_mode() is None else 1
+
+    def symmetrize(self, atoms):
+        if self.get_symmetry_mode() is None:
+            return atoms
+        return symmetrize_atoms(atoms, symprec=self.get_state_settings("symprec", default_settings["symprec"]))
+
+    def report_kpoint_reduction(self, subdir, atoms):
+        """
+        Log space group and the number of irreducible k-points against the full mesh.
+        For `symmetry_mode` "abacus" it is the reduction ABACUS is expected to find.
+
+        :return: dict of spacegroup, number_of_full and number_of_irreducible.
+        """
+        _, reduction = reduce_kpt_args(atoms, self.get_kpt_mesh_args(atoms),
+                                       symprec=self.get_state_settings("symprec", default_settings["symprec"]))
+        logger.info(f"[state]: {self._state}, [task]: {subdir}, space group {reduction.spacegroup}, "
+                    f"k-points {reduction.number_of_full} -> {reduction.number_of_irreducible} "
+                    f"({reduction.number_of_full / reduction.number_of_irreducible:.1f}x).")
+        return reduction._asdict()
 
     def prepare(self, task_content: NamedAtomsContentDict, task_settings):
         task_list = []
-        for idx, item in enumerate(task_content.keys()):
-            for idx, item in enumerate(task_content):
-                if hasattr(self, "check_exist_status"):
-                    self.check_exist_status: dict
-                    if not self.check_exist_status.get(item, None):
-                        task_list.append(
-                            Task(command=task_settings["remote_command"],
-                                 task_work_path=f"{self._state}/{item}/",
-                                 forward_files=[*self.bake_upload_files(task_content[item])],
-                                 backward_files=["OUT.ABACUS"]
-                                 ))
-                    else:
-                        pass
+        for item, atoms in task_content.items():
+            if hasattr(self, "check_exist_status"):
+                self.check_exist_status: dict
+                if not self.check_exist_status.get(item, None):
+                    if self.use_cached_result(item, atoms, task_settings["remote_command"]):
+                        continue
+                    task_list.append(
+                        Task(command=task_settings["remote_command"],
+                             task_work_path=f"{self._state}/{item}/",
+                             forward_files=[*self.bake_upload_files(atoms)],
+                             backward_files=["OUT.ABACUS"]
+                             ))
+                else:
+                    pass
         return task_list
 
+    @classmethod
+    def task_finished(cls, task_root):
+        """
+        SCF finished and converged.
+        """
+        return cls.log_finished(task_root, "running_scf*.log", converged=ScfConvergedPattern, not_converged=ScfNotConvergedPattern)
+
     def run_end(self, next_state: str):
         """
         Define if the next_state is able to run, and do necessary work.
@@ -92,11 +147,11 @@ class AbacusScfState(AbacusState):
         atoms_counter = Counter(atoms.get_atomic_numbers())
         atom_type_list = list(ase.symbols.chemical_symbols[item] for item in list(atoms_counter.keys()))
         return {
-            "pseudo_dir": "./",
+            "pseudo_dir": self.get_pseudo_dir(),
             "calculation": "scf",
             "ntype": len(atom_type_list),
             "basis_type": "pw",
-            "symmetry": 0,
+            "symmetry": self.get_symmetry_flag(),
             "ecutwfc": self.get_state_settings("ecutwfc", default_settings["ecutwfc"]),
             "dr2": self.get_state_settings("dr2", default_settings["dr2"]),
         }
@@ -104,6 +159,19 @@ class AbacusScfState(AbacusState):
     def get_kpt_args(self, atoms):
         """
         Implemented kpt_args for `scf` state.
+        With `symmetry_mode` "kpoints", the mesh is replaced by its irreducible k-points.
+
+        :param ase.Atoms atoms:
+        :return:
+        """
+        kpt_args = self.get_kpt_mesh_args(atoms)
+        if self.get_symmetry_mode() == "kpoints":
+            kpt_args, _ = reduce_kpt_args(atoms, kpt_args, symprec=self.get_state_settings("symprec", default_settings["symprec"]))
+        return kpt_args
+
+    def get_kpt_mesh_args(self, atoms):
+        """
+        Automatic k-point mesh of `scf` state.
 
         :param ase.Atoms atoms:
         :return:
@@ -137,18 +205,20 @@ class AbacusScfState(AbacusState):
         :param ase.Atoms atoms:
         :return:
         """
-        pseudo_file_list = []
-        atoms_counter = Counter(atoms.get_atomic_numbers())
-        atom_type_list = list(ase.symbols.chemical_symbols[item] for item in list(atoms_counter.keys()))
-        for num in atom_type_list:
-            potfile: pathlib.Path = AbacusPotential(pot_name=self.get_state_settings("potential_name"))[num]
-            pseudo_file_list.append(potfile.name)
-        return ["INPUT", "STRU", "KPT", *pseudo_file_list]
+        return ["INPUT", "STRU", "KPT", *self.get_task_pseudo_files(atoms)]
 
 
 class AbacusRelaxState(AbacusScfState, AbacusState):
     _state = "relax"
 
+    @classmethod
+    def task_finished(cls, task_root):
+        """
+        Relaxation finished and converged, with the final structure.
+        """
+        return (cls.log_finished(task_root, "running_relax*.log", converged=RelaxConvergedPattern)
+                and (pathlib.Path(task_root) / "OUT.ABACUS" / "STRU_ION_D").exists())
+
     def get_input_args(self, atoms):
         """
         Implemented input_args for `scf` state.
@@ -159,11 +229,11 @@ class AbacusRelaxState(AbacusScfState, AbacusState):
         atoms_counter = Counter(atoms.get_atomic_numbers())
         atom_type_list = list(ase.symbols.chemical_symbols[item] for item in list(atoms_counter.keys()))
         return {
-            "pseudo_dir": "./",
+            "pseudo_dir": self.get_pseudo_dir(),
             "calculation": "relax",
             "ntype": len(atom_type_list),
             "basis_type": "pw",
-            "symmetry": 0,
+            "symmetry": self.get_symmetry_flag(),
             "ecutwfc": self.get_state_settings("ecutwfc", default_settings["ecutwfc"]),
             "dr2": self.get_state_settings("dr2", default_settings["dr2"]),
             "nstep": self.get_state_settings("nstep", default_settings["nstep"]),
@@ -180,7 +250,7 @@ class AbacusRelaxState(AbacusScfState, AbacusState):
             pass
         elif next_state is not None:
             self._submit_loop_condition = 1
-            for subdir, _ in self.task_content.items():
+            for subdir in list(self.task_content):  # names only, structures are replaced
                 self.task_content[subdir] = read_stru(self.flow_work_root / self._state / subdir / "OUT.ABACUS" / "STRU_ION_D")
             return True
         else:
@@ -190,6 +260,14 @@ class AbacusRelaxState(AbacusScfState, AbacusState):
 class AbacusCellRelaxState(AbacusScfState, AbacusState):
     _state = "cell-relax"
 
+    @classmethod
+    def task_finished(cls, task_root):
+        """
+        Cell relaxation finished and converged, with the final structure.
+        """
+        return (cls.log_finished(task_root, "running_cell-relax*.log", converged=RelaxConvergedPattern)
+                and (pathlib.Path(task_root) / "OUT.ABACUS" / "STRU_ION_D").exists())
+
     def get_input_args(self, atoms):
         """
         Implemented input_args for `scf` state.
@@ -200,11 +278,11 @@ class AbacusCellRelaxState(AbacusScfState, AbacusState):
         atoms_counter = Counter(atoms.get_atomic_numbers())
         atom_type_list = list(ase.symbols.chemical_symbols[item] for item in list(atoms_counter.keys()))
         return {
-            "pseudo_dir": "./",
+            "pseudo_dir": self.get_pseudo_dir(),
             "calculation": "cell-relax",
             "ntype": len(atom_type_list),
             "basis_type": "pw",
-            "symmetry": 0,
+            "symmetry": self.get_symmetry_flag(),
             "ecutwfc": self.get_state_settings("ecutwfc", default_settings["ecutwfc"]),
             "dr2": self.get_state_settings("dr2", default_settings["dr2"]),
             "nstep": self.get_state_settings("nstep", default_settings["nstep"]),
@@ -221,7 +299,7 @@ class AbacusCellRelaxState(AbacusScfState, AbacusState):
             pass
         elif next_state == "scf" or "relax" or "scf-charge":
             self._submit_loop_condition = 1
-            for subdir, _ in self.task_content.items():
+            for subdir in list(self.task_content):  # names only, structures are replaced
                 self.task_content[subdir] = read_stru(self.flow_work_root / self._state / subdir / "OUT.ABACUS" / "STRU_ION_D")
             return True
         else:
@@ -230,16 +308,21 @@ class AbacusCellRelaxState(AbacusScfState, AbacusState):
 
 class AbacusScfStateWithCharge(AbacusScfState, AbacusState):
     _state = "scf-charge"
+    _result_patterns = ["OUT.ABACUS/running_scf*.log", "OUT.ABACUS/SPIN*_CHG"]
 
     def flow_begin_test(self):
-        check_status = {}
-        for subdir, atoms in self.task_content.items():
-            atoms: ase.Atoms
-            CHGfile = glob.glob((self.flow_work_root / "scf-charge" / subdir / "OUT.ABACUS" / "SPIN*_CHG").as_posix())
-            for item in CHGfile:
-                if item:
-                    check_status[subdir] = True
-        self.check_exist_status = check_status
+        """
+        Materials with converged charge density are finished, looked up in setting `state_db` if set.
+        """
+        self.check_exist_status = {subdir: True for subdir in self.find_finished(list(self.task_content))}
+
+    @classmethod
+    def task_finished(cls, task_root):
+        """
+        SCF converged and charge density is written.
+        """
+        return (super(AbacusScfStateWithCharge, cls).task_finished(task_root)
+                and len(glob.glob((pathlib.Path(task_root) / "OUT.ABACUS" / "SPIN*_CHG").as_posix())) > 0)
 
     def get_input_args(self, atoms):
         """
@@ -251,11 +334,11 @@ class AbacusScfStateWithCharge(AbacusScfState, AbacusState):
         atoms_counter = Counter(atoms.get_atomic_numbers())
         atom_type_list = list(ase.symbols.chemical_symbols[item] for item in list(atoms_counter.keys()))
         return {
-            "pseudo_dir": "./",
+            "pseudo_dir": self.get_pseudo_dir(),
             "calculation": "scf",
             "ntype": len(atom_type_list),
             "basis_type": "pw",
-            "symmetry": 0,
+            "symmetry": self.get_symmetry_flag(),
             "ecutwfc": self.get_state_settings("ecutwfc", default_settings["ecutwfc"]),
             "dr2": self.get_state_settings("dr2", default_settings["dr2"]),
             "out_charge": 1
@@ -272,7 +355,7 @@ class AbacusScfStateWithCharge(AbacusScfState, AbacusState):
             pass
         elif next_state == "nscf-band":
             self._submit_loop_condition = 1
-            for subdir, _ in self.task_content.items():
+            for subdir in list(self.task_content):  # names only, structures are replaced
                 self.task_content[subdir] = read_stru(self.flow_work_root / self._state / subdir / "STRU")
             return True
         else:
@@ -281,23 +364,25 @@ class AbacusScfStateWithCharge(AbacusScfState, AbacusState):
 
 class AbacusBandState(AbacusState):
     _state = "nscf-band"
+    _result_patterns = ["OUT.ABACUS/running_nscf*.log", "OUT.ABACUS/BANDS_*.dat"]
 
     def flow_begin_test(self):
-        check_status = {}
-        for subdir, atoms in self.task_content.items():
-            atoms: ase.Atoms
-            CHGfile = glob.glob((self.flow_work_root / self._state / subdir / "OUT.ABACUS" / "running_nscf*").as_posix())
-            for item in CHGfile:
-                if item:
-                    check_status[subdir] = True
-        self.check_exist_status = check_status
-        for subdir, atoms in self.task_content.items():
+        """
+        Materials with finished nscf are finished, looked up in setting `state_db` if set.
+        Charge density of `scf-charge` is copied for others, or packed with `UnpackScript` by setting `pack_charge`.
+        """
+        self.check_exist_status = {subdir: True for subdir in self.find_finished(list(self.task_content))}
+        for subdir in self.task_content:
             if not self.check_exist_status.get(subdir,None):
-                atoms: ase.Atoms
                 CHGfile = glob.glob((self.flow_work_root / "scf-charge" / subdir / "OUT.ABACUS" / "SPIN*_CHG").as_posix())
                 (self.flow_work_root / self._state / subdir / "OUT.ABACUS").mkdir(parents=True, exist_ok=True)
+                if self.get_state_settings("pack_charge", False):
+                    shutil.copy(UnpackScript, self.flow_work_root / self._state / subdir / UnpackScript.name)
                 for item in CHGfile:
-                    shutil.copy(item, self.flow_work_root / self._state / subdir / "OUT.ABACUS/")
+                    if self.get_state_settings("pack_charge", False):
+                        pack_abacus_chg(item, self.flow_work_root / self._state / subdir / "OUT.ABACUS" / (pathlib.Path(item).name + PackedSuffix))
+                    else:
+                        shutil.copy(item, self.flow_work_root / self._state / subdir / "OUT.ABACUS/")
 
     def bakeup(self, task_content: NamedAtomsContentDict):
         """
@@ -309,27 +394,46 @@ class AbacusBandState(AbacusState):
             if hasattr(self, "check_exist_status"):
                 self.check_exist_status: dict
                 if not self.check_exist_status.get(subdir, None):
-                    for subdir, atoms in task_content.items():
-                        self._write_stur(subname=subdir, atoms=atoms, potential_name=self.get_state_settings("potential_name"))
-                        self._write_kpt(subname=subdir, atoms=atoms)
-                        self._write_input(subname=subdir, atoms=atoms)
+                    self._write_stur(subname=subdir, atoms=atoms, potential_name=self.get_state_settings("potential_name"))
+                    self._write_kpt(subname=subdir, atoms=atoms)
+                    self._write_input(subname=subdir, atoms=atoms)
 
     def prepare(self, task_content: NamedAtomsContentDict, task_settings):
         task_list = []
-        for idx, item in enumerate(task_content.keys()):
-            for idx, item in enumerate(task_content):
-                if hasattr(self, "check_exist_status"):
-                    self.check_exist_status: dict
-                    if not self.check_exist_status.get(item, None):
-                        task_list.append(
-                            Task(command=task_settings["remote_command"],
-                                 task_work_path=f"{self._state}/{item}/",
-                                 forward_files=[*self.bake_upload_files(task_content[item])],
-                                 backward_files=["OUT.ABACUS"]
-                                 )
-                        )
+        for item, atoms in task_content.items():
+            if hasattr(self, "check_exist_status"):
+                self.check_exist_status: dict
+                if not self.check_exist_status.get(item, None):
+                    if self.use_cached_result(item, atoms, self.get_remote_command(task_settings)):
+                        continue
+                    task_list.append(
+                        Task(command=self.get_remote_command(task_settings),
+                             task_work_path=f"{self._state}/{item}/",
+                             forward_files=[*self.bake_upload_files(atoms)],
+                             backward_files=["OUT.ABACUS"]
+                             )
+                    )
         return task_list
 
+    @classmethod
+    def task_finished(cls, task_root):
+        """
+        nscf finished with band energies written.
+        """
+        return (cls.log_finished(task_root, "running_nscf*.log")
+                and len(glob.glob((pathlib.Path(task_root) / "OUT.ABACUS" / "BANDS_*.dat").as_posix())) > 0)
+
+    def get_remote_command(self, task_settings):
+        """
+        With setting `pack_charge`, charge density files are uploaded packed by `pack_abacus_chg`
+        and unpacked by the uploaded `UnpackScript` before ABACUS runs. It needs only a python 3 interpreter
+        on the remote, setting `remote_python` (default "python3") names it.
+        """
+        if self.get_state_settings("pack_charge", False):
+            return (f"{self.get_state_settings('remote_python', 'python3')} {UnpackScript.name} "
+                    f"OUT.ABACUS/SPIN*_CHG{PackedSuffix} && {task_settings['remote_command']}")
+        return task_settings["remote_command"]
+
     def run_end(self, next_state: str):
         """
         Define if the next_state is able to run, and do necessary work.
@@ -354,7 +458,7 @@ class AbacusBandState(AbacusState):
         atoms_counter = Counter(atoms.get_atomic_numbers())
         atom_type_list = list(ase.symbols.chemical_symbols[item] for item in list(atoms_counter.keys()))
         return {
-            "pseudo_dir": "./",
+            "pseudo_dir": self.get_pseudo_dir(),
             "calculation": "nscf",
             "nbands": self.get_state_settings("nbands", default_settings["nbands"]),
             "ntype": len(atom_type_list),
@@ -400,13 +504,10 @@ class AbacusBandState(AbacusState):
         :param ase.Atoms atoms:
         :return:
         """
-        pseudo_file_list = []
-        atoms_counter = Counter(atoms.get_atomic_numbers())
-        atom_type_list = list(ase.symbols.chemical_symbols[item] for item in list(atoms_counter.keys()))
-        for num in atom_type_list:
-            potfile: pathlib.Path = AbacusPotential(pot_name=self.get_state_settings("potential_name"))[num]
-            pseudo_file_list.append(potfile.name)
-        return ["INPUT", "STRU", "KPT", *pseudo_file_list, "OUT.ABACUS/"]
+        files = ["INPUT", "STRU", "KPT", *self.get_task_pseudo_files(atoms), "OUT.ABACUS/"]
+        if self.get_state_settings("pack_charge", False):
+            files.append(UnpackScript.name)
+        return files
 
 
 class AbacusStateControl(FlowStateControl):
@@ -5,6 +5,7 @@
 # @File    : flow.py
 # ALL RIGHTS ARE RESERVED UNLESS STATED.
 # ====================================== #
+from bandapi.dispatcher.polling import PollingPolicy
 from bandapi.flow import Flow
 from bandapi.flow.abacus.calculation_state import AbacusStateControl
 
@@ -43,7 +44,7 @@ class AbacusFlow(Flow):
                         machine=self.machine,
                         resources=self.resource,
                         task_list=self.flow_state_controler._state.task_list,
-                        forward_common_files=[],
+                        forward_common_files=self.flow_state_controler._state.get_forward_common_files(),
                         backward_common_files=[]
                     )
             else:
@@ -51,9 +52,28 @@ class AbacusFlow(Flow):
         else:
             pass
 
+    def get_polling_policy(self):
+        """
+        See `PollingPolicy.from_state`.
+
+        :return: PollingPolicy
+        """
+        return PollingPolicy.from_state(self.flow_state_controler._state)
+
     def run_dispatch(self):
         if self.flow_state_controler._state._need_submission:
             if hasattr(self,"submission"):
-                self.submission.run_submission(period=self.flow_state_controler.get_state_settings("submission_check_period", 5),clean=self.flow_state_controler.get_state_settings("clean",True))
+                self.submission.run_submission(period=self.get_polling_policy(),clean=self.flow_state_controler.get_state_settings("clean",True))
+                self.flow_state_controler._state.submission_hash = self.submission.submission_hash
         else:
             pass
+
+    async def arun_dispatch(self, executor=None):
+        if self.flow_state_controler._state._need_submission:
+            if hasattr(self, "submission"):
+                await self.submission.async_run_submission(
+                    period=self.get_polling_policy(),
+                    clean=self.flow_state_controler.get_state_settings("clean", True),
+                    executor=executor
+                )
+                self.flow_state_controler._state.submission_hash = self.submission.submission_hash
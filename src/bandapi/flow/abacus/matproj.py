@@ -17,7 +17,7 @@ from bandapi.third_part.matproj import MatProjWrapper
 from dpdispatcher import Task
 
 from bandapi.flow.abacus.flow import AbacusFlow
-from bandapi.flow.task_content import NamedAtomsContentDict
+from bandapi.flow.task_content import LazyAtomsContentDict, MatProjSource, NamedAtomsContentDict
 
 
 class AbacusFlowFromMatProj(AbacusFlow):
@@ -28,7 +28,9 @@ class AbacusFlowFromMatProj(AbacusFlow):
             resource,
             task_flow_list,
             task_content,
-            task_setup):
+            task_setup,
+            matproj_settings=None,
+            lazy_content=None):
         """
         Setup an ABACUS workflow from data of material project.
 
@@ -38,8 +40,13 @@ class AbacusFlowFromMatProj(AbacusFlow):
         :param List[str] task_flow_list: str, for abacus flow kinds. Like scf, relax...
         :param Union[List] task_content: for id string of material project.
         :param dict task_setup: settings for task.
+        :param dict matproj_settings: keyword arguments of `MatProjWrapper`, e.g. `{"cache": "structure_cache"}`
+            to reuse structures fetched before, and `"offline": True` to use only them.
+        :param dict lazy_content: keyword arguments of `LazyAtomsContentDict`, e.g. `{"max_cached": 1024}`.
+            If given, structures are fetched on demand in chunks instead of all before the flow starts.
         """
-        self.matprojwrapper = MatProjWrapper(API_KEY=API_KEY)
+        self.lazy_content = lazy_content
+        self.matprojwrapper = MatProjWrapper(API_KEY=API_KEY, **(matproj_settings or {}))
         assert self.matprojwrapper.test_connet()
 
         task_content = self.contentgenerate(task_content)
@@ -52,8 +59,7 @@ class AbacusFlowFromMatProj(AbacusFlow):
         )
 
     def contentgenerate(self, task_content):
-        content = {}
-        for item in task_content:
-            atoms = self.matprojwrapper.get_structure_by_id(item)
-            content[item] = atoms[0]
-        return NamedAtomsContentDict(content)
+        if self.lazy_content is not None:
+            return LazyAtomsContentDict(task_content, MatProjSource(self.matprojwrapper), **self.lazy_content)
+        structures = self.matprojwrapper.get_structures_by_ids(task_content)
+        return NamedAtomsContentDict({item: atoms[0] for item, atoms in structures.items()})
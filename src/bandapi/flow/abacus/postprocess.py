@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : postprocess.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+import glob
+import json
+import pathlib
+import shutil
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from bandapi.flow.flowlog import Logger
+from bandapi.io.abacus.out import LogIndex, read_band_structure
+from bandapi.io.bandstore import BandArchive
+
+logger = Logger(__name__)
+
+"""
+Post-processing of finished `nscf-band` calculations, parsing and plotting of each material
+can be spread over a process pool by `iter_band_data` and `postprocess_band_data`.
+"""
+
+
+def band_gap_summary(bandArray):
+    """
+    Band edges of band energies relative to Fermi level.
+
+    :param np.ndarray bandArray: (nspin, nk, nbands) energies minus Fermi energy.
+    :return: dict of vbm, cbm and band_gap in eV, band_gap is 0 if any band crosses the Fermi level.
+    """
+    occupied = bandArray[bandArray <= 0]
+    empty = bandArray[bandArray > 0]
+    vbm = float(occupied.max()) if occupied.size else None
+    cbm = float(empty.min()) if empty.size else None
+    crossing = ((bandArray <= 0).any(axis=1) & (bandArray > 0).any(axis=1)).any()
+    if vbm is None or cbm is None or crossing:
+        band_gap = 0.0
+    else:
+        band_gap = cbm - vbm
+    return {"vbm": vbm, "cbm": cbm, "band_gap": band_gap}
+
+
+def process_band_data(flow_work_root, subdir, atoms, state="band-data", plot=True, emin=-10, emax=10,
+                      write_band_file=True, return_arrays=False):
+    """
+    Collect nscf and scf outputs of one material into `flow_work_root/state/subdir`, read band structure,
+    write `BAND` and plot.
+
+    :param flow_work_root:
+    :param str subdir: name of material.
+    :param ase.Atoms atoms:
+    :param bool write_band_file: write text `BAND` file.
+    :param bool return_arrays: add `kpoints`, `energies`, `path` and `special_points` to summary.
+    :return: dict of summary.
+    """
+    from ase.dft.kpoints import BandPath
+    from ase.spectrum.band_structure import BandStructure
+
+    flow_work_root = pathlib.Path(flow_work_root)
+    state_dir = flow_work_root / state / subdir
+    nscf_out_dir = flow_work_root / "nscf-band" / subdir / "OUT.ABACUS"
+    nscflogfile = glob.glob((nscf_out_dir / "running_nscf*.log").as_posix())
+    if len(nscflogfile) == 0:
+        raise FileNotFoundError(f"No running_nscf log in {nscf_out_dir}.")
+    scflogfile = glob.glob((flow_work_root / "scf-charge" / subdir / "OUT.ABACUS" / "running_scf*.log").as_posix())
+    (state_dir / "OUT.ABACUS").mkdir(parents=True, exist_ok=True)
+    for item in [*nscflogfile, *glob.glob((nscf_out_dir / "BANDS_*.dat").as_posix()), *scflogfile]:
+        shutil.copy(item, state_dir / "OUT.ABACUS/")
+
+    assert len(nscflogfile) == 1
+    assert len(scflogfile) == 1
+
+    kpathArray, bandArray = read_band_structure(nscf_out_dir, atoms=atoms, outputfile=state_dir / "BAND" if write_band_file else None)
+    ferimiValues = LogIndex(scflogfile[0], build=False).last_fermi_energy()
+    summary = {
+        "id": subdir,
+        "nspin": bandArray.shape[0],
+        "nk": bandArray.shape[1],
+        "nbands": bandArray.shape[2],
+        "fermi_energy": ferimiValues,
+        **band_gap_summary(bandArray - ferimiValues),
+    }
+    if return_arrays:
+        bandpath = atoms.cell.bandpath()
+        summary.update({"kpoints": kpathArray, "energies": bandArray, "path": bandpath.path, "special_points": bandpath.special_points})
+    if plot:
+        bandpath = BandPath(cell=atoms.cell, kpts=kpathArray, path=atoms.cell.bandpath().path, special_points=atoms.cell.bandpath().special_points)
+        bs = BandStructure(bandpath, energies=bandArray - ferimiValues, reference=0)
+        bs.plot(emin=emin, emax=emax, filename=state_dir / f'{subdir}.png')
+        summary["png"] = (state_dir / f'{subdir}.png').as_posix()
+    return summary
+
+
+def _process_band_data_safe(flow_work_root, subdir, atoms, **kwargs):
+    try:
+        return process_band_data(flow_work_root, subdir, atoms, **kwargs)
+    except Exception as e:
+        return {"id": subdir, "error": repr(e), "traceback": traceback.format_exc()}
+
+
+def iter_band_data(flow_work_root, task_content, max_workers=None, **kwargs):
+    """
+    Run `process_band_data` for all materials of task_content over a process pool.
+
+    Errors of one material are caught and returned as `{"id":..., "error":..., "traceback":...}`,
+    they do not abort the others.
+
+    :param flow_work_root:
+    :param task_content: dict-like of name -> ase.Atoms
+    :param int max_workers: number of worker processes. 1 runs in this process, None for all cores.
+    :param kwargs: passed to `process_band_data`.
+    :return: generator of summary dict in order of completion.
+    """
+    if max_workers == 1:
+        for subdir, atoms in task_content.items():
+            yield _process_band_data_safe(flow_work_root, subdir, atoms, **kwargs)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_process_band_data_safe, flow_work_root, subdir, atoms, **kwargs)
+            for subdir, atoms in task_content.items()
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def postprocess_band_data(flow_work_root, task_content, output="band_summary.json", max_workers=None, archive=None, **kwargs):
+    """
+    Post-process all materials by `iter_band_data` and write all summaries into one json file.
+
+    :param output: path of summary file, relative path is under `flow_work_root/band-data`.
+    :param archive: directory of `BandArchive`. If given, band structures are added to it instead of text `BAND` files.
+    :return: dict of name -> summary
+    """
+    output = pathlib.Path(flow_work_root) / kwargs.get("state", "band-data") / output
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if archive is not None:
+        kwargs.update(write_band_file=False, return_arrays=True)
+        archive = BandArchive(archive, mode="a")
+    results = {}
+    for result in iter_band_data(flow_work_root, task_content, max_workers=max_workers, **kwargs):
+        if "error" in result:
+            logger.error(f"Post-processing of {result['id']} failed: {result['error']}")
+        elif archive is not None:
+            archive.add(
+                result["id"], energies=result.pop("energies"), kpoints=result.pop("kpoints"),
+                fermi_energy=result["fermi_energy"], path=result.pop("path"), special_points=result.pop("special_points")
+            )
+        results[result["id"]] = result
+    if archive is not None:
+        archive.close()
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, default=_json_default)
+    return results
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
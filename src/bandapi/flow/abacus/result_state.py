@@ -10,58 +10,43 @@ import glob
 import shutil
 from typing import List
 
-from ase.dft.kpoints import BandPath
-from ase.spectrum.band_structure import BandStructure
 from bandapi.dispatcher.dpdispatcher import Task
 from bandapi.flow.abacus.calculation_state import AbacusBandState
-from bandapi.io.abacus.out import read_fermi_energy_from_log, read_band_in_log
+from bandapi.flow.abacus.postprocess import postprocess_band_data
 
 
 class AbacusBandDataState(AbacusBandState):
     _state = "band-data"
+    _result_patterns = []
+    _gather_materials = True  # one summary and archive of all materials
 
     def __init__(self, task_content, flow_work_root=".", **kwargs):
         super(AbacusBandDataState, self).__init__(task_content=task_content, flow_work_root=flow_work_root, **kwargs)
         self._need_submission = False
 
     def flow_begin_test(self):
-        for subdir, atoms in self.task_content.items():
-            atoms: ase.Atoms
-
-            nscflogfile = glob.glob((self.flow_work_root / "nscf-band" / subdir / "OUT.ABACUS" / "running_nscf*").as_posix())
-            if len(nscflogfile) == 0:
-                raise FileNotFoundError
-            (self.flow_work_root / self._state / subdir / "OUT.ABACUS").mkdir(parents=True, exist_ok=True)
-            for item in nscflogfile:
-                shutil.copy(item, self.flow_work_root / self._state / subdir / "OUT.ABACUS/")
-
-            BANDfile = glob.glob((self.flow_work_root / "nscf-band" / subdir / "OUT.ABACUS" / "BANDS_*.dat").as_posix())
-            (self.flow_work_root / self._state / subdir / "OUT.ABACUS").mkdir(parents=True, exist_ok=True)
-            for item in BANDfile:
-                shutil.copy(item, self.flow_work_root / self._state / subdir / "OUT.ABACUS/")
-            scflogfile = glob.glob((self.flow_work_root / "scf-charge" / subdir / "OUT.ABACUS" / "running_scf*").as_posix())
-            for item in scflogfile:
-                shutil.copy(item, self.flow_work_root / self._state / subdir / "OUT.ABACUS/")
-
-            assert len(nscflogfile) == 1
-            assert len(scflogfile) == 1
-
-            kpathArray, bandArray = read_band_in_log(log_file=nscflogfile[0], atoms=atoms, outputfile=self.flow_work_root / self._state / subdir / "BAND")
-            bandpath = BandPath(cell=atoms.cell, kpts=kpathArray, path=atoms.cell.bandpath().path, special_points=atoms.cell.bandpath().special_points)
-            ferimiValues = read_fermi_energy_from_log(scflogfile[0])[-1]
-            bs = BandStructure(bandpath, energies=bandArray - ferimiValues, reference=0)
-            bs.plot(emin=-10, emax=10, filename=self.flow_work_root / self._state / subdir / f'{subdir}.png')
+        """
+        Post-process all materials, see `postprocess_band_data`.
+        Setting `postprocess_workers` is the number of processes used, default to 1.
+        Setting `band_archive` is the directory of `BandArchive` to store band structures instead of `BAND` files.
+        """
+        self.band_summary = postprocess_band_data(
+            self.flow_work_root, self.task_content,
+            max_workers=self.get_state_settings("postprocess_workers", 1),
+            archive=self.get_state_settings("band_archive", None),
+            state=self._state
+        )
 
     def bakeup(self, task_content):
-        for subdir, atoms in task_content.items():
+        for subdir in task_content:
             STRUfile = glob.glob((self.flow_work_root / "nscf-band" / subdir / "STRU").as_posix())
             for item in STRUfile:
                 shutil.copy(item, self.flow_work_root / self._state / subdir)
-        for subdir, atoms in task_content.items():
+        for subdir in task_content:
             INPUTfile = glob.glob((self.flow_work_root / "nscf-band" / subdir / "INPUT").as_posix())
             for item in INPUTfile:
                 shutil.copy(item, self.flow_work_root / self._state / subdir)
-        for subdir, atoms in task_content.items():
+        for subdir in task_content:
             KPTfile = glob.glob((self.flow_work_root / "nscf-band" / subdir / "KPT").as_posix())
             for item in KPTfile:
                 shutil.copy(item, self.flow_work_root / self._state / subdir)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : symmetry.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+from collections import namedtuple
+
+import numpy as np
+from ase.atoms import Atoms
+
+USE_SPGLIB = False
+try:
+    import spglib
+
+    USE_SPGLIB = True
+except ImportError:
+    pass
+
+"""
+Symmetry of structures for scf-type states, it needs `spglib` (`pip install bandapi[symmetry]`).
+
+Setting `symmetry_mode` of states:
+- None(default): `symmetry 0`, full k-point mesh.
+- "abacus": structure is symmetrized, `symmetry 1` lets ABACUS reduce the mesh.
+- "kpoints": structure is symmetrized, irreducible k-points with weights are written to KPT, `symmetry 1` so ABACUS
+  symmetrizes the charge density over the same group (it is wrong with irreducible k-points otherwise).
+
+Atoms of the same element with different initial magnetic moments are different types for spglib,
+so magnetic cells are never reduced by operations mapping a moment onto a different one.
+Non-collinear moments are not supported.
+"""
+
+SymmetryModes = [None, "abacus", "kpoints"]
+KpointReduction = namedtuple("KpointReduction", ["spacegroup", "number_of_full", "number_of_irreducible"])
+
+
+def _check_spglib():
+    if not USE_SPGLIB:
+        raise ImportError("Please install spglib by `pip install spglib` to use symmetry of structures.")
+
+
+def _spglib_types(atoms: Atoms):
+    """
+    :return: (natoms,) types of atoms, distinct for each pair of element and initial magnetic moment.
+    """
+    numbers = atoms.get_atomic_numbers()
+    magmoms = atoms.get_initial_magnetic_moments()
+    if magmoms.ndim > 1:
+        raise ValueError("Symmetry of non-collinear magnetic structures is not supported.")
+    if not np.any(magmoms):
+        return numbers
+    _, types = np.unique(np.stack([numbers, np.round(magmoms, 4)], axis=-1), axis=0, return_inverse=True)
+    return types.reshape(-1) + 1
+
+
+def _spglib_cell(atoms: Atoms):
+    return (atoms.cell[:], atoms.get_scaled_positions(), _spglib_types(atoms))
+
+
+def get_spacegroup(atoms: Atoms, symprec=1e-5):
+    """
+    :return: international symbol and number of space group, like "Fd-3m (227)".
+    """
+    _check_spglib()
+    return spglib.get_spacegroup(_spglib_cell(atoms), symprec=symprec)
+
+
+def symmetrize_atoms(atoms: Atoms, symprec=1e-5) -> Atoms:
+    """
+    Symmetrize cell and positions to the space group found within `symprec`,
+    so ABACUS finds the same symmetry with its own (tighter) tolerance.
+
+    :return: new symmetrized ase.Atoms, `atoms` is not changed.
+    """
+    _check_spglib()
+    from ase.spacegroup.symmetrize import refine_symmetry
+
+    numbers = atoms.get_atomic_numbers()
+    atoms = atoms.copy()
+    atoms.set_atomic_numbers(_spglib_types(atoms))  # ase finds symmetry from atomic numbers only
+    refine_symmetry(atoms, symprec=symprec, verbose=False)
+    atoms.set_atomic_numbers(numbers)
+    return atoms
+
+
+def irreducible_kpoints(atoms: Atoms, mesh, shift=(0, 0, 0), symprec=1e-5):
+    """
+    Irreducible k-points of a Gamma-centered mesh.
+
+    :param atoms:
+    :param mesh: 3 numbers of k-point mesh.
+    :param shift: 3 numbers of 0 or 1, 1 shifts mesh by half a grid along the axis.
+    :return: (number of k-points of full mesh, (nk, 4) np.ndarray of `kx ky kz weight` in direct coordinates)
+    """
+    _check_spglib()
+    mesh = np.asarray(mesh, dtype=int)
+    shift = np.asarray(shift, dtype=int)
+    mapping, grid = spglib.get_ir_reciprocal_mesh(mesh, _spglib_cell(atoms), is_shift=shift, symprec=symprec)
+    ir_idx, counts = np.unique(mapping, return_counts=True)
+    kpoints = (grid[ir_idx] + shift / 2) / mesh
+    weights = counts / mapping.shape[0]
+    return mapping.shape[0], np.concatenate([kpoints, weights[:, None]], axis=-1)
+
+
+def reduce_kpt_args(atoms: Atoms, kpt_para_dict: dict, symprec=1e-5):
+    """
+    Replace an automatic mesh of kpt_para_dict by its irreducible k-points.
+
+    :param kpt_para_dict: kpt_para_dict of `write_abacus_kpt` with `number_of_kpt` 0.
+    :return: (new kpt_para_dict in `Direct` mode, KpointReduction)
+    """
+    if int(kpt_para_dict["number_of_kpt"]) != 0:
+        raise ValueError("Only automatic k-point mesh can be reduced by symmetry.")
+    content = np.asarray(kpt_para_dict["content"], dtype=int)
+    mesh, shift = content[:3], content[3:6]
+    if kpt_para_dict["mode"] == "MP":  # Monkhorst-Pack mesh is shifted along even axes
+        shift = (shift + (mesh + 1) % 2) % 2
+    nfull, kpoints = irreducible_kpoints(atoms, mesh, shift, symprec=symprec)
+    reduction = KpointReduction(get_spacegroup(atoms, symprec=symprec), nfull, kpoints.shape[0])
+    return {"number_of_kpt": kpoints.shape[0], "mode": "Direct", "content": kpoints}, reduction
@@ -6,8 +6,9 @@
 # ALL RIGHTS ARE RESERVED UNLESS STATED.
 # ====================================== #
 
+import filecmp
+import os
 import pathlib
-import shutil
 from collections import Counter
 
 import ase.data
@@ -18,6 +19,7 @@ from bandapi.io.abacus.input import write_abacus_input
 from bandapi.io.abacus.kpt import write_abacus_kpt
 from bandapi.io.abacus.potential import AbacusPotential
 from bandapi.io.abacus.stru import write_abacus_stru
+from bandapi.io.utils import link_or_copy, store_file
 
 
 def prase_atoms2strudict(atoms: ase.atoms, potential_name="SG15"):
@@ -40,10 +42,7 @@ def prase_atoms2strudict(atoms: ase.atoms, potential_name="SG15"):
     for num in atoms_counter.keys():
         pos_item = atoms.positions[atoms.get_atomic_numbers() == num] / lattice_constant
         pos_list.append(np.concatenate([pos_item, np.ones_like(pos_item)], axis=-1))
-    pseudo_file_list = []
-    for num in atom_type_list:
-        potfile: pathlib.Path = AbacusPotential(pot_name=potential_name)[num]
-        pseudo_file_list.append(potfile.name)
+    pseudo_file_list = [potfile.name for potfile in AbacusPotential(pot_name=potential_name).paths(list(atoms_counter.keys()))]
     stru_para_dict = {
         'atom_type_list': atom_type_list,
         'coordinate_type': coordinate_type,
@@ -60,19 +59,44 @@ def prase_atoms2strudict(atoms: ase.atoms, potential_name="SG15"):
     return stru_para_dict
 
 
-def write_stur(atoms, task_root, potential_name):
+SharedPseudoDir = "pseudo"
+
+
+def write_stur(atoms, task_root, potential_name, pseudo_root=None, pseudo_store=None):
+    """
+    Write STRU of atoms and link its pseudopotential files, see `copy_pseudo_file_list`.
+
+    :param pseudo_root: directory of pseudopotential files, default to `task_root`.
+    :param pseudo_store: directory of content-addressed store of pseudopotential files.
+    """
     stru_para_dict = prase_atoms2strudict(atoms, potential_name)
     task_root: pathlib.Path
     if not task_root.exists():
         task_root.mkdir(parents=True)
     write_abacus_stru(task_root=task_root.as_posix(),
                       stru_para_dict=stru_para_dict)
-    copy_pseudo_file_list(task_root=task_root, atom_type_list=stru_para_dict["atom_type_list"], pot_name=potential_name)
+    copy_pseudo_file_list(task_root=task_root if pseudo_root is None else pseudo_root,
+                          atom_type_list=stru_para_dict["atom_type_list"], pot_name=potential_name, pseudo_store=pseudo_store)
     return stru_para_dict
 
 
-def copy_pseudo_file_list(task_root, atom_type_list, pot_name="SG15"):
+def copy_pseudo_file_list(task_root, atom_type_list, pot_name="SG15", pseudo_store=None):
+    """
+    Hard-link pseudopotential files into task_root, they are copied only if hard link is impossible.
+    With `pseudo_store`, files are linked from the content-addressed store, so links do not change
+    if the potential library is updated.
+    Existing files of the same content are kept.
+    """
+    task_root = pathlib.Path(task_root)
+    task_root.mkdir(parents=True, exist_ok=True)
+    potential = AbacusPotential(pot_name=pot_name)
     for num in atom_type_list:
-        potfile: pathlib.Path = AbacusPotential(pot_name=pot_name)[num]
-        shutil.copy(potfile, task_root)
-
+        potfile: pathlib.Path = potential[num]
+        target = task_root / potfile.name
+        if pseudo_store is not None:
+            potfile = store_file(potfile, pseudo_store, sha=potential.sha256(num))
+        if target.exists():
+            if os.path.samefile(target, potfile) or filecmp.cmp(target, potfile, shallow=False):
+                continue
+            target.unlink()
+        link_or_copy(potfile, target)
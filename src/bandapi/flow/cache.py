@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : cache.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import time
+import uuid
+from typing import Mapping
+
+from bandapi.io.utils import file_sha256
+
+"""
+Content-addressed cache of calculation results shared by campaigns.
+
+A task is keyed by `task_cache_key` of its input files (INPUT, KPT, STRU, pseudopotentials, charge density, ...)
+and the command. Results are stored as `root/objects/<key[:2]>/<key>/` with a `meta.json`,
+the modification time of `meta.json` is the last access time used by LRU eviction.
+Results are copied into and out of the cache, never hard-linked: a rerun in a task directory rewrites its files in place,
+which would corrupt a shared entry.
+"""
+
+
+def task_cache_key(files: Mapping[str, os.PathLike], command: str = "") -> str:
+    """
+    Canonical key of a task, independent of the order of files and of the directory of task.
+
+    :param files: dict of name (relative to task directory) -> path of file.
+    :param str command: command to run the task.
+    :return: hex digest.
+    """
+    sha = hashlib.sha256()
+    for name in sorted(files):
+        sha.update(name.encode())
+        sha.update(b"\0")
+        sha.update(file_sha256(files[name]).encode())
+        sha.update(b"\0")
+    sha.update(command.encode())
+    return sha.hexdigest()
+
+
+def _tree_size(path: pathlib.Path):
+    return sum(item.stat().st_size for item in path.rglob("*") if item.is_file())
+
+
+class ResultCache:
+    MetaFile = "meta.json"
+
+    def __init__(self, root, max_bytes=None, max_entries=None):
+        """
+        Content-addressed store of result directories with LRU eviction.
+
+        Usage:
+        ```
+        cache = ResultCache("~/.cache/bandapi", max_bytes=100 * 1024 ** 3)
+        key = task_cache_key({"INPUT": "scf/mp-149/INPUT", ...}, command="mpirun ABACUS.mpi")
+        if not cache.restore(key, "scf/mp-149/OUT.ABACUS"):
+            ...  # run the task
+            cache.put(key, "scf/mp-149/OUT.ABACUS")
+        ```
+
+        :param root: directory of cache.
+        :param int max_bytes: total size of cached results, the least recently used are evicted above it.
+        :param int max_entries: number of cached results.
+        """
+        self.root = pathlib.Path(root).expanduser().absolute()
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        (self.root / "objects").mkdir(parents=True, exist_ok=True)
+        (self.root / "tmp").mkdir(parents=True, exist_ok=True)
+
+    def _entry(self, key) -> pathlib.Path:
+        return self.root / "objects" / key[:2] / key
+
+    def __contains__(self, key):
+        return (self._entry(key) / self.MetaFile).exists()
+
+    def get(self, key):
+        """
+        :return: path of cached result directory, or None if missing. Access time of the entry is updated.
+        """
+        entry = self._entry(key)
+        try:
+            os.utime(entry / self.MetaFile)
+        except FileNotFoundError:
+            return None
+        return entry / "result"
+
+    def restore(self, key, dest) -> bool:
+        """
+        Copy cached result into `dest`, existing files in `dest` are replaced.
+        Copied files are independent of the entry, they can be rewritten and stay after the entry is evicted.
+
+        :return: False if key is not cached.
+        """
+        cached = self.get(key)
+        if cached is None:
+            return False
+        dest = pathlib.Path(dest)
+        if dest.is_symlink():
+            dest.unlink()
+        dest.mkdir(parents=True, exist_ok=True)
+        for src in cached.rglob("*"):
+            target = dest / src.relative_to(cached)
+            if src.is_dir():
+                target.mkdir(exist_ok=True)
+            else:
+                if target.exists():
+                    target.unlink()
+                shutil.copy2(src, target)
+        return True
+
+    def put(self, key, result_dir, meta: dict = None):
+        """
+        Store a copy of `result_dir` under key, then evict least recently used entries if out of bounds.
+        An existing entry is kept.
+
+        :param meta: extra information saved in `meta.json`.
+        :return: path of cached result directory.
+        """
+        entry = self._entry(key)
+        if key in self:
+            return self.get(key)
+        tmp = self.root / "tmp" / uuid.uuid4().hex
+        shutil.copytree(result_dir, tmp / "result", copy_function=shutil.copy2)
+        with open(tmp / self.MetaFile, "w") as f:
+            json.dump({"key": key, "size": _tree_size(tmp / "result"), "created": time.time(), **(meta or {})}, f)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.rename(tmp, entry)
+        except OSError:  # stored by another process meanwhile
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+        return entry / "result"
+
+    def entries(self):
+        """
+        :return: list of (last access time, size, key), least recently used first.
+        """
+        entries = []
+        for meta_file in self.root.glob(f"objects/*/*/{self.MetaFile}"):
+            try:
+                with open(meta_file, "r") as f:
+                    meta = json.load(f)
+                entries.append((meta_file.stat().st_mtime, meta["size"], meta["key"]))
+            except (OSError, ValueError, KeyError):
+                continue
+        return sorted(entries)
+
+    def remove(self, key):
+        entry = self._entry(key)
+        if entry.exists():
+            trash = self.root / "tmp" / uuid.uuid4().hex
+            os.rename(entry, trash)
+            shutil.rmtree(trash, ignore_errors=True)
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache is within `max_bytes` and `max_entries`.
+
+        :return: list of removed keys.
+        """
+        if self.max_bytes is None and self.max_entries is None:
+            return []
+        entries = self.entries()
+        total = sum(item[1] for item in entries)
+        removed = []
+        while entries and ((self.max_bytes is not None and total > self.max_bytes)
+                           or (self.max_entries is not None and len(entries) > self.max_entries)):
+            _, size, key = entries.pop(0)
+            self.remove(key)
+            total -= size
+            removed.append(key)
+        return removed
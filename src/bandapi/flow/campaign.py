@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : campaign.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+import contextlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from bandapi.flow.flowlog import Logger
+from bandapi.io.sqlitedb import SQLiteDB
+
+logger = Logger(__name__)
+
+"""
+Work queue of a campaign shared by many worker processes, on one or more hosts sharing a filesystem.
+
+Ids (e.g. Material Project ids) are added once, then each worker claims batches of them with a lease.
+A claim is one `BEGIN IMMEDIATE` transaction of SQLite, so no id is claimed by two workers at the same time.
+A worker keeps its lease by heartbeats; when a worker crashes its lease expires and the ids are claimed again
+by others, up to `max_attempts` times, then they are failed (see `reset` to retry them).
+
+The database should be on a filesystem with working POSIX locks (local disk, NFSv4 or Lustre with `flock`),
+SQLite is not safe on filesystems without them.
+"""
+
+ItemStatus = ["pending", "leased", "done", "failed"]
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class CampaignQueue(SQLiteDB):
+    _schema = [
+        "CREATE TABLE IF NOT EXISTS items ("
+        "id TEXT PRIMARY KEY, status TEXT NOT NULL DEFAULT 'pending', worker TEXT, lease_until REAL, "
+        "attempts INTEGER NOT NULL DEFAULT 0, updated REAL, error TEXT)",
+        "CREATE INDEX IF NOT EXISTS items_status ON items (status, lease_until)",
+    ]
+
+    def __init__(self, path, lease_seconds=600, max_attempts=3, worker=None, timeout=60):
+        """
+        Usage:
+        ```
+        queue = CampaignQueue("campaign.sqlite", lease_seconds=3600)
+        queue.add(taskid)  # ids already in queue are kept
+        while True:
+            with queue.lease(batch_size=10) as ids:
+                if not ids:
+                    break
+                ...  # done if no exception, else back to pending (or failed after `max_attempts`)
+        ```
+
+        :param path: SQLite database file.
+        :param float lease_seconds: seconds a claim is valid without heartbeat.
+        :param int max_attempts: an id is failed after claimed so many times without done.
+        :param str worker: name of this worker, default to `host:pid:random`.
+        :param float timeout: seconds to wait for the lock of database.
+        """
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker = worker if worker is not None else default_worker_name()
+        super(CampaignQueue, self).__init__(path, timeout=timeout)
+
+    def add(self, ids):
+        """
+        Add ids as pending, ids already in queue are not changed.
+
+        :return: number of new ids.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO items (id, updated) VALUES (?, ?)",
+                             ((str(item), now) for item in ids if str(item).strip()))
+            return conn.total_changes - before
+
+    def claim(self, batch_size=1):
+        """
+        Lease up to `batch_size` pending ids, or ids whose lease has expired.
+        Expired leases without attempts left are marked failed in the same transaction.
+
+        :return: list of ids, empty if nothing to do now.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("UPDATE items SET status = 'failed', lease_until = NULL, updated = ?, "
+                         "error = COALESCE(error, 'lease expired') "
+                         "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?", (now, now, self.max_attempts))
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM items WHERE (status = 'pending' OR (status = 'leased' AND lease_until < ?)) "
+                "AND attempts < ? ORDER BY rowid LIMIT ?", (now, self.max_attempts, batch_size))]
+            conn.executemany(
+                "UPDATE items SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? "
+                "WHERE id = ?", ((self.worker, now + self.lease_seconds, now, item) for item in ids))
+        if ids:
+            logger.info(f"Worker {self.worker} claimed {len(ids)} ids: {ids[:5]}{'...' if len(ids) > 5 else ''}")
+        return ids
+
+    def _update_own(self, sql, params, ids):
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(sql + " WHERE id = ? AND status = 'leased' AND worker = ?",
+                             ((*params, item, self.worker) for item in ids))
+            return conn.total_changes - before
+
+    def heartbeat(self, ids):
+        """
+        Extend leases of ids still held by this worker.
+
+        :return: number of ids still held.
+        """
+        now = time.time()
+        return self._update_own("UPDATE items SET lease_until = ?, updated = ?", (now + self.lease_seconds, now), ids)
+
+    def complete(self, ids):
+        """
+        Mark ids done.
+
+        :return: number of ids changed.
+        """
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("UPDATE items SET status = 'done', worker = ?, lease_until = NULL, updated = ?, error = NULL "
+                             "WHERE id = ? AND status != 'done'", ((self.worker, time.time(), item) for item in ids))
+            return conn.total_changes - before
+
+    def fail(self, ids, error="", retry=True):
+        """
+        Give up leases of ids after an error. They are pending again if `retry` and attempts are left, else failed.
+
+        :return: number of ids changed.
+        """
+        status = "CASE WHEN ? AND attempts < ? THEN 'pending' ELSE 'failed' END"
+        return self._update_own(f"UPDATE items SET status = {status}, lease_until = NULL, updated = ?, error = ?",
+                                (int(retry), self.max_attempts, time.time(), str(error)), ids)
+
+    def release(self, ids):
+        """
+        Give back leases of ids without counting the attempt.
+
+        :return: number of ids changed.
+        """
+        return self._update_own("UPDATE items SET status = 'pending', lease_until = NULL, attempts = attempts - 1, updated = ?",
+                                (time.time(),), ids)
+
+    def reset(self, status="failed"):
+        """
+        Put ids of `status` back to pending with attempts cleared, e.g. to retry failed ids.
+
+        :return: number of ids changed.
+        """
+        with self._transaction() as conn:
+            return conn.execute("UPDATE items SET status = 'pending', worker = NULL, lease_until = NULL, attempts = 0, "
+                                "updated = ? WHERE status = ?", (time.time(), status)).rowcount
+
+    def counts(self):
+        """
+        :return: dict of status -> number of ids, expired leases are counted as "expired".
+        """
+        counts = {item: 0 for item in [*ItemStatus, "expired"]}
+        for status, expired, number in self.connection.execute(
+                "SELECT status, status = 'leased' AND lease_until < ?, COUNT(*) FROM items GROUP BY 1, 2", (time.time(),)):
+            counts["expired" if expired else status] += number
+        return counts
+
+    def ids(self, status):
+        return [row[0] for row in self.connection.execute("SELECT id FROM items WHERE status = ? ORDER BY rowid", (status,))]
+
+    @contextlib.contextmanager
+    def lease(self, batch_size=1, heartbeat_interval=None):
+        """
+        Claim a batch and keep it by heartbeats in a background thread.
+        The batch is done when the block exits normally, and failed (retried if attempts are left) on exception.
+
+        :param heartbeat_interval: seconds between heartbeats, default to a third of `lease_seconds`.
+        :return: context manager of list of ids, empty if nothing to do now.
+        """
+        ids = self.claim(batch_size)
+        if not ids:
+            yield ids
+            return
+        heartbeat = Heartbeat(self, ids, interval=heartbeat_interval or self.lease_seconds / 3).start()
+        try:
+            yield ids
+        except BaseException as e:
+            heartbeat.stop()
+            self.fail(ids, error=repr(e))
+            raise
+        else:
+            heartbeat.stop()
+            self.complete(ids)
+
+
+class Heartbeat:
+    def __init__(self, queue: CampaignQueue, ids, interval):
+        """
+        Background thread extending leases of ids every `interval` seconds.
+        """
+        self.queue = queue
+        self.ids = list(ids)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    held = self.queue.heartbeat(self.ids)
+                except sqlite3.Error as e:  # e.g. "database is locked" for a while on network filesystem
+                    logger.error(f"Heartbeat of worker {self.queue.worker} failed, retry: {e!r}")
+                    self.queue.close()
+                    continue
+                if held < len(self.ids):
+                    logger.warning(f"Worker {self.queue.worker} lost leases of {len(self.ids) - held} ids.")
+        finally:
+            self.queue.close()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
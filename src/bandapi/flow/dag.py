@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : dag.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+import asyncio
+import heapq
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+from bandapi.dispatcher.dpdispatcher import Machine, Resources, Submission
+from bandapi.dispatcher.polling import PollingPolicy
+from bandapi.flow.flowlog import Logger
+from bandapi.flow.state import FlowState
+from bandapi.flow.statedb import get_state_db
+from bandapi.flow.task_content import NamedAtomsContentDict, TaskContentSubset
+
+logger = Logger(__name__)
+
+"""
+Pipelining of a flow over materials.
+
+`Flow.submit` runs a state of `task_flow_list` for all materials before the next state starts, so one slow material
+keeps all others waiting. `DAGScheduler` runs each (material, state) pair as a node instead: a node starts as soon as
+the nodes it depends on are finished, i.e. `nscf-band` of a material is submitted once its own `scf-charge` is
+downloaded and validated. Wall time approaches the critical path of the slowest single material.
+
+A node runs a `FlowState` of its material like `FlowStateControl` does:
+flow_begin_test, bakeup, prepare, dispatch, store_results, result_finished (validation) and run_end.
+The structure of material after run_end (e.g. relaxed) is passed to the next node.
+
+A state with `_gather_materials` (e.g. `band-data`, which writes one summary and one band archive) is one node
+`FlowNode(None, state)` depending on all materials. It runs after all of them ended, over the materials done,
+with their final structures written back to `task_content`.
+"""
+
+FlowNode = namedtuple("FlowNode", ["material", "state"])
+NodeStatus = ["pending", "running", "done", "failed", "skipped"]
+
+
+class FlowDAG:
+    def __init__(self):
+        """
+        Directed acyclic graph of `FlowNode`. A node is added after its dependencies, so no cycle can be made.
+        """
+        self.dependencies = OrderedDict()
+        self._successors = None
+
+    @classmethod
+    def from_flow_list(cls, materials, flow_list, gather_states=()):
+        """
+        A chain of `flow_list` for each material.
+
+        :param gather_states: states run once over all materials, as node `FlowNode(None, state)` depending on
+            the previous node of every material.
+        """
+        dag = cls()
+        previous = {material: () for material in materials}
+        segment = []
+
+        def add_chains():
+            for material in materials:
+                for state in segment:
+                    node = FlowNode(material, state)
+                    dag.add_node(node, previous[material])
+                    previous[material] = (node,)
+            segment.clear()
+
+        for state in flow_list:
+            if state in gather_states:
+                add_chains()
+                node = FlowNode(None, state)
+                dag.add_node(node, list(dict.fromkeys(item for items in previous.values() for item in items)))
+                previous = {material: (node,) for material in materials}
+            else:
+                segment.append(state)
+        add_chains()
+        return dag
+
+    def __len__(self):
+        return len(self.dependencies)
+
+    def __iter__(self):
+        return iter(self.dependencies)
+
+    def add_node(self, node: FlowNode, dependencies=()):
+        for item in dependencies:
+            if item not in self.dependencies:
+                raise KeyError(f"Dependency {item} of {node} should be added first.")
+        if node in self.dependencies:
+            raise KeyError(f"Node {node} has been added.")
+        self.dependencies[node] = tuple(dependencies)
+        self._successors = None
+
+    def successors(self):
+        """
+        :return: dict of node -> list of nodes depending on it, built once until a node is added.
+        """
+        if self._successors is None:
+            successors = {node: [] for node in self.dependencies}
+            for node, dependencies in self.dependencies.items():
+                for item in dependencies:
+                    successors[item].append(node)
+            self._successors = successors
+        return self._successors
+
+    def depths(self):
+        """
+        :return: dict of node -> length of the longest chain of dependencies before it.
+        """
+        depths = {}
+        for node, dependencies in self.dependencies.items():  # dependencies are always before node
+            depths[node] = max((depths[item] + 1 for item in dependencies), default=0)
+        return depths
+
+    def next_state(self, node: FlowNode):
+        """
+        State of the first node of the same material (or of all materials) depending on `node`,
+        `next_state` of `FlowState.run_end`.
+        """
+        for item in self.successors()[node]:
+            if item.material == node.material or item.material is None:
+                return item.state
+        return None
+
+    def critical_path(self, durations):
+        """
+        :param durations: dict of node -> seconds, missing nodes take 0.
+        :return: (seconds, list of nodes) of the longest path.
+        """
+        finish, previous = {}, {}
+        for node, dependencies in self.dependencies.items():
+            latest = max(dependencies, key=finish.get, default=None)
+            if latest is not None:
+                previous[node] = latest
+            finish[node] = (0 if latest is None else finish[latest]) + durations.get(node, 0)
+        if not finish:
+            return 0, []
+        node = max(reversed(finish), key=finish.get)  # the last one of equal paths
+        path = [node]
+        while path[-1] in previous:
+            path.append(previous[path[-1]])
+        return finish[node], path[::-1]
+
+
+class DAGScheduler:
+    def __init__(
+            self,
+            flow_state_class,
+            flow_list,
+            task_content,
+            machine,
+            resource,
+            task_setup,
+            max_concurrent=None,
+            dag: FlowDAG = None
+    ):
+        """
+        Run a flow as a DAG of (material, state) nodes, see the module document.
+
+        Usage:
+        ```
+        scheduler = DAGScheduler(AbacusState, ["scf-charge", "nscf-band"], task_content, machine, resource, task_setup,
+                                 max_concurrent=50)
+        status = scheduler.run()
+        ```
+
+        :param flow_state_class: base class of states, e.g. `AbacusState`, states are found by name in its subclasses.
+        :param List[str] flow_list: states of each material in order.
+        :param task_content: dict of material -> ase.Atoms, e.g. NamedAtomsContentDict or LazyAtomsContentDict.
+            Structures are read when the first node of a material starts.
+        :param dict machine: machine dict of dpdispatcher, a Machine is loaded for each submission.
+        :param dict resource: resource dict of dpdispatcher.
+        :param dict task_setup: settings of states, same to `task_setup` of `AbacusFlow`.
+        :param int max_concurrent: number of nodes running at the same time, None for all.
+            Nodes deeper in the DAG start first, so started materials are finished before new ones begin.
+        :param FlowDAG dag: default to a chain of `flow_list` for each material,
+            states with `_gather_materials` are one node over all materials.
+        """
+        self.flow_state_class = flow_state_class
+        self.flow_list = flow_list
+        self.task_content = task_content
+        self.machine = machine
+        self.resource = resource
+        self.task_setup = task_setup
+        if task_setup.get("state_db", None) is not None:  # one database shared by nodes
+            self.task_setup = {**task_setup, "state_db": get_state_db(task_setup["state_db"])}
+        self.max_concurrent = max_concurrent
+        if dag is None:
+            gather_states = [state for state in flow_list if self.state_class(state)._gather_materials]
+            dag = FlowDAG.from_flow_list(list(task_content), flow_list, gather_states=gather_states)
+        self.dag = dag
+        self.status = {node: "pending" for node in self.dag}
+        self.errors = {}
+        self.durations = {}
+        self.wall_time = None
+
+    def state_class(self, state: str):
+        state_class = self.flow_state_class._subclass_dict().get(state)
+        if state_class is None:
+            raise KeyError(f"Unknown state {state} of {self.flow_state_class.__name__}.")
+        return state_class
+
+    def begin_node(self, node: FlowNode, task_content) -> FlowState:
+        """
+        Blocking. Initialize state of node and prepare its task list.
+
+        :param task_content: materials of node, see `node_content`.
+        """
+        state = self.state_class(node.state)(task_content, **self.task_setup)
+        state.flow_begin_test()
+        state.bakeup(state.task_content)
+        state.task_list = state.prepare(state.task_content, state._state_settings)
+        state.record_started()
+        return state
+
+    def make_submission(self, state: FlowState):
+        """
+        Blocking. Submission of state with its own Machine, since a Machine is bound to one submission.
+
+        :return: Submission, or None if nothing to submit.
+        """
+        if not state._need_submission or not state.task_list:
+            return None
+        return Submission(
+            work_base=state.get_state_settings("dispatch_work_base", "."),
+            machine=Machine.load_from_dict(self.machine),
+            resources=Resources.load_from_dict(self.resource),
+            task_list=state.task_list,
+            forward_common_files=state.get_forward_common_files(),
+            backward_common_files=[]
+        )
+
+    async def adispatch(self, node: FlowNode, state: FlowState, executor=None):
+        """
+        Submit tasks of node and wait for them.
+        """
+        submission = await asyncio.get_running_loop().run_in_executor(executor, self.make_submission, state)
+        if submission is not None:
+            await submission.async_run_submission(
+                period=PollingPolicy.from_state(state),
+                clean=state.get_state_settings("clean", True),
+                executor=executor
+            )
+            state.submission_hash = submission.submission_hash
+
+    def end_node(self, node: FlowNode, state: FlowState):
+        """
+        Blocking. Validate and finish state of node.
+
+        :return: structure of material passed to the next node, None for a node of all materials.
+        """
+        state.store_results()
+        state.record_results()
+        if node.material is None:
+            state.run_end(next_state=self.dag.next_state(node))
+            return None
+        if state._need_submission and state.task_list and not state.result_finished(node.material):
+            raise RuntimeError(f"Result of [task]: {node.material} in [state]: {node.state} is not finished.")
+        state.run_end(next_state=self.dag.next_state(node))
+        return state.task_content[node.material]
+
+    async def node_content(self, node: FlowNode, structures: dict, executor=None):
+        """
+        Task content of node: its own material with the structure passed from the previous node,
+        or for a node of all materials, a `TaskContentSubset` of `task_content` with the materials done before.
+        """
+        if node.material is None:
+            materials = [item.material for item in self.dag.dependencies[node] if self.status[item] == "done"]
+            return TaskContentSubset(self.task_content, materials)
+        if node.material not in structures:
+            structures[node.material] = await asyncio.get_running_loop().run_in_executor(
+                executor, self.task_content.__getitem__, node.material)
+        return NamedAtomsContentDict({node.material: structures[node.material]})
+
+    async def arun_node(self, node: FlowNode, structures: dict, executor=None):
+        """
+        Run one node, `structures` is the dict of material -> structure passed between nodes.
+
+        :return: node
+        """
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        self.status[node] = "running"
+        try:
+            task_content = await self.node_content(node, structures, executor=executor)
+            state = await loop.run_in_executor(executor, self.begin_node, node, task_content)
+            await self.adispatch(node, state, executor=executor)
+            structure = await loop.run_in_executor(executor, self.end_node, node, state)
+            if node.material is not None:
+                structures[node.material] = structure
+            self.status[node] = "done"
+            logger.info(f"Node done of [state]: {node.state}, [task]: {node.material}.")
+        except Exception as e:
+            self.status[node] = "failed"
+            self.errors[node] = e
+            logger.error(f"Node failed of [state]: {node.state}, [task]: {node.material}: {e!r}")
+        finally:
+            self.durations[node] = time.monotonic() - start
+        return node
+
+    async def arun(self, executor=None):
+        """
+        Run all nodes. A node is ready when its dependencies are done, ready nodes deeper in the DAG start first.
+        A failed node is logged and its descendants are skipped, other materials go on.
+        A node of all materials is ready when all its dependencies ended, and skipped if none of them is done.
+
+        :param executor: concurrent.futures.Executor for blocking work of nodes.
+        :return: dict of node -> status, see `NodeStatus`.
+        """
+        successors = self.dag.successors()
+        depths = self.dag.depths()
+        order = {node: idx for idx, node in enumerate(self.dag)}
+        waiting = {node: len(dependencies) for node, dependencies in self.dag.dependencies.items()}
+        remaining = Counter(node.material for node in self.dag if node.material is not None)
+        structures = {}
+        ready = [(-depths[node], order[node], node) for node, count in waiting.items() if count == 0]
+        heapq.heapify(ready)
+        running = set()
+
+        def finish(node):
+            if node.material is not None:
+                if self.status[node] == "done" and any(item.material is None for item in successors[node]):
+                    self.task_content[node.material] = structures[node.material]  # read by node of all materials
+                remaining[node.material] -= 1
+                if remaining[node.material] == 0:
+                    structures.pop(node.material, None)
+            for item in successors[node]:
+                if item.material is None:
+                    waiting[item] -= 1
+                    if waiting[item] == 0 and self.status[item] == "pending":
+                        if any(self.status[dependency] == "done" for dependency in self.dag.dependencies[item]):
+                            heapq.heappush(ready, (-depths[item], order[item], item))
+                        else:
+                            self.status[item] = "skipped"
+                            logger.info(f"Skip [state]: {item.state} of all materials after failure.")
+                            finish(item)
+                    continue
+                if self.status[node] != "done":
+                    if self.status[item] == "pending":
+                        self.status[item] = "skipped"
+                        logger.info(f"Skip [state]: {item.state}, [task]: {item.material} after failure.")
+                        finish(item)
+                    continue
+                waiting[item] -= 1
+                if waiting[item] == 0 and self.status[item] == "pending":
+                    heapq.heappush(ready, (-depths[item], order[item], item))
+
+        start = time.monotonic()
+        while ready or running:
+            while ready and (self.max_concurrent is None or len(running) < self.max_concurrent):
+                node = heapq.heappop(ready)[-1]
+                running.add(asyncio.ensure_future(self.arun_node(node, structures, executor=executor)))
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                finish(task.result())
+        self.wall_time = time.monotonic() - start
+        critical, _ = self.dag.critical_path(self.durations)
+        logger.info(f"DAG of {len(self.dag)} nodes: {dict(Counter(self.status.values()))}, "
+                    f"wall time {self.wall_time:.1f}s, critical path {critical:.1f}s.")
+        return self.status
+
+    def run(self, executor=None):
+        """
+        Blocking entry of `arun`.
+        """
+        return asyncio.run(self.arun(executor=executor))
@@ -14,6 +14,8 @@ from bandapi.dispatcher.dpdispatcher import Task
 class FlowState:
     _state: str = "Unknown"
     _state_class_dict = dict()
+    _result_patterns: List[str] = []  # glob of result files recorded with sha256, relative to task directory
+    _gather_materials: bool = False  # run once over all materials finished before it, as one node of `DAGScheduler`
 
     def __init__(self, task_content, flow_work_root=".", **kwargs):
         self._flow_work_root = pathlib.Path(flow_work_root).absolute()
@@ -68,6 +70,93 @@ class FlowState:
         """
         raise NotImplementedError
 
+    def get_forward_common_files(self):
+        """
+        Files shared by all tasks of submission, relative to work base of submission.
+
+        :return: list of path
+        """
+        return []
+
+    def store_results(self):
+        """
+        Subclass can keep results of finished tasks here, e.g. into a result cache. It runs before `run_end`.
+
+        """
+
+    def get_state_db(self):
+        """
+        FlowStateDB of setting `state_db`, see `bandapi.flow.statedb`.
+
+        :return: FlowStateDB or None if not set.
+        """
+        from bandapi.flow.statedb import get_state_db  # not at top, so `python -m bandapi.flow.statedb` runs cleanly
+        if getattr(self, "_state_db", None) is None:
+            self._state_db = get_state_db(self.get_state_settings("state_db", None))
+        return self._state_db
+
+    def find_finished(self, subdirs):
+        """
+        Tasks finished before, looked up in `state_db` if set, else checked by `result_finished` on disk.
+
+        :param subdirs: names of tasks (materials).
+        :return: set of finished names.
+        """
+        state_db = self.get_state_db()
+        if state_db is not None:
+            return state_db.finished(self._state, subdirs)
+        return {subdir for subdir in subdirs if self.result_finished(subdir)}
+
+    def pending_subdirs(self):
+        """
+        Subclass should give names of tasks to run in this state, recorded by `record_started` and `record_results`.
+        """
+        return []
+
+    def record_started(self):
+        """
+        Record pending tasks as running in `state_db`.
+        """
+        state_db = self.get_state_db()
+        if state_db is not None and self._result_patterns:
+            state_db.mark(self.pending_subdirs(), self._state, "running")
+
+    def record_results(self):
+        """
+        Record pending tasks as done if `result_finished` (with submission hash and sha256 of `_result_patterns` files),
+        else failed, in `state_db`. Setting `state_db_checksum` (default True) controls the sha256.
+        """
+        from bandapi.flow.statedb import file_checksums, result_files
+        state_db = self.get_state_db()
+        if state_db is None or not self._result_patterns:
+            return
+        done, failed, checksums = [], [], {}
+        for subdir in self.pending_subdirs():
+            task_root = self.flow_work_root / self._state / subdir
+            if self.result_finished(subdir):
+                done.append(subdir)
+                if self.get_state_settings("state_db_checksum", True):
+                    checksums[subdir] = file_checksums(task_root, result_files(task_root, self._result_patterns))
+            else:
+                failed.append(subdir)
+        submission_hash = getattr(self, "submission_hash", None)
+        state_db.mark(done, self._state, "done", submission_hash=submission_hash, checksums=checksums)
+        state_db.mark(failed, self._state, "failed", submission_hash=submission_hash)
+
+    @classmethod
+    def task_finished(cls, task_root):
+        """
+        Whether result in task directory `task_root` is downloaded and valid. Default to True.
+        """
+        return True
+
+    def result_finished(self, subdir):
+        """
+        Whether result of task `subdir` is downloaded and valid, checked before it is cached or recorded,
+        and by `DAGScheduler` before the next state. See `task_finished`.
+        """
+        return self.task_finished(self.flow_work_root / self._state / subdir)
+
     def run_end(self, next_state):
         """
         The state has do all necessary tasks, it's time to summary and determine what to do next.
@@ -109,6 +198,7 @@ class FlowStateControl:
     Settings:
     dispatch_work_base, "."
     submission_check_period,5
+    state_db, None
 
     """
     _flow_state_class = FlowState
@@ -117,6 +207,9 @@ class FlowStateControl:
         self.flow_list = flow_list
         self._state = None
         self.flow_settings = kwargs
+        if kwargs.get("state_db", None) is not None:  # one database shared by states
+            from bandapi.flow.statedb import get_state_db
+            self.flow_settings["state_db"] = get_state_db(kwargs["state_db"])
         self.flow_list_flag = 0
         self.task_content = task_content
         self._state_init()
@@ -145,8 +238,20 @@ class FlowStateControl:
             self.checktorun=self._state.flow_begin_test()
         self._state.bakeup(self._state.task_content)
         self._state.task_list = self._state.prepare(self._state.task_content, self._state._state_settings)
+        self._state.record_started()
+
+    def finished_materials(self, state=None):
+        """
+        :param str state: default to current state.
+        :return: set of materials finished in state, from `state_db` or files.
+        """
+        state = self._state if state is None else self._flow_state_class._subclass_dict().get(state)(
+            self.task_content, **self.flow_settings)
+        return state.find_finished(list(self.task_content))
 
     def run_end(self):
+        self._state.store_results()
+        self._state.record_results()
         self.flow_list_flag += 1
         try:
             if self._state.run_end(next_state=self.flow_list[self.flow_list_flag]):  # try if it's the last and run_end
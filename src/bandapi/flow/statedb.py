@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : statedb.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+import glob
+import json
+import os
+import pathlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bandapi.io.sqlitedb import SQLiteDB
+from bandapi.io.utils import file_sha256
+
+"""
+Persistent status of (material, state) pairs of flows, for resuming without probing files of every material.
+
+Setting `state_db` of a flow is the SQLite file (or a FlowStateDB). With it, `flow_begin_test` of states reads
+finished materials by one indexed query instead of `glob` in their directories, and finished results are recorded
+with time, submission hash and sha256 of result files. A database of a flow run without it is built once by
+`python -m bandapi.flow.statedb rebuild <db> <flow_work_root>`.
+"""
+
+StateStatus = ["running", "done", "failed"]
+
+
+class FlowStateDB(SQLiteDB):
+    _schema = [
+        "CREATE TABLE IF NOT EXISTS states ("
+        "material TEXT NOT NULL, state TEXT NOT NULL, status TEXT NOT NULL, "
+        "started REAL, finished REAL, updated REAL, submission_hash TEXT, checksums TEXT, "
+        "PRIMARY KEY (material, state))",
+        "CREATE INDEX IF NOT EXISTS states_status ON states (state, status)",
+    ]
+
+    def get(self, material, state):
+        """
+        :return: dict of the record, None if not recorded.
+        """
+        cursor = self.connection.execute("SELECT * FROM states WHERE material = ? AND state = ?", (material, state))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        record = dict(zip([item[0] for item in cursor.description], row))
+        record["checksums"] = json.loads(record["checksums"]) if record["checksums"] else {}
+        return record
+
+    def status(self, material, state):
+        row = self.connection.execute("SELECT status FROM states WHERE material = ? AND state = ?", (material, state)).fetchone()
+        return None if row is None else row[0]
+
+    def finished(self, state, materials=None):
+        """
+        :param materials: materials to look up, all of state if None.
+        :return: set of materials done in state.
+        """
+        if materials is None:
+            return {row[0] for row in self.connection.execute(
+                "SELECT material FROM states WHERE state = ? AND status = 'done'", (state,))}
+        finished = set()
+        materials = list(materials)
+        for idx in range(0, len(materials), 500):  # within the limit of SQL variables
+            chunk = materials[idx:idx + 500]
+            finished.update(row[0] for row in self.connection.execute(
+                f"SELECT material FROM states WHERE state = ? AND status = 'done' AND material IN ({','.join('?' * len(chunk))})",
+                (state, *chunk)))
+        return finished
+
+    def mark(self, materials, state, status, submission_hash=None, checksums=None):
+        """
+        Record status of materials in state, the start time is kept from "running".
+
+        :param materials: list of materials.
+        :param dict checksums: dict of material -> dict of file -> sha256.
+        """
+        if status not in StateStatus:
+            raise ValueError(f"Unknown status {status}, it should be one of {StateStatus}.")
+        now = time.time()
+        checksums = checksums or {}
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO states (material, state, status, started, finished, updated, submission_hash, checksums) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (material, state) DO UPDATE SET "
+                "status = excluded.status, started = COALESCE(excluded.started, states.started), "
+                "finished = excluded.finished, updated = excluded.updated, "
+                "submission_hash = COALESCE(excluded.submission_hash, states.submission_hash), "
+                "checksums = COALESCE(excluded.checksums, states.checksums)",
+                ((material, state, status, now if status == "running" else None, None if status == "running" else now,
+                  now, submission_hash, json.dumps(checksums[material]) if material in checksums else None)
+                 for material in materials))
+
+    def remove(self, materials, state):
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM states WHERE material = ? AND state = ?", ((material, state) for material in materials))
+
+    def counts(self):
+        """
+        :return: dict of state -> dict of status -> number of materials.
+        """
+        counts = {}
+        for state, status, number in self.connection.execute("SELECT state, status, COUNT(*) FROM states GROUP BY 1, 2"):
+            counts.setdefault(state, {})[status] = number
+        return counts
+
+    def rebuild(self, flow_work_root, state_classes, checksum=True, max_workers=16):
+        """
+        Record results already on disk, e.g. of a flow run before `state_db` was set. Run it once.
+
+        :param flow_work_root: root of flow, tasks are `flow_work_root/state/material/`.
+        :param dict state_classes: dict of state -> FlowState class, a material is done if `task_finished`
+            of the class is True for its task directory, and `_result_patterns` of the class are checksummed.
+        :param bool checksum: record sha256 of result files.
+        :param int max_workers: threads probing directories, to hide latency of network filesystem.
+        :return: dict of state -> number of materials done.
+        """
+        flow_work_root = pathlib.Path(flow_work_root)
+        summary = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for state, state_class in state_classes.items():
+                state_root = flow_work_root / state
+                if not state_root.is_dir():
+                    continue
+                materials = [item.name for item in os.scandir(state_root) if item.is_dir()]
+                finished = executor.map(lambda material: state_class.task_finished(state_root / material), materials)
+                done = [material for material, item in zip(materials, finished) if item]
+                checksums = {material: file_checksums(state_root / material,
+                                                      result_files(state_root / material, state_class._result_patterns))
+                             for material in done} if checksum else None
+                self.mark(done, state, "done", checksums=checksums)
+                summary[state] = len(done)
+        return summary
+
+
+def result_files(task_root, patterns):
+    """
+    :return: list of files matching patterns under task_root.
+    """
+    files = []
+    for pattern in patterns:
+        files.extend(glob.glob((pathlib.Path(task_root) / pattern).as_posix()))
+    return files
+
+
+def file_checksums(task_root, files):
+    """
+    :return: dict of file (relative to task_root) -> sha256.
+    """
+    return {pathlib.Path(item).relative_to(task_root).as_posix(): file_sha256(item) for item in files}
+
+
+def get_state_db(state_db):
+    """
+    :param state_db: FlowStateDB, path of database, or None.
+    :return: FlowStateDB or None.
+    """
+    if state_db is None or isinstance(state_db, FlowStateDB):
+        return state_db
+    return FlowStateDB(state_db)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the flow state database of setting `state_db`.")
+    parser.add_argument("action", choices=["rebuild", "counts"])
+    parser.add_argument("db")
+    parser.add_argument("flow_work_root", nargs="?", default=".")
+    parser.add_argument("--states", nargs="+", default=None, help="states to rebuild, default to all ABACUS states.")
+    parser.add_argument("--no-checksum", action="store_true", help="do not compute sha256 of result files.")
+    args = parser.parse_args()
+    db = FlowStateDB(args.db)
+    if args.action == "rebuild":
+        from bandapi.flow.abacus import AbacusState
+
+        state_classes = AbacusState._subclass_dict()
+        states = args.states or [state for state, item in state_classes.items() if item._result_patterns]
+        summary = db.rebuild(args.flow_work_root, {state: state_classes[state] for state in states},
+                             checksum=not args.no_checksum)
+        print(json.dumps(summary, indent=2))
+    else:
+        print(json.dumps(db.counts(), indent=2))
@@ -6,8 +6,19 @@
 # ALL RIGHTS ARE RESERVED UNLESS STATED.
 # ====================================== #
 import abc
+import pathlib
+import pickle
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
 
 import ase
+import ase.io
+from bandapi.flow.flowlog import Logger
+
+logger = Logger(__name__)
 
 
 class TaskContent(abc.ABC):
@@ -41,4 +52,278 @@ class NamedAtomsContentDict(dict, TaskContent):
 
     @property
     def content_state(self):
-        return "Unknown"
\ No newline at end of file
+        return "Unknown"
+
+class AtomsSource(abc.ABC):
+    """
+    Where `LazyAtomsContentDict` loads structures from.
+    """
+
+    @abc.abstractmethod
+    def load_many(self, names) -> dict:
+        """
+        :param list names:
+        :return: dict of name -> ase.Atoms, missing names are left out.
+        """
+        raise NotImplementedError
+
+
+class DirectorySource(AtomsSource):
+    def __init__(self, directory, suffix=".cif", format=None):
+        """
+        Structures of files `directory/<name><suffix>`, read by `ase.io.read`.
+        """
+        self.directory = pathlib.Path(directory)
+        self.suffix = suffix
+        self.format = format
+
+    def load_many(self, names) -> dict:
+        result = {}
+        for name in names:
+            file = self.directory / f"{name}{self.suffix}"
+            if file.exists():
+                result[name] = ase.io.read(file, format=self.format)
+        return result
+
+
+class MatProjSource(AtomsSource):
+    def __init__(self, matprojwrapper):
+        """
+        Structures of Material Project by `MatProjWrapper.get_structures_by_ids`,
+        with its `cache` they are read from local structure cache.
+        """
+        self.matprojwrapper = matprojwrapper
+
+    def load_many(self, names) -> dict:
+        structures = self.matprojwrapper.get_structures_by_ids(names, errors="ignore")
+        return {name: atoms[0] for name, atoms in structures.items()}
+
+
+class LazyAtomsContentDict(MutableMapping, TaskContent):
+    def __init__(self, names, source: AtomsSource, max_cached=1024, chunk_size=256, spill_dir=None, missing="raise"):
+        """
+        Task content which loads atoms from source on demand and keeps at most `max_cached` of them in memory.
+
+        Atoms set by `content[name] = atoms` (e.g. relaxed structures of a state) override the source,
+        they are pickled into `spill_dir` when evicted and loaded from there again.
+        `items()` loads atoms in chunks of `chunk_size` by one `source.load_many` call.
+        It is safe to use from many threads (e.g. nodes of `DAGScheduler`), the cache is guarded by a lock
+        and `content[name]` reads the source outside of it.
+
+        :param names: names of materials.
+        :param AtomsSource source:
+        :param int max_cached: number of atoms kept in memory.
+        :param int chunk_size: number of atoms loaded at once when iterating.
+        :param spill_dir: directory of evicted overrides, default to a temporary directory.
+        :param str missing: "raise" raises RuntimeError for names without structure in source when iterating,
+            like the eager `get_structures_by_ids`; "skip" logs a warning and leaves them out.
+        """
+        if missing not in ["raise", "skip"]:
+            raise ValueError(f"Unknown missing {missing}, it should be \"raise\" or \"skip\".")
+        self.missing = missing
+        self._names = list(dict.fromkeys(names))
+        self._name_set = set(self._names)
+        self.source = source
+        self.max_cached = max_cached
+        self.chunk_size = chunk_size
+        self._spill_dir = pathlib.Path(spill_dir) if spill_dir is not None else None
+        self._cached = OrderedDict()
+        self._dirty = set()
+        self._spilled = {}
+        self._lock = threading.RLock()
+
+    @property
+    def spill_dir(self) -> pathlib.Path:
+        if self._spill_dir is None:
+            self._tmpdir = tempfile.TemporaryDirectory(prefix="bandapi-content-")
+            self._spill_dir = pathlib.Path(self._tmpdir.name)
+        self._spill_dir.mkdir(parents=True, exist_ok=True)
+        return self._spill_dir
+
+    @property
+    def content_state(self):
+        return "Lazy"
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self)} materials, {len(self._cached)} in memory)"
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        return iter(list(self._names))
+
+    def __contains__(self, name):
+        return name in self._name_set
+
+    def _check(self, name, atoms: ase.Atoms):
+        if not atoms.pbc.any():
+            raise TypeError(f"ase.Atoms {name} is not a proper pbc system. Check your data.")
+
+    def _remember(self, name, atoms, dirty=False):
+        self._cached[name] = atoms
+        self._cached.move_to_end(name)
+        if dirty:
+            self._dirty.add(name)
+        while len(self._cached) > self.max_cached:
+            old_name, old_atoms = self._cached.popitem(last=False)
+            if old_name in self._dirty:
+                self._spill(old_name, old_atoms)
+
+    def _spill(self, name, atoms):
+        file = self._spilled.get(name) or self.spill_dir / f"{uuid.uuid4().hex}.pkl"
+        with open(file, "wb") as f:
+            pickle.dump(atoms, f)
+        self._spilled[name] = file
+        self._dirty.discard(name)
+
+    def _load_spilled(self, name):
+        with open(self._spilled[name], "rb") as f:
+            return pickle.load(f)
+
+    def _load(self, names) -> dict:
+        loaded = {}
+        for name in names:
+            if name in self._spilled:
+                loaded[name] = self._load_spilled(name)
+        from_source = [name for name in names if name not in loaded]
+        if from_source:
+            loaded.update(self.source.load_many(from_source))
+        for name, atoms in loaded.items():
+            self._check(name, atoms)
+        return loaded
+
+    def _get_local(self, name):
+        """
+        Atoms in memory or spilled, None if they should be loaded from source. Call it with the lock held.
+        """
+        if name in self._cached:
+            self._cached.move_to_end(name)
+            return self._cached[name]
+        if name in self._spilled:
+            atoms = self._load_spilled(name)
+            self._remember(name, atoms)
+            return atoms
+        return None
+
+    def __getitem__(self, name) -> ase.Atoms:
+        with self._lock:
+            if name not in self._name_set:
+                raise KeyError(name)
+            atoms = self._get_local(name)
+        if atoms is not None:
+            return atoms
+        loaded = self.source.load_many([name])
+        if name not in loaded:
+            raise KeyError(f"Structure of {name} is not found in {self.source}.")
+        self._check(name, loaded[name])
+        with self._lock:
+            atoms = self._get_local(name)  # set or loaded by another thread meanwhile
+            if atoms is not None:
+                return atoms
+            self._remember(name, loaded[name])
+            return loaded[name]
+
+    def __setitem__(self, name, atoms: ase.Atoms):
+        self._check(name, atoms)
+        with self._lock:
+            if name not in self._name_set:
+                self._names.append(name)
+                self._name_set.add(name)
+            self._remember(name, atoms, dirty=True)
+
+    def __delitem__(self, name):
+        with self._lock:
+            if name not in self._name_set:
+                raise KeyError(name)
+            self._names.remove(name)
+            self._name_set.discard(name)
+            self._cached.pop(name, None)
+            self._dirty.discard(name)
+            spilled = self._spilled.pop(name, None)
+            if spilled is not None:
+                spilled.unlink()
+
+    def iter_chunks(self, chunk_size=None, names=None):
+        """
+        :param names: names to iterate, default to all.
+        :return: generator of list of (name, atoms), atoms of one chunk are loaded at once.
+            Names whose structure is not found in source raise RuntimeError, or are skipped with a warning,
+            see `missing`.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        with self._lock:
+            names = list(self._names) if names is None else [name for name in names if name in self._name_set]
+        for idx in range(0, len(names), chunk_size):
+            chunk = names[idx:idx + chunk_size]
+            items, missing = [], []
+            with self._lock:
+                loaded = self._load([name for name in chunk if name not in self._cached])
+                for name in chunk:
+                    if name in self._cached:
+                        items.append((name, self._cached[name]))
+                    elif name in loaded:
+                        self._remember(name, loaded[name])
+                        items.append((name, loaded[name]))
+                    else:
+                        missing.append(name)
+            if missing:
+                if self.missing == "raise":
+                    raise RuntimeError(f"Structures of {missing} are not found in {self.source}.")
+                logger.warning(f"Skip {len(missing)} materials without structure in {self.source}: {missing}")
+            yield items
+
+    def items(self):
+        for chunk in self.iter_chunks():
+            yield from chunk
+
+    def values(self):
+        for _, atoms in self.items():
+            yield atoms
+
+
+class TaskContentSubset(Mapping, TaskContent):
+    def __init__(self, task_content, names):
+        """
+        Read-only view of some materials of a task content, e.g. the materials finished before a state of
+        `DAGScheduler` which runs over all of them. Atoms of a `LazyAtomsContentDict` are loaded in chunks by `items()`.
+
+        :param task_content: dict-like of name -> ase.Atoms.
+        :param names: names in the view.
+        """
+        self.task_content = task_content
+        self._names = [name for name in dict.fromkeys(names) if name in task_content]
+        self._name_set = set(self._names)
+
+    @property
+    def content_state(self):
+        return "Subset"
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self)} of {self.task_content!r})"
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __contains__(self, name):
+        return name in self._name_set
+
+    def __getitem__(self, name) -> ase.Atoms:
+        if name not in self._name_set:
+            raise KeyError(name)
+        return self.task_content[name]
+
+    def items(self):
+        if isinstance(self.task_content, LazyAtomsContentDict):
+            for chunk in self.task_content.iter_chunks(names=self._names):
+                yield from chunk
+        else:
+            for name in self._names:
+                yield name, self.task_content[name]
+
+    def values(self):
+        for _, atoms in self.items():
+            yield atoms
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : chg.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+import hashlib
+import io
+import mmap
+import pathlib
+from collections import namedtuple
+
+import numpy as np
+
+"""
+Charge density files `SPIN*_CHG` of ABACUS.
+
+The text file is a structure header, then `nspin`, Fermi energy and `nx ny nz` lines, then nx*ny*nz values.
+`pack_abacus_chg` converts it into a compressed `.npz` with a checksum of values,
+and `unpack_abacus_chg` converts it back to ABACUS text.
+On the compute side, where bandapi may not be installed, the standalone `UnpackScript` does the same
+with the python standard library only: `python unpack_chg.py OUT.ABACUS/SPIN1_CHG.npz`.
+"""
+
+ChargeDensity = namedtuple("ChargeDensity", ["header", "shape", "values", "precision"])
+PackedSuffix = ".npz"
+UnpackScript = pathlib.Path(__file__).with_name("unpack_chg.py")
+
+
+def read_abacus_chg(chg_file) -> ChargeDensity:
+    """
+    Read ABACUS charge density file. The file is memory-mapped, values are parsed into one array.
+
+    :param chg_file: path of `SPIN*_CHG`
+    :return: ChargeDensity, `header` is the text before values, `shape` is (nx, ny, nz),
+        `values` is the flat array in order of file, `precision` is the number of digits after decimal point in file.
+    """
+    with open(chg_file, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header_lines = []
+            coord_line = None
+            natoms = None
+            while True:
+                line = mm.readline()
+                if not line:
+                    raise ValueError(f"Incomplete header of charge density file {chg_file}.")
+                header_lines.append(line)
+                if coord_line is None and line.strip().split()[:1] in [[b"Direct"], [b"Cartesian"]]:
+                    coord_line = len(header_lines) - 1
+                    natoms = sum(map(int, header_lines[-2].split()))
+                elif coord_line is not None and len(header_lines) == coord_line + natoms + 4:
+                    break
+            shape = tuple(map(int, header_lines[-1].split()[:3]))
+            data_offset = mm.tell()
+            first_value = mm[data_offset:data_offset + 64].split()[0]
+            try:
+                values = np.array(mm[data_offset:].split(), dtype=np.float64)
+            except ValueError as e:
+                raise ValueError(f"Non-numeric value in grid of charge density file {chg_file}: {e}") from None
+    if values.shape[0] != shape[0] * shape[1] * shape[2]:
+        raise ValueError(f"Expect {shape[0] * shape[1] * shape[2]} values of grid {shape} in {chg_file}, got {values.shape[0]}.")
+    mantissa = first_value.lower().split(b"e")[0]
+    precision = len(mantissa.split(b".")[-1]) if b"." in mantissa else 0
+    return ChargeDensity(b"".join(header_lines).decode(), shape, values, precision)
+
+
+def render_abacus_chg(chg: ChargeDensity, precision=None) -> bytes:
+    """
+    Render charge density as ABACUS text, 8 values per line.
+
+    :param ChargeDensity chg:
+    :param int precision: digits after decimal point, default to precision of the file read.
+    :return: bytes
+    """
+    precision = chg.precision if precision is None else precision
+    buffer = io.BytesIO()
+    buffer.write(chg.header.encode())
+    values = np.asarray(chg.values, dtype=np.float64)
+    nfull = values.shape[0] // 8 * 8
+    if nfull:
+        np.savetxt(buffer, values[:nfull].reshape([-1, 8]), fmt=f"%.{precision}e", delimiter=" ")
+    if nfull < values.shape[0]:
+        np.savetxt(buffer, values[None, nfull:], fmt=f"%.{precision}e", delimiter=" ")
+    return buffer.getvalue()
+
+
+def write_abacus_chg(chg_file, chg: ChargeDensity, precision=None):
+    with open(chg_file, "wb") as f:
+        f.write(render_abacus_chg(chg, precision=precision))
+
+
+def values_checksum(values):
+    return hashlib.sha256(np.ascontiguousarray(values, dtype=np.float64).tobytes()).hexdigest()
+
+
+def pack_abacus_chg(chg_file, packed_file=None, dtype=np.float64):
+    """
+    Pack ABACUS charge density file into compressed `.npz` with sha256 checksum of values.
+
+    :param chg_file: path of `SPIN*_CHG`
+    :param packed_file: default to `<chg_file>.npz`
+    :param dtype: float64 is lossless, float32 halves the size.
+    :return: path of packed file.
+    """
+    chg = read_abacus_chg(chg_file)
+    packed_file = pathlib.Path(packed_file) if packed_file else pathlib.Path(str(chg_file) + PackedSuffix)
+    values = chg.values.astype(dtype)
+    with open(packed_file, "wb") as f:
+        np.savez_compressed(
+            f,
+            header=np.array(chg.header),
+            shape=np.array(chg.shape),
+            values=values,
+            precision=np.array(chg.precision),
+            checksum=np.array(values_checksum(values)),
+        )
+    return packed_file
+
+
+def load_packed_chg(packed_file, verify=True) -> ChargeDensity:
+    """
+    Load packed charge density.
+
+    :param bool verify: check values with stored checksum, raise ValueError if it mismatches.
+    """
+    with np.load(packed_file) as data:
+        chg = ChargeDensity(str(data["header"]), tuple(data["shape"].tolist()), data["values"], int(data["precision"]))
+        checksum = str(data["checksum"])
+    if verify and values_checksum(chg.values) != checksum:
+        raise ValueError(f"Checksum of {packed_file} mismatch, it may be broken.")
+    return chg
+
+
+def verify_packed_chg(packed_file):
+    try:
+        load_packed_chg(packed_file, verify=True)
+    except (ValueError, OSError, KeyError):
+        return False
+    return True
+
+
+def unpack_abacus_chg(packed_file, chg_file=None):
+    """
+    Convert packed charge density back to ABACUS text.
+
+    :param packed_file:
+    :param chg_file: default to `packed_file` without `.npz`.
+    :return: path of charge density file.
+    """
+    packed_file = pathlib.Path(packed_file)
+    chg_file = pathlib.Path(chg_file) if chg_file else packed_file.with_name(packed_file.name[:-len(PackedSuffix)])
+    write_abacus_chg(chg_file, load_packed_chg(packed_file))
+    return chg_file
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pack or unpack ABACUS charge density files.")
+    parser.add_argument("action", choices=["pack", "unpack"])
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+    for file in args.files:
+        if args.action == "pack":
+            pack_abacus_chg(file)
+        else:
+            unpack_abacus_chg(file)
@@ -6,7 +6,9 @@
 # ALL RIGHTS ARE RESERVED UNLESS STATED.
 # ====================================== #
 import pathlib
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+
+import numpy as np
 
 # Established based on OUT.ABACUS/INPUT
 # Note: maximum of key is 30, if more, modify last line "{key: <30}"
@@ -504,30 +506,212 @@ AbacusInputBlock = OrderedDict({
 })
 
 
+# Type of values, keys not listed are str.
+# Flags of ABACUS are 0/1, they are int.
+AbacusInputKeyType = {
+    **dict.fromkeys([
+        "ntype", "nspin", "nbands", "nbands_sto", "nbands_istate", "nche_sto", "symmetry",
+        "diago_cg_maxiter", "diago_cg_prec", "out_charge", "out_potential", "out_wf", "out_dos", "out_band",
+        "nx", "ny", "nz", "niter", "force_set", "nstep", "out_stru", "stress", "out_dm", "out_descriptor",
+        "lmax_descriptor", "new_dm", "search_pbc", "out_hs", "out_lowf", "bx", "by", "bz", "mixing_ndim",
+        "gamma_only", "diago_proc", "npool", "mem_saver", "printe", "selinv_npole", "selinv_niter",
+        "md_mdtype", "mnhc", "md_dumpmdfred", "md_rstmd", "md_fixtemperature", "efield", "edir",
+        "out_alllog", "nurse", "colour", "t_in_h", "vl_in_h", "vnl_in_h", "test_force", "test_stress",
+        "mlwf_flag", "opt_epsilon2", "opt_nbands", "nomega", "nq", "ocp", "lcao_box", "mulliken",
+        "noncolin", "lspinorb", "exx_separate_loop", "exx_hybrid_step", "exx_distribute_type",
+        "exx_opt_orb_lmax", "td_val_elec_01", "td_val_elec_02", "td_val_elec_03", "td_vext",
+        "td_vext_dire", "td_vexttype", "td_vextout", "td_dipoleout", "berry_phase", "gdir", "towannier90",
+    ], int),
+    **dict.fromkeys([
+        "nelec", "ecutwfc", "ethr", "dr2", "force_thr", "force_thr_ev", "force_thr_ev2", "stress_thr",
+        "press1", "press2", "press3", "bfgs_w1", "bfgs_w2", "trust_radius_max", "trust_radius_min",
+        "trust_radius_ini", "search_radius", "lcao_ecut", "lcao_dk", "lcao_dr", "lcao_rmax", "sigma",
+        "mixing_beta", "mixing_gg0", "dos_emin_ev", "dos_emax_ev", "dos_edelta_ev", "dos_sigma",
+        "selinv_temp", "selinv_gap", "selinv_deltae", "selinv_mu", "selinv_threshold", "md_dt", "md_qmass",
+        "md_tfirst", "md_tlast", "md_ediff", "md_ediffg", "emaxpos", "eopreg", "eamp", "eamp_v",
+        "vdw_s6", "vdw_s8", "vdw_a1", "vdw_a2", "vdw_d", "vdw_radius", "vdw_cn_thr", "eta", "domega",
+        "ecut_chi", "fermi_level", "exx_hybrid_alpha", "exx_hse_omega", "exx_lambda", "exx_pca_threshold",
+        "exx_c_threshold", "exx_v_threshold", "exx_dm_threshold", "exx_schwarz_threshold",
+        "exx_cauchy_threshold", "exx_ccp_threshold", "exx_ccp_rmesh_times", "exx_opt_orb_ecut",
+        "exx_opt_orb_tolerenc", "td_dr2", "td_dt", "td_force_dt", "td_timescale",
+    ], float),
+}
+
+InputKeySchema = namedtuple("InputKeySchema", ["block", "order", "type"])
+
+
+def _compile_input_schema():
+    """
+    Compile `AbacusInputKeyDict`, `BlockComments` and `AbacusInputKeyType` into key -> InputKeySchema,
+    `order` is the global position of key in INPUT, so sorting keys by it gives blocks and keys in order.
+    """
+    schema = {}
+    for block in BlockComments:
+        for key in AbacusInputKeyDict[block]:
+            if AbacusInputBlock.get(key) != block:
+                raise ValueError(f"Key {key} is in block {block} of AbacusInputKeyDict but {AbacusInputBlock.get(key)} of AbacusInputBlock.")
+            schema[key] = InputKeySchema(block, len(schema), AbacusInputKeyType.get(key, str))
+    return schema
+
+
+AbacusInputSchema = _compile_input_schema()
+
+
+class InputInt(int):
+    """
+    int of INPUT written as its original text, e.g. `nbands 060`.
+    """
+
+    def __new__(cls, text):
+        value = super(InputInt, cls).__new__(cls, text)
+        value.text = str(text)
+        return value
+
+    def __str__(self):
+        return self.text
+
+    def __format__(self, format_spec):
+        return self.text if not format_spec else int.__format__(self, format_spec)
+
+
+class InputFloat(float):
+    """
+    float of INPUT written as its original text, e.g. `dr2 1.0e-9` instead of `1e-09`.
+    """
+
+    def __new__(cls, text):
+        value = super(InputFloat, cls).__new__(cls, text)
+        value.text = str(text)
+        return value
+
+    def __str__(self):
+        return self.text
+
+    def __format__(self, format_spec):
+        return self.text if not format_spec else float.__format__(self, format_spec)
+
+
+def coerce_input_value(key, value):
+    """
+    Coerce value of INPUT key to the type of schema.
+
+    int and float are parsed from str, integral value of float key is kept as int, so `ecutwfc 50` is not
+    written back as `50.0`. A number whose text differs from python's (e.g. `1.0e-9`, `60.00`) is an
+    `InputFloat` or `InputInt`, which is written back as the original text.
+    Values which cannot be coerced, e.g. a list of `ocp_set`, are kept as they are.
+
+    :raise KeyError: unknown key.
+    """
+    try:
+        key_type = AbacusInputSchema[key].type
+    except KeyError:
+        raise KeyError(f"Invalid Input Key for ABACUS: {key}")
+    if value is None or key_type is str:
+        return value
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            number = int(text)
+            return number if str(number) == text else InputInt(text)
+        except ValueError:
+            pass
+        if key_type is float:
+            try:
+                number = float(text)
+                return number if str(number) == text else InputFloat(text)
+            except ValueError:
+                pass
+        return value
+    return value
+
+
+def validate_abacus_input(input_para_dict: dict, coerce=True) -> dict:
+    """
+    Check keys and types of values of INPUT.
+
+    :param dict input_para_dict:
+    :param bool coerce: coerce str values by `coerce_input_value`, else a str value of int or float key raises TypeError.
+    :return: new dict of validated values in order of INPUT.
+    :raise KeyError: unknown key.
+    :raise TypeError: value is not of the type of key.
+    """
+    validated = {}
+    for key in sorted(input_para_dict, key=_input_key_order):
+        value = coerce_input_value(key, input_para_dict[key]) if coerce else input_para_dict[key]
+        key_type = AbacusInputSchema[key].type
+        if value is not None and key_type is not str:
+            if isinstance(value, bool) or not isinstance(value, (int, float, np.integer, np.floating)) \
+                    or (key_type is int and not isinstance(value, (int, np.integer))):
+                raise TypeError(f"Value of ABACUS Input Key {key} should be {key_type.__name__}, got {value!r}.")
+        validated[key] = value
+    return validated
+
+
+def _input_key_order(key):
+    try:
+        return AbacusInputSchema[key].order
+    except KeyError:
+        raise KeyError(f"Invalid Input Key for ABACUS: {key}")
+
+
+def render_abacus_input(
+        input_para_dict: dict
+) -> bytes:
+    """
+    Render ABACUS INPUT file in memory.
+
+    :param dict input_para_dict: key and value of INPUT, value of None is skipped.
+    :return: bytes of INPUT file.
+    """
+    lines = ["INPUT_PARAMETERS\n"]
+    block = None
+    for key in sorted(input_para_dict, key=_input_key_order):
+        if AbacusInputSchema[key].block != block:
+            block = AbacusInputSchema[key].block
+            lines.append(f"{BlockComments[block]}\n")
+        if input_para_dict[key] is not None:
+            lines.append(f"{key: <30}{input_para_dict[key]}\n")
+    return "".join(lines).encode()
+
+
+def parse_abacus_input(content) -> dict:
+    """
+    Parse content of INPUT file, values are coerced by schema.
+
+    Comments after `#` are dropped. Values are written back by `render_abacus_input` as their text in content,
+    so for INPUT written by `write_abacus_input`, `render_abacus_input(parse_abacus_input(content)) == content`,
+    and a hand-edited INPUT is rendered with the same values in the layout of `render_abacus_input`.
+
+    :param content: str or bytes of INPUT.
+    :return: dict of key -> value in order of file.
+    :raise KeyError: unknown key.
+    """
+    if isinstance(content, bytes):
+        content = content.decode()
+    input_para_dict = {}
+    for line in content.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if not line or line == "INPUT_PARAMETERS":
+            continue
+        words = line.split(None, 1)
+        input_para_dict[words[0]] = coerce_input_value(words[0], words[1] if len(words) > 1 else "")
+    return input_para_dict
+
+
+def read_abacus_input(input_file) -> dict:
+    """
+    Read ABACUS INPUT file, see `parse_abacus_input`.
+    """
+    with open(input_file, "rb") as f:
+        return parse_abacus_input(f.read())
+
+
 def write_abacus_input(
         task_root: str,
         input_para_dict: dict,
         input_name="INPUT"
 ):
     assert input_name=="INPUT"
-    all_input_keys = input_para_dict.keys()
-    input_blocks = list()
-    for key in all_input_keys:
-        try:
-            input_blocks.append(AbacusInputBlock[key])
-        except KeyError:
-            raise KeyError(f"Invalid Input Key for ABACUS: {key}")
-    sortkey=input_blocks.index
-    input_blocks_new = list(set(input_blocks))
-    input_blocks_new.sort(key=list(BlockComments.keys()).index)
-    input_blocks=input_blocks_new
-
-    with open(pathlib.Path(task_root) / input_name, "w") as f:
-        print("INPUT_PARAMETERS", file=f)
-        for block in input_blocks:
-            print(BlockComments[block], file=f)
-            for key in AbacusInputKeyDict[block]:
-                if key in all_input_keys:
-                    if input_para_dict[key] is not None:
-                        print(f"{key: <30}{input_para_dict[key]}", file=f)
-
+    content = render_abacus_input(input_para_dict)
+    with open(pathlib.Path(task_root) / input_name, "wb") as f:
+        f.write(content)
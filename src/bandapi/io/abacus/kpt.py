@@ -27,10 +27,15 @@ AbacusKptBlock = {
 }
 
 
-def write_abacus_kpt(
-        task_root: str,
+def render_abacus_kpt(
         kpt_para_dict: dict
-):
+) -> bytes:
+    """
+    Render ABACUS KPT file in memory.
+
+    :param dict kpt_para_dict: with keys `number_of_kpt`, `mode` and `content`.
+    :return: bytes of KPT file.
+    """
     all_kpt_keys = kpt_para_dict.keys()
     kpt_blocks = set()
 
@@ -40,16 +45,24 @@ def write_abacus_kpt(
         except KeyError:
             raise KeyError(f"Invalid kpt Key for ABACUS: {key}")
 
-    with open(pathlib.Path(task_root) / "KPT", "w") as f:
-        print("K_POINTS", file=f)
-        number_of_kpt = int(kpt_para_dict["number_of_kpt"])
-        print(number_of_kpt, file=f)
-        if number_of_kpt == 0:  # generate automatically
-            print(generate_kpt_with_MP(kpt_para_dict), file=f)
-        elif number_of_kpt > 0:
-            print(generate_kpt_manually(kpt_para_dict), file=f)
-        else:
-            ValueError(f"What's the number_of_kpt {number_of_kpt} mean?")
+    number_of_kpt = int(kpt_para_dict["number_of_kpt"])
+    lines = f"K_POINTS\n{number_of_kpt}\n"
+    if number_of_kpt == 0:  # generate automatically
+        lines += generate_kpt_with_MP(kpt_para_dict) + "\n"
+    elif number_of_kpt > 0:
+        lines += generate_kpt_manually(kpt_para_dict) + "\n"
+    else:
+        raise ValueError(f"What's the number_of_kpt {number_of_kpt} mean?")
+    return lines.encode()
+
+
+def write_abacus_kpt(
+        task_root: str,
+        kpt_para_dict: dict
+):
+    content = render_abacus_kpt(kpt_para_dict)
+    with open(pathlib.Path(task_root) / "KPT", "wb") as f:
+        f.write(content)
 
 
 def generate_kpt_with_MP(kpt_para_dict):
@@ -59,7 +72,7 @@ def generate_kpt_with_MP(kpt_para_dict):
     elif kpt_para_dict["mode"] == "MP":
         lines += "MP\n"
     else:
-        KeyError(f"Invalid kpt method Key for Monkhorst-Pack method in ABACUS: {kpt_para_dict['mode']}. It should be `Gamma' or `MP'")
+        raise KeyError(f"Invalid kpt method Key for Monkhorst-Pack method in ABACUS: {kpt_para_dict['mode']}. It should be `Gamma' or `MP'")
 
     kpt_mode_content = kpt_para_dict["content"]
     if isinstance(kpt_mode_content, list):
@@ -71,43 +84,79 @@ def generate_kpt_with_MP(kpt_para_dict):
     return lines
 
 
+ExplicitKptModes = ["Direct", "Cartesian"]
+LineKptModes = ["Line", "Line_Cartesian"]
+
+
+def format_kpt_lines(kpt_lines, line_mode=False):
+    """
+    Format a (nk, 4) array of `kx ky kz weight` (or `kx ky kz number_of_points` for band lines)
+    in one string operation.
+
+    :param np.ndarray kpt_lines:
+    :param bool line_mode: last column is the integer number of points of band line.
+    :return: str
+    """
+    kpt_lines = np.asarray(kpt_lines, dtype=float)
+    line_fmt = "%r %r %r %d\n" if line_mode else "%r %r %r %r\n"
+    return (line_fmt * kpt_lines.shape[0]) % tuple(kpt_lines.ravel().tolist())
+
+
 def generate_kpt_manually(kpt_para_dict):
-    lines = ""
-    calculate_band = False
-    if kpt_para_dict["mode"] == "Direct":
-        lines += "Direct\n"
-
-    elif kpt_para_dict["mode"] == "Cartesian":
-        lines += "Cartesian\n"
-
-    elif kpt_para_dict["mode"] == "Line":
-        lines += "Line\n"
-        calculate_band = True
-    elif kpt_para_dict["mode"] == "Line_Cartesian":
-        lines += "Line_Cartesian\n"
-        calculate_band = True
-    else:
-        KeyError(f"Invalid kpt method Key for manual method in ABACUS: {kpt_para_dict['mode']}. It should be `Direct' and `Cartesian' for explicitly k-point, or 'Line' and 'Line_Cartesian' for band-structure calculations")
+    mode = kpt_para_dict["mode"]
+    if mode not in ExplicitKptModes + LineKptModes:
+        raise KeyError(f"Invalid kpt method Key for manual method in ABACUS: {mode}. It should be `Direct' and `Cartesian' for explicitly k-point, or 'Line' and 'Line_Cartesian' for band-structure calculations")
+    calculate_band = mode in LineKptModes
 
     kpt_mode_content = kpt_para_dict["content"]
     kpt_num = int(kpt_para_dict["number_of_kpt"])
-    if calculate_band:
-        if isinstance(kpt_mode_content, list):
-            if len(kpt_mode_content) == kpt_num:
-                for content_line in kpt_mode_content:
-                    assert len(content_line) == 4, f"Each kpt_mode_content in ABACUS KPT file need 4 numbers when using method {kpt_para_dict['mode']}."
-                    lines += f"{content_line[0]} {content_line[1]} {content_line[2]} {content_line[3]}\n"
-            else:
-                raise ValueError(f"kpt_mode_content[\"content\"] is list and has wrong shape: {len(lat_vec)} != ele_num of {atom}:{kpt_num}.")
-        elif isinstance(kpt_mode_content, np.ndarray):
-            assert kpt_mode_content.shape == (kpt_num, 4), f"kpt_mode_content in ABACUS KPT file need 4 numbers and {kpt_num} lines when using method {kpt_para_dict['mode']}. Got {kpt_mode_content.shape}."
-            for line_idx in range(kpt_num):
-                lines += f"{kpt_mode_content[line_idx][0]} {kpt_mode_content[line_idx][1]} {kpt_mode_content[line_idx][2]} {int(kpt_mode_content[line_idx][3])}\n"
-        else:
-            raise TypeError(f"Except list or np.ndarray for kpt_mode_content, got {type(kpt_mode_content)} instead.")
+    if not isinstance(kpt_mode_content, (list, np.ndarray)):
+        raise TypeError(f"Except list or np.ndarray for kpt_mode_content, got {type(kpt_mode_content)} instead.")
+    kpt_mode_content = np.asarray(kpt_mode_content, dtype=float)
+    if not calculate_band and kpt_mode_content.ndim == 2 and kpt_mode_content.shape[1] == 3:
+        # k-points without weights are weighted equally
+        kpt_mode_content = np.concatenate([kpt_mode_content, np.full([kpt_mode_content.shape[0], 1], 1.0 / max(kpt_num, 1))], axis=-1)
+    if kpt_mode_content.shape != (kpt_num, 4):
+        raise ValueError(f"kpt_mode_content in ABACUS KPT file need 4 numbers and {kpt_num} lines when using method {mode}. Got {kpt_mode_content.shape}.")
+    return f"{mode}\n" + format_kpt_lines(kpt_mode_content, line_mode=calculate_band)
+
+
+def parse_abacus_kpt(content) -> dict:
+    """
+    Parse content of KPT file into kpt_para_dict of `write_abacus_kpt`.
+
+    :param content: str or bytes of KPT.
+    :return: dict with `number_of_kpt`, `mode` and `content`. `content` is a list of 6 int for `Gamma` and `MP`,
+        or a (nk, 4) np.ndarray for explicit k-points and band lines, comments after `#` (e.g. labels) are dropped.
+    :raise ValueError: malformed KPT.
+    """
+    if isinstance(content, bytes):
+        content = content.decode()
+    lines = content.splitlines()
+    if not lines or lines[0].strip() != "K_POINTS":
+        raise ValueError("KPT file should begin with `K_POINTS'.")
+    number_of_kpt = int(lines[1].split()[0])
+    mode = lines[2].strip()
+    if number_of_kpt == 0:
+        kpt_mode_content = [int(item) for item in lines[3].split()[:6]]
     else:
-        raise NotImplementedError("Explicitly k-point is not ready for use.")
-    return lines
+        kpt_lines = [line.split("#", 1)[0].split()[:4] for line in lines[3:3 + number_of_kpt]]
+        if len(kpt_lines) != number_of_kpt or any(len(item) != 4 for item in kpt_lines):
+            raise ValueError(f"Expect {number_of_kpt} lines of 4 numbers in KPT, got {[len(item) for item in kpt_lines]} numbers of lines.")
+        kpt_mode_content = np.array(kpt_lines, dtype=float)
+    return {
+        "number_of_kpt": number_of_kpt,
+        "mode": mode,
+        "content": kpt_mode_content,
+    }
+
+
+def read_abacus_kpt(kpt_file) -> dict:
+    """
+    Read ABACUS KPT file, see `parse_abacus_kpt`.
+    """
+    with open(kpt_file, "rb") as f:
+        return parse_abacus_kpt(f.read())
 
 
 if __name__ == '__main__':
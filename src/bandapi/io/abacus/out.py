@@ -5,119 +5,401 @@
 # @File    : out.py
 # ALL RIGHTS ARE RESERVED UNLESS STATED.
 # ====================================== #
+import contextlib
+import json
+import mmap
 import pathlib
 import re
+import time
+from collections import namedtuple
 
 import numpy as np
 from ase.atoms import Atoms
+from ase.constraints import FixCartesian
 from ase.units import Angstrom, Bohr
 
 BandPointPattern = re.compile(r"k-points(.*\d)")
 BandValuePattern = re.compile(r"spin[\d+]_final_band(.*\d)")
 EFermi_Pattern = re.compile(r"E_Fermi(.*\d)")
+FinishedLogPattern = re.compile(rb"Total\s+Time\s*:")  # last line of a finished run
+ScfConvergedPattern = re.compile(rb"charge density convergence is achieved", re.IGNORECASE)
+ScfNotConvergedPattern = re.compile(rb"convergence has not been achieved", re.IGNORECASE)
+RelaxConvergedPattern = re.compile(rb"relaxation is converged", re.IGNORECASE)
+NspinPattern = re.compile(rb"^\s*nspin\s*=\s*(\d+)", re.IGNORECASE | re.MULTILINE)
 
 
-def read_stru(stru_file):
+StruData = namedtuple("StruData", ["symbols", "cell", "positions", "move", "magnetism"])
+
+
+def _is_number(word):
+    try:
+        float(word)
+    except ValueError:
+        return False
+    return True
+
+
+def _parse_atom_line(line):
+    """
+    Parse a position line with per-atom keywords, e.g. `0.0 0.0 0.0 m 1 1 0 v 0.1 0 0 mag 1.0`.
+    Move flags (bare after the coordinates, or after `m`) and `mag`/`magmom` are collected, other keywords
+    (`v`, `angle1`, `angle2`, `lambda`, `sc`, ...) and their values are skipped.
+
+    :return: (x, y, z, move_x, move_y, move_z), magnetism (None, float or list of 3 float)
+    """
+    words = line.split("#", 1)[0].split()
+    if len(words) < 3:
+        raise ValueError(f"Expect 3 coordinates in STRU line: {line!r}")
+    values = [float(item) for item in words[:3]]
+    move = [1.0, 1.0, 1.0]
+    magnetism = None
+    idx = 3
+    key = "m"  # bare numbers after the coordinates are move flags
+    while idx <= len(words):
+        numbers = []
+        while idx < len(words) and _is_number(words[idx]):
+            numbers.append(float(words[idx]))
+            idx += 1
+        if key == "m" and numbers:
+            if len(numbers) != 3:
+                raise ValueError(f"Expect 3 move flags in STRU line: {line!r}")
+            move = numbers
+        elif key in ["mag", "magmom"]:
+            if len(numbers) not in [1, 3]:
+                raise ValueError(f"Expect 1 or 3 values of {key} in STRU line: {line!r}")
+            magnetism = numbers[0] if len(numbers) == 1 else numbers
+        if idx == len(words):
+            break
+        key = words[idx].lower()
+        idx += 1
+    return values + move, magnetism
+
+
+def _parse_stru(stru_file):
+    """
+    Parse STRU into arrays, positions of each species block are converted in one array operation.
+    Blocks with per-atom keywords (`m`, `v`, `mag`, ...) are parsed line by line, see `_parse_atom_line`.
+
+    :return: StruData, `cell` and `positions` in Angstrom, `move` is the (natoms, 3) move flags,
+        `magnetism` is the (natoms,) magnetism of species or atoms, (natoms, 3) if any atom has a vector `mag`.
+    """
+    with open(stru_file, "r") as f:
+        lines = f.read().splitlines()
     lat_const = None
-    cell = []
-    atom_list = []
+    cell = None
     pos_type = None
-    pos_list = []
-    f = open(stru_file)
-    content = f.readline()
-    try:
-        while content:
-            if content.startswith("LATTICE_CONSTANT"):
-                content = f.readline()
-                lat_const = float(content) * Bohr / Angstrom
-            elif content.startswith("LATTICE_VECTORS"):
-                content = f.readline()
-                cell.append(list(map(float, content.split()[:3])))
-                content = f.readline()
-                cell.append(list(map(float, content.split()[:3])))
-                content = f.readline()
-                cell.append(list(map(float, content.split()[:3])))
-                cell = np.array(cell, dtype=np.double) * lat_const
-            elif content.startswith("ATOMIC_POSITIONS"):
-                content = f.readline()
-                pos_type = content.split()[0]
-                content = f.readline()
-                while content:
-                    if not content.isspace():
-                        atom_name = content.split()[0]
-                        content = f.readline()  # TODO:read magnetism
-                        content = f.readline()
-                        atom_num = int(content.split()[0])
-                        for i in range(atom_num):
-                            atom_list.append(atom_name)
-                            content = f.readline()
-                            pos_one = np.array(list(map(float, content.split()[:3])))
-                            if pos_type == "Direct":
-                                pos_list.append(pos_one @ cell)
-                            elif pos_type == "Cartesian":
-                                pos_list.append(pos_one * lat_const)
-                            else:
-                                raise NotImplementedError(f"Unknown ATOMIC_POSITIONS type: {pos_type}")
-                        content = f.readline()
-                    else:
-                        content = f.readline()
-
-            content = f.readline()
-    except EOFError:
-        pass
-    atoms = Atoms(
-        symbols=atom_list,
-        positions=pos_list,
+    symbols = []
+    magnetism = []
+    blocks = []
+    idx = 0
+    while idx < len(lines):
+        content = lines[idx].strip()
+        if content.startswith("LATTICE_CONSTANT"):
+            lat_const = float(lines[idx + 1].split()[0]) * Bohr / Angstrom
+            idx += 2
+        elif content.startswith("LATTICE_VECTORS"):
+            cell = np.array([item.split()[:3] for item in lines[idx + 1:idx + 4]], dtype=np.double) * lat_const
+            idx += 4
+        elif content.startswith("ATOMIC_POSITIONS"):
+            pos_type = lines[idx + 1].split()[0]
+            if pos_type not in ["Direct", "Cartesian"]:
+                raise NotImplementedError(f"Unknown ATOMIC_POSITIONS type: {pos_type}")
+            idx += 2
+            while idx < len(lines):
+                if lines[idx].isspace() or not lines[idx]:
+                    idx += 1
+                    continue
+                atom_name = lines[idx].split()[0]
+                atom_mag = float(lines[idx + 1].split()[0])
+                atom_num = int(lines[idx + 2].split()[0])
+                block = lines[idx + 3:idx + 3 + atom_num]
+                if len(block) != atom_num:
+                    raise ValueError(f"Expect {atom_num} positions of {atom_name} in {stru_file}, got {len(block)}.")
+                values = " ".join(block).split()
+                atom_mags = [atom_mag] * atom_num
+                try:
+                    numbers = np.array(values, dtype=float)
+                except ValueError:  # per-atom keywords
+                    numbers = None
+                if numbers is not None and numbers.shape[0] == atom_num * 6:
+                    block = numbers.reshape([atom_num, 6])
+                elif numbers is not None and numbers.shape[0] == atom_num * 3:
+                    block = np.concatenate([numbers.reshape([atom_num, 3]), np.ones([atom_num, 3])], axis=-1)
+                else:
+                    parsed = [_parse_atom_line(item) for item in block]
+                    block = np.array([item[0] for item in parsed], dtype=float)
+                    atom_mags = [atom_mag if item[1] is None else item[1] for item in parsed]
+                symbols.extend([atom_name] * atom_num)
+                magnetism.extend(atom_mags)
+                blocks.append(block)
+                idx += 3 + atom_num
+        else:
+            idx += 1
+    block = np.concatenate(blocks) if blocks else np.zeros([0, 6])
+    if pos_type == "Direct":
+        positions = block[:, :3] @ cell
+    else:
+        positions = block[:, :3] * lat_const
+    return StruData(
+        symbols=symbols,
         cell=cell,
+        positions=positions,
+        move=block[:, 3:6].astype(bool),
+        magnetism=_magnetism_array(magnetism)
+    )
+
+
+def _magnetism_array(magnetism):
+    """
+    (natoms,) array of scalar magnetism, or (natoms, 3) if any is a vector, scalars are along z.
+    """
+    if not any(isinstance(item, list) for item in magnetism):
+        return np.array(magnetism, dtype=float)
+    return np.array([item if isinstance(item, list) else [0.0, 0.0, item] for item in magnetism], dtype=float).reshape([-1, 3])
+
+
+def read_stru(stru_file):
+    """
+    Read ABACUS STRU as ase.Atoms.
+
+    Magnetism of species is set as initial magnetic moments, and atoms with move flag 0 are fixed
+    in that direction by `ase.constraints.FixCartesian`.
+
+    :param stru_file:
+    :return: ase.Atoms
+    """
+    stru = _parse_stru(stru_file)
+    atoms = Atoms(
+        symbols=stru.symbols,
+        positions=stru.positions,
+        cell=stru.cell,
         pbc=True
     )
+    if stru.magnetism.any():
+        atoms.set_initial_magnetic_moments(stru.magnetism)
+    fixed = ~stru.move
+    if fixed.any():
+        patterns, inverse = np.unique(fixed, axis=0, return_inverse=True)
+        atoms.set_constraint([
+            FixCartesian(np.flatnonzero(inverse.reshape(-1) == idx), mask=pattern)
+            for idx, pattern in enumerate(patterns) if pattern.any()
+        ])
     return atoms
 
 
-def read_band_in_log(log_file, atoms=None, _nspin=1, outputfile=None):
+def read_stru_trajectory(out_dir, pattern="STRU_ION*_D"):
     """
+    Read every ionic step of relax output `STRU_ION*_D` in `out_dir`.
 
-    :param log_file:
-    :param int _nspin:
-    :Warning: _nspin is not used.
-    :return: kpathArray,bandArray
+    Files are sorted by ionic step. `STRU_ION_D` without step number is used only when there are no numbered files.
+
+    :param out_dir: `OUT.ABACUS` directory.
+    :return: symbols, cells of shape (nstep, 3, 3) and positions of shape (nstep, natoms, 3), in Angstrom.
+    """
+    stru_files = {}
+    for stru_file in pathlib.Path(out_dir).glob(pattern):
+        step = re.search(r"(\d+)", stru_file.name[len("STRU_ION"):])
+        stru_files[int(step.group(1)) if step else None] = stru_file
+    if not stru_files:
+        raise FileNotFoundError(f"No {pattern} found in {out_dir}.")
+    steps = sorted(item for item in stru_files if item is not None) or [None]
+    strus = [_parse_stru(stru_files[step]) for step in steps]
+    if len(set(len(item.symbols) for item in strus)) > 1:
+        raise ValueError(f"Number of atoms changes between ionic steps in {out_dir}.")
+    return strus[0].symbols, np.stack([item.cell for item in strus]), np.stack([item.positions for item in strus])
+
+
+BandBlock = namedtuple("BandBlock", ["ispin", "ik", "nk", "kpoint", "energies"])
+
+
+def iter_band_in_log(log_file, offset=0):
+    """
+    Parse band energies of an ABACUS nscf log in a single pass, one k-point at a time.
+
+    Only the current line and the energies of the current k-point are held in memory,
+    so this works for logs of any size.
+
+    :param log_file: path of `running_nscf.log`
+    :param int offset: byte offset to start parsing, it should be at or before the `nkstot` line.
+    :return: generator of BandBlock(ispin, ik, nk, kpoint, energies), `ispin` counts from 0,
+        `nk` is the `nkstot` of log and `kpoint` is the direct coordinate of the k-point.
     """
-    with open(log_file, "r") as f:
-        content = f.readlines()
-    # match
     kpath = []
-    bandValue = BandValuePattern.findall("".join(content))
-    with open(log_file, "r") as f:
-        line = f.readline()
-        while line:
-            if "nkstot" in line:
-                knum = int(line.split("=")[-1])
+    knum = None
+    block = []
+    block_label = None
+    kcount = {}
+
+    def _flush():
+        block_spin = int(block_label[4:block_label.index(b"_")]) - 1
+        ik = kcount.get(block_spin, 0)
+        kcount[block_spin] = ik + 1
+        kpoint = kpath[ik] if ik < len(kpath) else np.full(3, np.nan)
+        return BandBlock(block_spin, ik, knum, kpoint, np.array(block, dtype=float))
+
+    with open(log_file, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if b"final_band" in line:
+                label, band_idx, value = line.split(None, 3)[:3]
+                if block and (band_idx == b"1" or label != block_label):
+                    yield _flush()
+                    block = []
+                block_label = label
+                block.append(value)
+            elif knum is None and b"nkstot" in line:
+                knum = int(line.split(b"=")[-1])
                 f.readline()
                 f.readline()
                 for kpoint_idx in range(knum):
-                    kpoint_line = f.readline()
-                    kpath.append(kpoint_line)
-            else:
-                pass
-            line = f.readline()
-
-    nband = len(bandValue) / knum
-    assert nband == np.around(nband)
-    nband = int(nband)
-    # split
-    kpathArray = list([item.split()[1:4] for item in kpath])
-    bandArray = list([item.split()[_nspin] for item in bandValue])
-
-    kpathArray = np.array(kpathArray, dtype=float)
-    bandArray = np.array(bandArray, dtype=float).reshape([_nspin, knum, -1])
+                    kpath.append(np.array(f.readline().split()[1:4], dtype=float))
+    if block:
+        yield _flush()
+
+
+def read_band_in_log(log_file, atoms=None, _nspin=1, outputfile=None, energy_window=None, fermi_energy=0.0, offset=0):
+    """
+    Read k-points and band energies from ABACUS nscf log.
+
+    The log is streamed by `iter_band_in_log` into a preallocated `(nspin, nk, nbands)` array.
+
+    :param log_file:
+    :param int _nspin: expected spin number, more spin channels found in log will be added.
+    :raise ValueError: log has fewer spin channels than `_nspin`, or not as many as its header `nspin = ...`.
+    :param outputfile: write `BAND` file of spin 1 if given.
+    :param tuple energy_window: (emin, emax) relative to `fermi_energy`, only bands that fall in this window
+        at any k-point are kept.
+    :param float fermi_energy: reference of `energy_window`.
+    :param int offset: byte offset to start parsing, see `LogIndex`.
+    :return: kpathArray,bandArray
+    """
+    kpathArray = None
+    bandArray = None
+    for band_block in iter_band_in_log(log_file, offset=offset):
+        if bandArray is None:
+            if band_block.nk is None:
+                raise ValueError(f"No `nkstot` found before band energies in {log_file}.")
+            bandArray = np.empty([max(_nspin, band_block.ispin + 1), band_block.nk, band_block.energies.shape[0]])
+            kpathArray = np.empty([band_block.nk, 3])
+            nk_filled = np.zeros(bandArray.shape[0], dtype=int)
+        if band_block.ispin >= bandArray.shape[0]:
+            bandArray = np.concatenate([bandArray, np.empty([band_block.ispin + 1 - bandArray.shape[0], *bandArray.shape[1:]])])
+            nk_filled = np.concatenate([nk_filled, np.zeros(bandArray.shape[0] - nk_filled.shape[0], dtype=int)])
+        if band_block.ik >= bandArray.shape[1]:
+            raise ValueError(f"More k-points than `nkstot`={bandArray.shape[1]} found in {log_file}.")
+        bandArray[band_block.ispin, band_block.ik] = band_block.energies
+        kpathArray[band_block.ik] = band_block.kpoint
+        nk_filled[band_block.ispin] = band_block.ik + 1
+    if bandArray is None:
+        raise ValueError(f"No band energies found in {log_file}.")
+    nspin_found = int(np.count_nonzero(nk_filled))
+    nspin_header = read_nspin_from_log(log_file)
+    if nspin_header is not None and nspin_header != nspin_found:
+        raise ValueError(f"{log_file} has nspin = {nspin_header} in header but band energies of {nspin_found} spin channels.")
+    if _nspin > nspin_found:
+        raise ValueError(f"Expect {_nspin} spin channels but {log_file} has {nspin_found}"
+                         f"{'' if nspin_header is None else f' (nspin = {nspin_header})'}.")
+    knum = nk_filled.max()
+    if (nk_filled != knum).any():
+        raise ValueError(f"Different number of k-points for each spin in {log_file}: {nk_filled}.")
+    kpathArray = kpathArray[:knum]
+    bandArray = bandArray[:, :knum]
+
+    if energy_window is not None:
+        bandArray = _band_in_window(bandArray, energy_window, fermi_energy)
+    if outputfile:
+        _write_band_file(outputfile, bandArray)
+    return kpathArray, bandArray
+
+
+def read_nspin_from_log(log_file):
+    """
+    :return: int of the `nspin = ...` line of ABACUS log, None if not found.
+    """
+    with open(log_file, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            match = NspinPattern.search(mm)
+            return None if match is None else int(match.group(1))
+
+
+def _band_in_window(bandArray, energy_window, fermi_energy=0.0):
+    emin, emax = energy_window
+    in_window = ((bandArray >= fermi_energy + emin) & (bandArray <= fermi_energy + emax)).any(axis=(0, 1))
+    band_idx = np.flatnonzero(in_window)
+    if band_idx.shape[0] == 0:
+        return bandArray[:, :, :0]
+    return bandArray[:, :, band_idx[0]:band_idx[-1] + 1].copy()
+
+
+def _write_band_file(outputfile, bandArray):
+    file = pathlib.Path(outputfile)
+    with open(file, "w") as f:
+        for idx_band in range(bandArray.shape[1]):
+            kpathBandValue = "".join(str(item) + " " for item in bandArray[0, idx_band])
+            print(f"{idx_band + 1} {kpathBandValue}", file=f)
+
+
+def read_band_in_dat(dat_files, skip_columns=1):
+    """
+    Read band energies from `BANDS_*.dat` of ABACUS in bulk.
+
+    Each file is one spin channel, each line is one k-point as `ik e1 e2 ...` in `eV`.
+
+    :param dat_files: list of `BANDS_1.dat` (and `BANDS_2.dat` for nspin=2), in order of spin.
+    :param int skip_columns: leading columns of each line which are not band energies.
+    :return: bandArray of shape (nspin, nk, nbands)
+    :raise ValueError: if a file is empty, has non-numeric values or lines of different number of columns.
+    """
+    spin_bands = []
+    for dat_file in dat_files:
+        with open(dat_file, "rb") as f:
+            content = f.read()
+        lines = [line for line in content.splitlines() if line.strip()]
+        ncol = len(lines[0].split()) if lines else 0
+        try:
+            values = np.array(content.split(), dtype=np.float64)
+        except ValueError as e:
+            raise ValueError(f"Non-numeric value in {dat_file}: {e}") from None
+        if ncol <= skip_columns or values.shape[0] != len(lines) * ncol:
+            raise ValueError(f"Expect {len(lines)} lines of {ncol} (> {skip_columns}) columns in {dat_file}, got {values.shape[0]} values.")
+        spin_bands.append(values.reshape([len(lines), ncol])[:, skip_columns:])
+    if len(set(item.shape for item in spin_bands)) > 1:
+        raise ValueError(f"Shape of bands mismatch in {dat_files}: {[item.shape for item in spin_bands]}")
+    return np.stack(spin_bands)
+
+
+def read_band_structure(out_dir, atoms=None, outputfile=None, energy_window=None, fermi_energy=0.0):
+    """
+    Read k-points and band energies of a nscf `OUT.ABACUS` directory.
+
+    Band energies are read from `BANDS_*.dat` by `read_band_in_dat`, k-points from the `running_nscf` log by `LogIndex`.
+    If there is no `BANDS_*.dat`, fall back to read both from the log.
+
+    :param out_dir: `OUT.ABACUS` directory of nscf calculation.
+    :param outputfile: write `BAND` file of spin 1 if given.
+    :param tuple energy_window: see `read_band_in_log`.
+    :param float fermi_energy: see `read_band_in_log`.
+    :return: kpathArray,bandArray
+    """
+    out_dir = pathlib.Path(out_dir)
+    nscflogfile = sorted(out_dir.glob("running_nscf*.log"))
+    if len(nscflogfile) == 0:
+        raise FileNotFoundError(f"No running_nscf log in {out_dir}.")
+    log_index = LogIndex.load(nscflogfile[0])
+    dat_files = sorted(out_dir.glob("BANDS_*.dat"), key=lambda item: int(item.stem.split("_")[-1]))
+    if len(dat_files) == 0:
+        return log_index.read_band(atoms=atoms, outputfile=outputfile, energy_window=energy_window, fermi_energy=fermi_energy)
+    kpathArray = log_index.kpoints()
+    bandArray = read_band_in_dat(dat_files)
+    if bandArray.shape[1] > kpathArray.shape[0]:
+        raise ValueError(f"{bandArray.shape[1]} k-points in {dat_files} but {kpathArray.shape[0]} in {nscflogfile[0]}.")
+    kpathArray = kpathArray[:bandArray.shape[1]]
+    if energy_window is not None:
+        bandArray = _band_in_window(bandArray, energy_window, fermi_energy)
     if outputfile:
-        file = pathlib.Path(outputfile)
-        if pathlib.Path(file).exists():
-            file.unlink()
-        with open(file, "a")as f:
-            for idx_band in range(knum):
-                kpathBandValue = "".join(str(item) + " " for item in bandArray[0, idx_band])
-                print(f"{idx_band + 1} {kpathBandValue}", file=f)
+        _write_band_file(outputfile, bandArray)
     return kpathArray, bandArray
 
 
@@ -127,7 +409,296 @@ def read_fermi_energy_from_log(log_file):
     :param log_file:
     :return:
     """
-    with open(log_file, "r") as f:
-        content = f.readlines()
-    ferimiValues = EFermi_Pattern.findall("".join(content))
-    return list([float(item.split()[1]) for item in ferimiValues])
+    return LogIndex(log_file).fermi_energies()
+
+
+def check_abacus_log(log_file, converged=None, not_converged=None, tail_bytes=64 * 1024) -> bool:
+    """
+    Whether the ABACUS run of a log finished normally. The log is written when ABACUS starts,
+    so it says nothing alone: a finished run writes `Total Time` at the end.
+
+    :param log_file: path of `running_*.log`.
+    :param converged: compiled bytes regex which should be found, e.g. `ScfConvergedPattern`.
+    :param not_converged: compiled bytes regex which should not be found, e.g. `ScfNotConvergedPattern`.
+    :param int tail_bytes: `Total Time` is looked for in this many bytes at the end.
+    :return: bool
+    """
+    log_file = pathlib.Path(log_file)
+    if not log_file.is_file() or log_file.stat().st_size == 0:
+        return False
+    with open(log_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if not FinishedLogPattern.search(mm, max(0, len(mm) - tail_bytes)):
+            return False
+        if converged is not None and not converged.search(mm):
+            return False
+        if not_converged is not None and not_converged.search(mm):
+            return False
+    return True
+
+
+class LogIndex:
+    """
+    Byte offsets of sections in an ABACUS running log.
+
+    The log is memory-mapped once and scanned with byte-level regexes, the offsets of each
+    `nkstot` line, `E_Fermi` line, first `final_band` line of a k-point and SCF iteration (`ELEC=`) line are recorded.
+    Queries seek to these offsets instead of rescanning the log.
+    Use `LogIndex.load(log_file)` to reuse the index saved next to the log by `save()`.
+
+    :param log_file: path of ABACUS running log.
+    :param bool build: build the index now. If False, only "last value" queries which scan backwards are available
+        until `build()` is called.
+    """
+    SectionPatterns = {
+        "nkstot": re.compile(rb"nkstot"),
+        "E_Fermi": re.compile(rb"E_Fermi"),
+        "final_band": re.compile(rb"final_band[ \t]+1[ \t]"),
+        "scf_iteration": re.compile(rb"ELEC="),
+    }
+    IndexSuffix = ".index.json"
+
+    def __init__(self, log_file, build=True):
+        self.log_file = pathlib.Path(log_file)
+        self.offsets = None
+        self._stat = self._log_stat()
+        if build:
+            self.build()
+
+    def _log_stat(self):
+        stat = self.log_file.stat()
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    @contextlib.contextmanager
+    def _mmap(self):
+        with open(self.log_file, "rb") as f:
+            if self._stat["size"] == 0:
+                yield b""
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    yield mm
+
+    def build(self):
+        offsets = {}
+        with self._mmap() as mm:
+            for section, pattern in self.SectionPatterns.items():
+                offsets[section] = [mm.rfind(b"\n", 0, match.start()) + 1 for match in pattern.finditer(mm)]
+        self.offsets = offsets
+        return self
+
+    @property
+    def index_file(self):
+        return self.log_file.with_name(self.log_file.name + self.IndexSuffix)
+
+    def save(self, index_file=None):
+        """
+        Save offsets next to the log as `<log>.index.json`.
+        """
+        if self.offsets is None:
+            self.build()
+        index_file = pathlib.Path(index_file) if index_file else self.index_file
+        with open(index_file, "w") as f:
+            json.dump({**self._stat, "offsets": self.offsets}, f)
+        return index_file
+
+    @classmethod
+    def load(cls, log_file, index_file=None, save=False):
+        """
+        Load the saved index of log, it will be rebuilt if the log has changed since saved.
+
+        :param log_file:
+        :param index_file: default to `<log>.index.json`
+        :param bool save: save the index if it is rebuilt. Off by default, the index file is written beside the log
+            and would be matched by globs of logs like `running_*`, pass `index_file` outside `OUT.ABACUS` to save it.
+        :return: LogIndex
+        """
+        log_index = cls(log_file, build=False)
+        index_file = pathlib.Path(index_file) if index_file else log_index.index_file
+        if index_file.exists():
+            with open(index_file, "r") as f:
+                saved = json.load(f)
+            if saved["size"] == log_index._stat["size"] and saved["mtime_ns"] == log_index._stat["mtime_ns"]:
+                log_index.offsets = saved["offsets"]
+                return log_index
+        log_index.build()
+        if save:
+            log_index.save(index_file)
+        return log_index
+
+    def _lines_at(self, section):
+        if self.offsets is None:
+            self.build()
+        with self._mmap() as mm:
+            for offset in self.offsets[section]:
+                end = mm.find(b"\n", offset)
+                yield mm[offset:end if end > -1 else len(mm)]
+
+    def _last_line(self, pattern: bytes):
+        with self._mmap() as mm:
+            pos = mm.rfind(pattern)
+            if pos == -1:
+                return None
+            end = mm.find(b"\n", pos)
+            return mm[mm.rfind(b"\n", 0, pos) + 1:end if end > -1 else len(mm)]
+
+    def count(self, section):
+        if self.offsets is None:
+            self.build()
+        return len(self.offsets[section])
+
+    def fermi_energies(self):
+        """
+        All `E_Fermi` values of log in `eV`.
+        """
+        return list([float(line.split(b"E_Fermi")[-1].split()[1]) for line in self._lines_at("E_Fermi")])
+
+    def last_fermi_energy(self):
+        """
+        The last `E_Fermi` value of log in `eV`, found by scanning backwards from the end of log.
+        """
+        line = self._last_line(b"E_Fermi")
+        if line is None:
+            raise ValueError(f"No E_Fermi found in {self.log_file}.")
+        return float(line.split(b"E_Fermi")[-1].split()[1])
+
+    def kpoints(self):
+        """
+        Direct coordinates of k-points listed after the first `nkstot`.
+        """
+        if self.count("nkstot") == 0:
+            raise ValueError(f"No nkstot found in {self.log_file}.")
+        with self._mmap() as mm:
+            offset = self.offsets["nkstot"][0]
+            end = mm.find(b"\n", offset)
+            knum = int(mm[offset:end].split(b"=")[-1])
+            lines = []
+            for line_idx in range(knum + 2):
+                offset, end = end + 1, mm.find(b"\n", end + 1)
+                lines.append(mm[offset:end if end > -1 else len(mm)])
+        return np.array([item.split()[1:4] for item in lines[2:]], dtype=float)
+
+    def read_band(self, **kwargs):
+        """
+        Same as `read_band_in_log`, start from the first `nkstot` section.
+        """
+        offset = self.offsets["nkstot"][0] if self.count("nkstot") else 0
+        return read_band_in_log(self.log_file, offset=offset, **kwargs)
+
+
+LogEvent = namedtuple("LogEvent", ["name", "value", "offset"])
+
+
+class LogFollower:
+    """
+    Follow an ABACUS running log while it is written, like `tail -f`.
+
+    The byte offset of parsed content is kept, each `poll()` only reads lines appended since last poll.
+    An incomplete last line is kept until its end is written.
+    Events emitted:
+
+    - ionic_step: int, ION number when it changes.
+    - scf_iteration: int, ELEC number.
+    - drho: float, density error.
+    - total_energy: float, E_KohnSham in eV.
+    - fermi_energy: float, E_Fermi in eV.
+    - final_energy: float, !FINAL_ETOT_IS in eV.
+
+    Usage:
+    ```
+    follower = LogFollower("OUT.ABACUS/running_scf.log")
+    follower.register("drho", lambda event: print(event.value))
+    follower.follow(interval=5, stop=lambda: job_finished())
+    ```
+
+    :param log_file: path of ABACUS running log, it may not exist yet.
+    :param int offset: byte offset to start following.
+    """
+    EventPatterns = {
+        "ionic_step": re.compile(rb"ION=\s*(\d+)"),
+        "scf_iteration": re.compile(rb"ELEC=\s*(\d+)"),
+        "drho": re.compile(rb"[Dd]ensity error is\s*(\S+)"),
+        "total_energy": re.compile(rb"E_KohnSham\s+\S+\s+(\S+)"),
+        "fermi_energy": re.compile(rb"E_Fermi\s+\S+\s+(\S+)"),
+        "final_energy": re.compile(rb"!FINAL_ETOT_IS\s+(\S+)"),
+    }
+    EventTypes = {
+        "ionic_step": int,
+        "scf_iteration": int,
+    }
+
+    def __init__(self, log_file, offset=0):
+        self.log_file = pathlib.Path(log_file)
+        self.offset = offset
+        self._callbacks = {}
+        self._ionic_step = None
+
+    def register(self, event, callback):
+        """
+        Register callback for event, `callback(LogEvent)` is called for each event in order of log.
+
+        :param str event: one of `LogFollower.EventPatterns`, or "*" for all events.
+        :param callback:
+        """
+        if event != "*" and event not in self.EventPatterns:
+            raise KeyError(f"Unknown event {event}, available: {list(self.EventPatterns.keys())}")
+        self._callbacks.setdefault(event, []).append(callback)
+        return callback
+
+    def poll(self):
+        """
+        Parse lines appended since last poll and call registered callbacks.
+
+        :return: List[LogEvent]
+        """
+        try:
+            size = self.log_file.stat().st_size
+        except FileNotFoundError:
+            return []
+        if size < self.offset:  # log was truncated or rewritten
+            self.offset = 0
+            self._ionic_step = None
+        if size == self.offset:
+            return []
+        with open(self.log_file, "rb") as f:
+            f.seek(self.offset)
+            content = f.read(size - self.offset)
+        end = content.rfind(b"\n") + 1
+        events = []
+        line_offset = self.offset
+        for line in content[:end].splitlines(keepends=True):
+            events.extend(self._parse_line(line, line_offset))
+            line_offset += len(line)
+        self.offset += end
+        for event in events:
+            for callback in self._callbacks.get(event.name, []) + self._callbacks.get("*", []):
+                callback(event)
+        return events
+
+    def _parse_line(self, line, line_offset):
+        events = []
+        for name, pattern in self.EventPatterns.items():
+            match = pattern.search(line)
+            if match is None:
+                continue
+            value = self.EventTypes.get(name, float)(match.group(1))
+            if name == "ionic_step":
+                if value == self._ionic_step:
+                    continue
+                self._ionic_step = value
+            events.append(LogEvent(name, value, line_offset))
+        return events
+
+    def follow(self, interval=5, stop=None, timeout=None):
+        """
+        Poll the log every `interval` seconds until `stop()` returns True or `timeout` seconds passed.
+        A final poll is done after stop.
+
+        :return: List[LogEvent] of all events during follow.
+        """
+        start = time.monotonic()
+        events = []
+        while True:
+            events.extend(self.poll())
+            if (stop is not None and stop()) or (timeout is not None and time.monotonic() - start > timeout):
+                events.extend(self.poll())
+                return events
+            time.sleep(interval)
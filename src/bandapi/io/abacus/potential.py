@@ -6,10 +6,15 @@
 # ALL RIGHTS ARE RESERVED UNLESS STATED.
 # ====================================== #
 import json
-import os
 import pathlib
+import re
+import threading
+from collections import namedtuple
 from typing import Union
 
+import numpy as np
+from bandapi.io.utils import file_sha256
+
 PotentialNameAlias = {
     #SG15
     "SG15": "SG15",
@@ -22,34 +27,168 @@ PotentialDictFile = pathlib.Path(__file__).parent/r"pot_path.json"
 PotentialDataDir = pathlib.Path(__file__).parent/r"potdata"
 
 
+PotentialLibrary = namedtuple("PotentialLibrary", ["name", "dir", "files", "paths", "table"])
+"""
+`files` is element -> file name, `paths` is element -> resolved absolute path,
+`table` is an object array of paths indexed by atomic number, None for missing elements.
+"""
+
+
+def _chemical_symbols():
+    try:
+        from ase.data import chemical_symbols
+    except ImportError:  # pragma: no cover
+        raise RuntimeError("Please run `pip install ase` or `conda install ase -c conda-forge` to convert atom number to atom symbols")
+    return chemical_symbols
+
+
+class PotentialRegistry:
+    def __init__(self, dict_file=PotentialDictFile, data_dir=PotentialDataDir):
+        """
+        Registry of pseudopotential libraries, the library index `pot_path.json` is parsed once on first use.
+        Use `get_potential_registry()` for the process-wide registry.
+
+        :param dict_file: json of library name -> {"dir": directory relative to `data_dir`, "file": element -> file name}
+        :param data_dir:
+        """
+        self.dict_file = pathlib.Path(dict_file)
+        self.data_dir = pathlib.Path(data_dir)
+        self.aliases = dict(PotentialNameAlias)
+        self._libraries = None
+        self._sha256 = {}
+        self._lock = threading.Lock()
+
+    @property
+    def libraries(self) -> dict:
+        if self._libraries is None:
+            with self._lock:
+                if self._libraries is None:
+                    with open(self.dict_file, "r") as file:
+                        pot_path = json.load(file)
+                    self._libraries = {
+                        name: self._make_library(name, self.data_dir / item["dir"], item["file"])
+                        for name, item in pot_path.items()
+                    }
+        return self._libraries
+
+    @staticmethod
+    def _make_library(name, directory, files: dict) -> PotentialLibrary:
+        directory = pathlib.Path(directory).absolute()
+        paths = {element: directory / file_name for element, file_name in files.items()}
+        chemical_symbols = _chemical_symbols()
+        table = np.full(len(chemical_symbols), None, dtype=object)
+        for element, path in paths.items():
+            if element in chemical_symbols:
+                table[chemical_symbols.index(element)] = path
+        return PotentialLibrary(name, directory, dict(files), paths, table)
+
+    def resolve_name(self, pot_name: str) -> str:
+        try:
+            return self.aliases[pot_name.upper()]
+        except KeyError:
+            raise KeyError(f"Unknown potential {pot_name}, available: {sorted(set(self.aliases.values()))}")
+
+    def register_library(self, pot_name: str, directory, files: dict = None, aliases=()):
+        """
+        Add a user library of pseudopotentials.
+
+        :param pot_name: name of library, case-insensitive.
+        :param directory: directory of files.
+        :param dict files: element -> file name. If None, files of `directory` are matched by element prefix
+            of their names, like `Si_ONCV_PBE-1.0.upf` or `Si.pz-vbc.UPF`.
+        :param aliases: other names of library.
+        """
+        directory = pathlib.Path(directory)
+        if files is None:
+            chemical_symbols = set(_chemical_symbols()[1:])
+            files = {}
+            for item in sorted(directory.iterdir()):
+                element = re.split(r"[._\-]", item.name, maxsplit=1)[0].capitalize()
+                if item.is_file() and item.suffix.lower() == ".upf" and element in chemical_symbols:
+                    files.setdefault(element, item.name)
+        name = pot_name.upper()
+        library = self._make_library(name, directory, files)
+        self.libraries[name] = library
+        for alias in [name, *aliases]:
+            self.aliases[alias.upper()] = name
+        return library
+
+    def library(self, pot_name: str) -> PotentialLibrary:
+        return self.libraries[self.resolve_name(pot_name)]
+
+    def path(self, pot_name: str, key: Union[str, int]) -> pathlib.Path:
+        library = self.library(pot_name)
+        try:
+            if isinstance(key, (int, np.integer)):
+                path = library.table[key]
+                if path is None:
+                    raise KeyError(key)
+                return path
+            return library.paths[key]
+        except (KeyError, IndexError):
+            raise KeyError(f"There is no {library.name} potential for element {key}.\nAvailable element for {library.name}:{list(library.files.keys())}")
+
+    def paths(self, pot_name: str, numbers) -> np.ndarray:
+        """
+        Vectorized lookup of paths from atomic numbers.
+
+        :param numbers: array-like of atomic numbers.
+        :return: object array of pathlib.Path of the same shape.
+        """
+        library = self.library(pot_name)
+        numbers = np.asarray(numbers, dtype=int)
+        paths = library.table[numbers]
+        if paths.size and (paths == None).any():  # noqa: E711, elementwise comparison
+            missing = sorted(set(numbers[paths == None].tolist()))  # noqa: E711
+            raise KeyError(f"There is no {library.name} potential for element {[_chemical_symbols()[item] for item in missing]}.\nAvailable element for {library.name}:{list(library.files.keys())}")
+        return paths
+
+    def sha256(self, pot_name: str, key: Union[str, int]) -> str:
+        """
+        sha256 of potential file, computed once per file.
+        """
+        path = self.path(pot_name, key)
+        if path not in self._sha256:
+            self._sha256[path] = file_sha256(path)
+        return self._sha256[path]
+
+
+_registry = None
+
+
+def get_potential_registry() -> PotentialRegistry:
+    """
+    Process-wide registry of pseudopotential libraries.
+    """
+    global _registry
+    if _registry is None:
+        _registry = PotentialRegistry()
+    return _registry
+
+
 class AbacusPotential:
     def __init__(self, pot_name: str = "SG15"):
         """
         Hold potential files of ABACUS.
         Use `AbacusPotential(pot_name="SG15")["C"]` to get `absolute` path of SG15 potential to carbon.
+        It is a view of the process-wide `PotentialRegistry`, library index is not parsed again.
 
-        :param pot_name: Available potential: ["SG15"]
+        :param pot_name: Available potential: ["SG15"] and libraries added by `PotentialRegistry.register_library`.
         """
-        self.pot_name: str = self._pot_name_praser(pot_name)
-        with open(PotentialDictFile, "r") as file:
-            self.pot_dict: dict = json.load(file)[self.pot_name]
-        self.pot_files: dict = self.pot_dict["file"]
+        self.registry = get_potential_registry()
+        self.pot_name: str = self.registry.resolve_name(pot_name)
+        self.library: PotentialLibrary = self.registry.library(self.pot_name)
+        self.pot_files: dict = self.library.files
 
     def __getitem__(self, key: Union[str, int]):
-        if isinstance(key, int):
-            try: #pragma: no cover
-                from ase.atom import chemical_symbols
-                key = chemical_symbols[key]
-            except ImportError: #pragma: no cover
-                raise RuntimeError("Please run `pip install ase` or `conda install ase -c conda-forge` to convert atom number to atom symbols")
-        try:
-            pot_file_name: str = self.pot_files[key]
-            pot_file_name = PotentialDataDir/self.pot_dict["dir"]/pot_file_name
-            return pot_file_name
-        except KeyError:
-            raise KeyError(f"There is no {self.pot_name} potential for element {key}.\nAvailable element for {self.pot_name}:{list(self.pot_files.keys())}")
+        return self.registry.path(self.pot_name, key)
+
+    def paths(self, numbers):
+        return self.registry.paths(self.pot_name, numbers)
+
+    def sha256(self, key: Union[str, int]):
+        return self.registry.sha256(self.pot_name, key)
 
     @staticmethod
     def _pot_name_praser(pot_name: str):
-        pot_name = pot_name.upper()
-        return PotentialNameAlias[pot_name]
+        return get_potential_registry().resolve_name(pot_name)
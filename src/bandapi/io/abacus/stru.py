@@ -5,6 +5,7 @@
 # @File    : stru.py
 # ALL RIGHTS ARE RESERVED UNLESS STATED.
 # ====================================== #
+import io
 import pathlib
 from collections import OrderedDict
 
@@ -54,10 +55,20 @@ AbacusStruBlock = {'atom_type_list': 'ATOMIC_POSITIONS',
                    'pseudo_file_list': 'ATOMIC_SPECIES'}
 
 
-def write_abacus_stru(
-        task_root: str,
-        stru_para_dict: dict
-):
+DefaultPrecision = 12
+
+
+def render_abacus_stru(
+        stru_para_dict: dict,
+        precision: int = DefaultPrecision
+) -> bytes:
+    """
+    Render ABACUS STRU file in memory.
+
+    :param dict stru_para_dict: keys of `AbacusStruBlock`.
+    :param int precision: digits after decimal point of atomic positions.
+    :return: bytes of STRU file.
+    """
     all_stru_keys = stru_para_dict.keys()
     stru_blocks = set()
     for key in all_stru_keys:
@@ -65,18 +76,29 @@ def write_abacus_stru(
             stru_blocks.add(AbacusStruBlock[key])
         except KeyError:
             raise KeyError(f"Invalid STRU Key for ABACUS: {key}")
-    with open(pathlib.Path(task_root) / "STRU", "w") as f:
-        # MUST IN ORDER
-        if "ATOMIC_SPECIES" in stru_blocks:
-            print(generate_atom_species_lines(stru_para_dict), file=f)
-        if "NUMERICAL_ORBITAL" in stru_blocks:
-            print(generate_numerical_orbital_lines(stru_para_dict), file=f)
-        if "LATTICE_CONSTANT" in stru_blocks:
-            print(generate_lattice_constant_lines(stru_para_dict), file=f)
-        if "LATTICE_VECTORS" in stru_blocks:
-            print(generate_lattice_vectors_lines(stru_para_dict), file=f)
-        if "ATOMIC_POSITIONS" in stru_blocks:
-            print(generate_atomic_positions_lines(stru_para_dict), file=f)
+    buffer = io.StringIO()
+    # MUST IN ORDER
+    if "ATOMIC_SPECIES" in stru_blocks:
+        buffer.write(generate_atom_species_lines(stru_para_dict) + "\n")
+    if "NUMERICAL_ORBITAL" in stru_blocks:
+        buffer.write(generate_numerical_orbital_lines(stru_para_dict) + "\n")
+    if "LATTICE_CONSTANT" in stru_blocks:
+        buffer.write(generate_lattice_constant_lines(stru_para_dict) + "\n")
+    if "LATTICE_VECTORS" in stru_blocks:
+        buffer.write(generate_lattice_vectors_lines(stru_para_dict) + "\n")
+    if "ATOMIC_POSITIONS" in stru_blocks:
+        buffer.write(generate_atomic_positions_lines(stru_para_dict, precision=precision) + "\n")
+    return buffer.getvalue().encode()
+
+
+def write_abacus_stru(
+        task_root: str,
+        stru_para_dict: dict,
+        precision: int = DefaultPrecision
+):
+    content = render_abacus_stru(stru_para_dict, precision=precision)
+    with open(pathlib.Path(task_root) / "STRU", "wb") as f:
+        f.write(content)
 
 
 def generate_atom_species_lines(stru_para_dict):
@@ -85,10 +107,7 @@ def generate_atom_species_lines(stru_para_dict):
     mass_list = stru_para_dict["mass_list"]
     pseudo_file_list = stru_para_dict["pseudo_file_list"]
     assert len(label_list) == len(mass_list) == len(pseudo_file_list)
-    lines = "ATOMIC_SPECIES\n"
-    for idx, ele in enumerate(label_list):
-        lines += f"{ele} {mass_list[idx]} {pseudo_file_list[idx]}\n"
-    return lines
+    return "ATOMIC_SPECIES\n" + "".join(f"{ele} {mass_list[idx]} {pseudo_file_list[idx]}\n" for idx, ele in enumerate(label_list))
 
 
 def generate_numerical_orbital_lines(stru_para_dict):
@@ -106,25 +125,36 @@ def generate_lattice_vectors_lines(stru_para_dict):
     lat_vec = stru_para_dict["lattice_matrix"]
     if isinstance(lat_vec, list):
         if len(lat_vec) == 3:
-            return f"{lat_vec[0][0]} {lat_vec[0][1]} {lat_vec[0][2]}\n" + \
-                   f"{lat_vec[1][0]} {lat_vec[1][1]} {lat_vec[1][2]}\n" + \
-                   f"{lat_vec[2][0]} {lat_vec[2][1]} {lat_vec[2][2]}\n"
+            lat_vec = np.array(lat_vec)
         else:
             raise ValueError(f"stru_para_dict[\"lattice_matrix\"] is list and has wrong shape: {len(lat_vec)}*({len(lat_vec[0])},{len(lat_vec[1])},{len(lat_vec[2])}).")
-    elif isinstance(lat_vec, np.ndarray):
-        assert lat_vec.shape == (3, 3)
-        return "LATTICE_VECTORS\n" \
-               f"{lat_vec[0][0]} {lat_vec[0][1]} {lat_vec[0][2]}\n" + \
-               f"{lat_vec[1][0]} {lat_vec[1][1]} {lat_vec[1][2]}\n" + \
-               f"{lat_vec[2][0]} {lat_vec[2][1]} {lat_vec[2][2]}\n"
+    assert lat_vec.shape == (3, 3)
+    return "LATTICE_VECTORS\n" \
+           f"{lat_vec[0][0]} {lat_vec[0][1]} {lat_vec[0][2]}\n" + \
+           f"{lat_vec[1][0]} {lat_vec[1][1]} {lat_vec[1][2]}\n" + \
+           f"{lat_vec[2][0]} {lat_vec[2][1]} {lat_vec[2][2]}\n"
+
 
+def format_positions(ele_pos_list, precision=DefaultPrecision):
+    """
+    Format a (natoms, 6) array of `posx posy posz flagx flagy flagz` in one string operation.
 
-def generate_atomic_positions_lines(stru_para_dict):
+    :param np.ndarray ele_pos_list:
+    :param int precision: digits after decimal point of positions.
+    :return: str
+    """
+    ele_pos_list = np.asarray(ele_pos_list, dtype=float)
+    line_fmt = f"%.{precision}f %.{precision}f %.{precision}f %d %d %d\n"
+    return (line_fmt * ele_pos_list.shape[0]) % tuple(ele_pos_list.ravel().tolist())
+
+
+def generate_atomic_positions_lines(stru_para_dict, precision=DefaultPrecision):
     # ATOMIC_POSITIONS lines
-    lines = "ATOMIC_POSITIONS\n"
+    buffer = io.StringIO()
+    buffer.write("ATOMIC_POSITIONS\n")
     coordinate_type = stru_para_dict["coordinate_type"]
-    if coordinate_type == "Cartesian" or "Direct":
-        lines += f"{coordinate_type}\n\n"
+    if coordinate_type in ["Cartesian", "Direct"]:
+        buffer.write(f"{coordinate_type}\n\n")
     else:
         raise KeyError(f"Unknown `coordinate_type`: {coordinate_type}.")
     atom_type_list = stru_para_dict["atom_type_list"]
@@ -133,24 +163,18 @@ def generate_atomic_positions_lines(stru_para_dict):
     pos_list = stru_para_dict["pos_list"]
     # each element
     for idx, ele in enumerate(atom_type_list):
-        lines += f"{ele}\n"
-        lines += f"{magnetism_list[idx]}\n"
-        lines += f"{number_of_atoms_list[idx]}\n"
+        buffer.write(f"{ele}\n{magnetism_list[idx]}\n{number_of_atoms_list[idx]}\n")
         ele_num = int(number_of_atoms_list[idx])
         ele_pos_list = pos_list[idx]
         if isinstance(ele_pos_list, list):
-            if len(ele_pos_list) == ele_num:
-                for atom in ele_pos_list:
-                    assert len(lines) == 6, "Atom position in ABACUS STRU file need 6 numbers."
-
-                    lines += f"{atom[0]} {atom[1]} {atom[2]} {atom[3]} {atom[4]} {atom[5]}\n"
-            else:
-                raise ValueError(f"stru_para_dict[\"pos_list\"] is list and has wrong number: {len(lat_vec)} != ele_num of {atom}:{ele_num}.")
+            if len(ele_pos_list) != ele_num:
+                raise ValueError(f"stru_para_dict[\"pos_list\"] is list and has wrong number: {len(ele_pos_list)} != ele_num of {ele}:{ele_num}.")
+            assert all(len(atom) == 6 for atom in ele_pos_list), "Atom position in ABACUS STRU file need 6 numbers."
+            ele_pos_list = np.array(ele_pos_list, dtype=float).reshape([ele_num, 6])
         elif isinstance(ele_pos_list, np.ndarray):
             assert ele_pos_list.shape == (ele_num, 6), f"Atom position in ABACUS STRU file need 6 numbers. Got {ele_pos_list.shape}."
-            for atom in ele_pos_list:
-                lines += f"{atom[0]} {atom[1]} {atom[2]} {int(atom[3])} {int(atom[4])} {int(atom[5])}\n"
-    return lines
+        buffer.write(format_positions(ele_pos_list, precision=precision))
+    return buffer.getvalue()
 
 
 if __name__ == '__main__':
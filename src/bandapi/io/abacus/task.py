@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : task.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+import hashlib
+import io
+import os
+import pathlib
+import tarfile
+import time
+from typing import Dict, Mapping
+
+from bandapi.io.abacus.input import render_abacus_input
+from bandapi.io.abacus.kpt import render_abacus_kpt
+from bandapi.io.abacus.stru import DefaultPrecision, render_abacus_stru
+
+"""
+Rendered ABACUS task: a dict of file name -> bytes, such as {"INPUT": b"...", "KPT": b"...", "STRU": b"..."}.
+Many rendered tasks are a dict of task root -> rendered task.
+"""
+
+
+def render_abacus_task(
+        input_para_dict: dict = None,
+        kpt_para_dict: dict = None,
+        stru_para_dict: dict = None,
+        precision: int = DefaultPrecision
+) -> Dict[str, bytes]:
+    """
+    Render INPUT, KPT and STRU of one task in memory, None is skipped.
+
+    :return: dict of file name -> bytes
+    """
+    rendered = {}
+    if input_para_dict is not None:
+        rendered["INPUT"] = render_abacus_input(input_para_dict)
+    if kpt_para_dict is not None:
+        rendered["KPT"] = render_abacus_kpt(kpt_para_dict)
+    if stru_para_dict is not None:
+        rendered["STRU"] = render_abacus_stru(stru_para_dict, precision=precision)
+    return rendered
+
+
+def hash_rendered_task(rendered: Mapping[str, bytes]) -> str:
+    """
+    sha256 of a rendered task, independent of the order of files.
+    """
+    sha = hashlib.sha256()
+    for name in sorted(rendered):
+        sha.update(name.encode())
+        sha.update(b"\0")
+        sha.update(hashlib.sha256(rendered[name]).digest())
+    return sha.hexdigest()
+
+
+def write_rendered_tasks(rendered_tasks: Mapping[str, Mapping[str, bytes]], root="."):
+    """
+    Write many rendered tasks at once.
+
+    :param rendered_tasks: dict of task root (relative to `root`) -> rendered task.
+    :param root:
+    :return: list of written paths.
+    """
+    root = pathlib.Path(root)
+    written = []
+    for task_root, rendered in rendered_tasks.items():
+        task_root = root / task_root
+        task_root.mkdir(parents=True, exist_ok=True)
+        for name, content in rendered.items():
+            with open(task_root / name, "wb") as f:
+                f.write(content)
+            written.append(task_root / name)
+    return written
+
+
+def pack_rendered_tasks(rendered_tasks: Mapping[str, Mapping[str, bytes]], tar_file, mode="w:gz"):
+    """
+    Pack many rendered tasks into a tarball directly, without writing them to disk.
+
+    :param rendered_tasks: dict of task root -> rendered task, task root is the directory in tarball.
+    :param tar_file: path or file object of tarball.
+    :param str mode: mode of `tarfile.open`.
+    """
+    mtime = time.time()
+    if isinstance(tar_file, (str, os.PathLike)):
+        tar = tarfile.open(tar_file, mode=mode)
+    else:
+        tar = tarfile.open(fileobj=tar_file, mode=mode)
+    with tar:
+        for task_root, rendered in rendered_tasks.items():
+            for name, content in rendered.items():
+                info = tarfile.TarInfo((pathlib.PurePosixPath(task_root) / name).as_posix())
+                info.size = len(content)
+                info.mtime = mtime
+                tar.addfile(info, io.BytesIO(content))
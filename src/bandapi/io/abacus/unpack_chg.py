@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : unpack_chg.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+import ast
+import hashlib
+import struct
+import sys
+import zipfile
+from array import array
+
+"""
+Self-contained unpacker of charge density packed by `bandapi.io.abacus.chg.pack_abacus_chg`.
+
+It only needs the python standard library, so it is uploaded with tasks and run on remotes without bandapi or numpy:
+`python unpack_chg.py OUT.ABACUS/SPIN1_CHG.npz`. The text written is the same as `unpack_abacus_chg`.
+Keep it free of imports outside the standard library.
+"""
+
+NpyTypecodes = {"f8": "d", "f4": "f", "i8": "q", "i4": "i"}
+
+
+def read_npy(data):
+    """
+    :param bytes data: content of a `.npy` file of a 0-d or 1-d array.
+    :return: str for unicode arrays, else list of numbers.
+    """
+    if data[:6] != b"\x93NUMPY":
+        raise ValueError("Not a npy file.")
+    if data[6] == 1:
+        header_len, start = struct.unpack("<H", data[8:10])[0], 10
+    else:
+        header_len, start = struct.unpack("<I", data[8:12])[0], 12
+    header = ast.literal_eval(data[start:start + header_len].decode("latin1"))
+    body = data[start + header_len:]
+    byteorder, kind = header["descr"][0], header["descr"][1:]
+    if kind.startswith("U"):
+        return body.decode("utf-32-be" if byteorder == ">" else "utf-32-le").rstrip("\x00")
+    if kind not in NpyTypecodes:
+        raise ValueError(f"Unsupported dtype {header['descr']} of npy file.")
+    values = array(NpyTypecodes[kind])
+    values.frombytes(body)
+    if byteorder in "<>" and byteorder != {"little": "<", "big": ">"}[sys.byteorder]:
+        values.byteswap()
+    count = 1
+    for item in header["shape"]:
+        count *= item
+    if len(values) != count:
+        raise ValueError(f"Expect {count} values of shape {header['shape']} in npy file, got {len(values)}.")
+    return values.tolist()
+
+
+def unpack_chg(packed_file, chg_file=None):
+    """
+    :param packed_file: path of `SPIN*_CHG.npz`.
+    :param chg_file: default to `packed_file` without `.npz`.
+    :return: path of charge density file.
+    """
+    packed_file = str(packed_file)
+    chg_file = chg_file or packed_file[:-len(".npz")]
+    with zipfile.ZipFile(packed_file) as f:
+        data = {name[:-len(".npy")]: read_npy(f.read(name)) for name in f.namelist()}
+    values = array("d", data["values"])
+    if hashlib.sha256(values.tobytes()).hexdigest() != data["checksum"]:
+        raise ValueError(f"Checksum of {packed_file} mismatch, it may be broken.")
+    fmt = f"%.{data['precision'][0]}e"
+    with open(chg_file, "w", newline="") as f:
+        f.write(data["header"])
+        for idx in range(0, len(values), 8):
+            f.write(" ".join(fmt % item for item in values[idx:idx + 8]) + "\n")
+    return chg_file
+
+
+if __name__ == '__main__':
+    for file in sys.argv[1:]:
+        unpack_chg(file)
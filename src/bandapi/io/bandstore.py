@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : bandstore.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+import json
+import os
+import pathlib
+from collections import namedtuple
+
+import numpy as np
+
+BandRecord = namedtuple("BandRecord", ["energies", "kpoints", "fermi_energy", "path", "special_points"])
+
+
+class BandArchive:
+    def __init__(self, root, mode="r", dtype="float32", shard_size=256 * 1024 ** 2, compress=False):
+        """
+        Binary archive of band structures keyed by material id.
+
+        Band data are stored in shards under `root`, `index.json` records the shard and offset of each material.
+        An uncompressed shard is a pair of `.npy` files (flat energies and k-points) which are memory-mapped when
+        read, so one material is sliced out without loading the others.
+        A compressed shard is one `.npz` file, it is loaded as a whole on first access.
+
+        Usage:
+        ```
+        with BandArchive("bands", mode="a") as archive:
+            archive.add("mp-149", energies=bandArray, kpoints=kpathArray, fermi_energy=6.2)
+        BandArchive("bands")["mp-149"].energies
+        ```
+
+        :param root: directory of archive.
+        :param str mode: "r" to read, "a" to read and append.
+        :param dtype: dtype of energies for new archive, "float32" or "float64".
+        :param int shard_size: bytes of energies buffered before a shard is written.
+        :param bool compress: write new shards as compressed `.npz`.
+        """
+        if mode not in ["r", "a"]:
+            raise ValueError(f"Unknown mode {mode}, it should be `r' or `a'.")
+        self.root = pathlib.Path(root)
+        self.mode = mode
+        self.shard_size = shard_size
+        self.compress = compress
+        if self.index_file.exists():
+            with open(self.index_file, "r") as f:
+                self.index = json.load(f)
+        elif mode == "a":
+            self.root.mkdir(parents=True, exist_ok=True)
+            self.index = {"dtype": np.dtype(dtype).name, "shards": [], "materials": {}}
+        else:
+            raise FileNotFoundError(f"No band archive at {self.root}.")
+        self.dtype = np.dtype(self.index["dtype"])
+        self._loaded_shards = {}
+        self._buffer = []
+        self._buffer_bytes = 0
+
+    @property
+    def index_file(self):
+        return self.root / "index.json"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.index["materials"])
+
+    def __contains__(self, material_id):
+        return material_id in self.index["materials"]
+
+    def keys(self):
+        return self.index["materials"].keys()
+
+    def add(self, material_id, energies, kpoints, fermi_energy=None, path=None, special_points=None):
+        """
+        Add band structure of one material. Data are written when the shard is full or the archive is closed.
+        Adding an existing material id replaces it in the index.
+
+        :param str material_id:
+        :param np.ndarray energies: (nspin, nk, nbands) band energies.
+        :param np.ndarray kpoints: (nk, 3) k-points.
+        :param float fermi_energy:
+        :param str path: band path labels, like "GXWKGLUWLK,UX".
+        :param dict special_points: label -> coordinate of special points.
+        """
+        if self.mode != "a":
+            raise PermissionError(f"Band archive {self.root} is opened as read-only.")
+        energies = np.asarray(energies, dtype=self.dtype)
+        kpoints = np.asarray(kpoints, dtype=np.float64).reshape([-1, 3])
+        if energies.ndim != 3 or energies.shape[1] != kpoints.shape[0]:
+            raise ValueError(f"Shape of energies {energies.shape} mismatch with k-points {kpoints.shape}.")
+        self._buffer.append((material_id, energies, kpoints, {
+            "fermi_energy": None if fermi_energy is None else float(fermi_energy),
+            "path": path,
+            "special_points": None if special_points is None else {
+                key: list(map(float, value)) for key, value in special_points.items()
+            },
+        }))
+        self._buffer_bytes += energies.nbytes + kpoints.nbytes
+        if self._buffer_bytes >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write buffered materials as a new shard and update index.
+        """
+        if not self._buffer:
+            return
+        shard_idx = len(self.index["shards"])
+        shard_name = f"shard-{shard_idx:05d}"
+        energies = np.concatenate([item[1].reshape(-1) for item in self._buffer])
+        kpoints = np.concatenate([item[2] for item in self._buffer])
+        if self.compress:
+            np.savez_compressed(self.root / f"{shard_name}.npz", energies=energies, kpoints=kpoints)
+        else:
+            np.save(self.root / f"{shard_name}.energies.npy", energies)
+            np.save(self.root / f"{shard_name}.kpoints.npy", kpoints)
+        self.index["shards"].append({"name": shard_name, "compressed": self.compress})
+        energy_offset = 0
+        kpt_offset = 0
+        for material_id, item_energies, item_kpoints, meta in self._buffer:
+            self.index["materials"][material_id] = {
+                "shard": shard_idx,
+                "energy_offset": energy_offset,
+                "shape": list(item_energies.shape),
+                "kpt_offset": kpt_offset,
+                **meta,
+            }
+            energy_offset += item_energies.size
+            kpt_offset += item_kpoints.shape[0]
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._write_index()
+
+    def _write_index(self):
+        tmp_file = self.index_file.with_name(self.index_file.name + ".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_file, self.index_file)
+
+    def close(self):
+        if self.mode == "a":
+            self.flush()
+        self._loaded_shards = {}
+
+    def _shard(self, shard_idx):
+        if shard_idx not in self._loaded_shards:
+            shard = self.index["shards"][shard_idx]
+            if shard["compressed"]:  # only one compressed shard is kept in memory
+                self._loaded_shards = {
+                    key: value for key, value in self._loaded_shards.items() if not self.index["shards"][key]["compressed"]
+                }
+                with np.load(self.root / f"{shard['name']}.npz") as data:
+                    self._loaded_shards[shard_idx] = (data["energies"], data["kpoints"])
+            else:
+                self._loaded_shards[shard_idx] = (
+                    np.load(self.root / f"{shard['name']}.energies.npy", mmap_mode="r"),
+                    np.load(self.root / f"{shard['name']}.kpoints.npy", mmap_mode="r"),
+                )
+        return self._loaded_shards[shard_idx]
+
+    def __getitem__(self, material_id) -> BandRecord:
+        try:
+            meta = self.index["materials"][material_id]
+        except KeyError:
+            raise KeyError(f"There is no {material_id} in band archive {self.root}.")
+        energies, kpoints = self._shard(meta["shard"])
+        shape = meta["shape"]
+        return BandRecord(
+            energies=energies[meta["energy_offset"]:meta["energy_offset"] + int(np.prod(shape))].reshape(shape),
+            kpoints=kpoints[meta["kpt_offset"]:meta["kpt_offset"] + shape[1]],
+            fermi_energy=meta["fermi_energy"],
+            path=meta["path"],
+            special_points=meta["special_points"],
+        )
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : sqlitedb.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+import contextlib
+import pathlib
+import sqlite3
+import threading
+
+"""
+SQLite database shared by threads and processes, base of `CampaignQueue` and `FlowStateDB`.
+
+Each thread has its own connection in autocommit mode, and writes are explicit `BEGIN IMMEDIATE` transactions,
+so a writer takes the lock before reading and two processes never upgrade their locks against each other.
+"""
+
+
+class SQLiteDB:
+    _schema = []  # statements creating tables and indexes, run once when the database is opened
+
+    def __init__(self, path, timeout=60):
+        """
+        :param path: SQLite database file.
+        :param float timeout: seconds to wait for the lock of database.
+        """
+        self.path = pathlib.Path(path).expanduser().absolute()
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._transaction() as conn:
+            for statement in self._schema:
+                conn.execute(statement)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        Connection of current thread, in autocommit mode so transactions are explicit.
+        """
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path.as_posix(), timeout=self.timeout, isolation_level=None)
+            self._local.connection = conn
+        return conn
+
+    def close(self):
+        """
+        Close connection of current thread, a new one is opened on the next use.
+        """
+        conn = getattr(self._local, "connection", None)
+        if conn is not None:
+            conn.close()
+            self._local.connection = None
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self.connection
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
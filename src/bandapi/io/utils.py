@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# ====================================== #
+# @Author  : Yanbo Han
+# @Email   : yanbohan98@gmail.com
+# @File    : utils.py
+# ALL RIGHTS ARE RESERVED UNLESS STATED.
+# ====================================== #
+import hashlib
+import os
+import pathlib
+import shutil
+import uuid
+
+
+def file_sha256(file, chunk_size=1024 ** 2) -> str:
+    """
+    sha256 of file content, read in chunks.
+
+    :param file: path of file.
+    :return: hex digest.
+    """
+    sha = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def link_or_copy(src, dst):
+    """
+    Hard-link `src` to `dst`, copy if hard link is impossible, e.g. across file systems.
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def store_file(file, store_root, sha=None) -> pathlib.Path:
+    """
+    Put a copy of file into content-addressed store `store_root/<sha[:2]>/<sha><suffix>`, existing one is reused.
+
+    :param sha: known sha256 of file, computed if None.
+    :return: path of file in store.
+    """
+    file = pathlib.Path(file)
+    sha = file_sha256(file) if sha is None else sha
+    stored = pathlib.Path(store_root) / sha[:2] / f"{sha}{file.suffix}"
+    if not stored.exists():
+        stored.parent.mkdir(parents=True, exist_ok=True)
+        tmp = stored.with_name(f".{uuid.uuid4().hex}.tmp")
+        shutil.copy2(file, tmp)
+        os.replace(tmp, stored)
+    return stored
@@ -5,11 +5,23 @@
 # @File    : matproj.py
 # ALL RIGHTS ARE RESERVED UNLESS STATED.
 # ====================================== #
-import tempfile
-import urllib.request
+import http.client
+import io
+import json
+import os
+import pathlib
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
 import ase.io.vasp
+import numpy as np
+from bandapi.flow.flowlog import Logger
+
+logger = Logger(__name__)
 
 USE_PYMATGEN = False
 try:
@@ -20,44 +32,331 @@ try:
 except ImportError:
     pass
 
-MatProjAPIUrl = "https://www.materialsproject.org/rest/v2/materials/{}/vasp?API_KEY={}"
+MatProjAPIBase = "https://www.materialsproject.org/rest"
+UserAgent = 'Mozilla/5.0 3578.98 Safari/537.36'
+
+
+class RateLimiter:
+    def __init__(self, rate=None):
+        """
+        Space calls of `wait` at least `1/rate` seconds apart over all threads.
+
+        :param float rate: calls per second, None for no limit.
+        """
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class KeepAliveClient:
+    RetryStatus = (429, 500, 502, 503, 504)
+
+    def __init__(self, base_url, headers=None, timeout=30, retries=3, backoff=0.5, rate_limit=None):
+        """
+        HTTP json client keeping one persistent connection per thread.
+
+        :param str base_url: like `https://www.materialsproject.org/rest`, paths of requests are appended to it.
+        :param dict headers: headers of all requests.
+        :param float timeout: seconds of socket timeout.
+        :param int retries: retries of connection errors and status of `RetryStatus`.
+        :param float backoff: seconds of first retry, doubled for each retry.
+        :param float rate_limit: requests per second over all threads.
+        """
+        url = urllib.parse.urlsplit(base_url)
+        self.scheme = url.scheme
+        self.netloc = url.netloc
+        self.base_path = url.path.rstrip("/")
+        self.headers = {"User-Agent": UserAgent, "Connection": "keep-alive", **(headers or {})}
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limiter = RateLimiter(rate_limit)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = conn_class(self.netloc, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def request(self, method, path, params=None, data=None):
+        """
+        :param str path: path after base url.
+        :param dict params: query of url.
+        :param dict data: form data of POST.
+        :return: decoded json.
+        """
+        url = self.base_path + path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        headers = dict(self.headers)
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.wait()
+            try:
+                conn = self._connection()
+                conn.request(method, url, body=body, headers=headers)
+                response = conn.getresponse()
+                content = response.read()
+                if response.getheader("Connection", "").lower() == "close":
+                    self._reset()
+                if response.status in self.RetryStatus and attempt < self.retries:
+                    time.sleep(self.backoff * 2 ** attempt)
+                    continue
+                if response.status >= 400:
+                    raise RuntimeError(f"HTTP {response.status} of {method} {url}: {content[:200]!r}")
+                return json.loads(content)
+            except (http.client.HTTPException, OSError):
+                self._reset()
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def get(self, path, params=None):
+        return self.request("GET", path, params=params)
+
+    def post(self, path, data=None):
+        return self.request("POST", path, data=data)
+
+
+class StructureCache:
+    def __init__(self, root, ttl=None, max_entries=None, max_bytes=None):
+        """
+        On-disk cache of parsed structures keyed by Material Project id.
+
+        One structure is one `<id>.npz` of atomic numbers, positions, cell and pbc, it is loaded without parsing CIF.
+        The modification time of file is its last access time for LRU eviction.
+
+        :param root: directory of cache.
+        :param float ttl: seconds a structure is valid after it is fetched, None for ever.
+        :param int max_entries: number of structures kept.
+        :param int max_bytes: total size of files kept.
+        """
+        self.root = pathlib.Path(root).expanduser()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def _file(self, id) -> pathlib.Path:
+        return self.root / f"{id}.npz"
+
+    def __contains__(self, id):
+        return self.get(id, touch=False) is not None
+
+    def get(self, id, allow_expired=False, touch=True):
+        """
+        :return: ase.Atoms, or None if missing or expired.
+        """
+        file = self._file(id)
+        try:
+            with np.load(file) as data:
+                if not allow_expired and self.ttl is not None and time.time() - float(data["fetched"]) > self.ttl:
+                    return None
+                atoms = ase.Atoms(numbers=data["numbers"], positions=data["positions"], cell=data["cell"], pbc=data["pbc"])
+        except (OSError, ValueError, KeyError):
+            return None
+        if touch:
+            try:
+                os.utime(file)
+            except OSError:
+                pass
+        return atoms
+
+    def put(self, id, atoms: ase.Atoms):
+        file = self._file(id)
+        tmp = file.with_name(f".{uuid.uuid4().hex}.npz")
+        np.savez(tmp, numbers=atoms.numbers, positions=atoms.positions, cell=atoms.cell[:], pbc=atoms.pbc, fetched=time.time())
+        os.replace(tmp, file)
+
+    def evict(self):
+        """
+        Remove least recently used structures until the cache is within `max_entries` and `max_bytes`.
+
+        :return: list of removed ids.
+        """
+        if self.max_entries is None and self.max_bytes is None:
+            return []
+        entries = sorted((item.stat().st_mtime, item.stat().st_size, item) for item in self.root.glob("*.npz") if not item.name.startswith("."))
+        total = sum(item[1] for item in entries)
+        removed = []
+        while entries and ((self.max_entries is not None and len(entries) > self.max_entries)
+                           or (self.max_bytes is not None and total > self.max_bytes)):
+            _, size, file = entries.pop(0)
+            file.unlink()
+            total -= size
+            removed.append(file.name[:-len(".npz")])
+        return removed
 
 
 class MatProjWrapper:
-    def __init__(self, API_KEY, force_not_use_pymatgen=False):
+    _connect_checked = {}
+
+    def __init__(self, API_KEY, force_not_use_pymatgen=False, api_url=MatProjAPIBase, max_workers=8,
+                 batch_size=50, rate_limit=None, retries=3, timeout=30, cache=None, offline=False):
+        """
+        Fetch structures from Material Project.
+
+        :param str API_KEY:
+        :param bool force_not_use_pymatgen:
+        :param str api_url: base url of REST API, e.g. of a mirror or a local stub server.
+        :param int max_workers: concurrent requests of `get_structures_by_ids`.
+        :param int batch_size: ids of one multi-id query of `get_structures_by_ids`, 1 to query each id alone.
+        :param float rate_limit: requests per second.
+        :param int retries: retries of failed requests.
+        :param float timeout: seconds of socket timeout.
+        :param cache: StructureCache or its directory, structures are fetched only if they are not cached.
+        :param bool offline: never touch network, structures are only read from cache (even expired).
+        """
         self.API_KEY = API_KEY
+        self.cache = StructureCache(cache) if isinstance(cache, (str, os.PathLike)) else cache
+        self.offline = offline
+        if offline and self.cache is None:
+            raise ValueError("Offline mode needs a structure cache.")
+        self.api_url = api_url
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.client = KeepAliveClient(api_url, headers={"X-API-KEY": API_KEY}, timeout=timeout, retries=retries, rate_limit=rate_limit)
         if USE_PYMATGEN and not force_not_use_pymatgen:
             self.mprester = MPRester(API_KEY)
             self.USE_PYMATGEN = True
         else:
             self.USE_PYMATGEN = False
 
-    def test_connet(self):
-        if self.USE_PYMATGEN:
-            result = self.mprester.api_check()
-        else:
-            url = "https://www.materialsproject.org/rest/v1/api_check?API_KEY={}".format(self.API_KEY)
-            url = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0 3578.98 Safari/537.36'})
-            result = urllib.request.urlopen(url)
-            import json
-            result = json.load(result)
-        return result["valid_response"]
-
+    def test_connet(self, refresh=False):
+        """
+        Check API_KEY, the result is memoized per url and API_KEY in this process.
+        """
+        if self.offline:
+            return True
+        key = (self.USE_PYMATGEN, self.api_url, self.API_KEY)
+        if refresh or key not in self._connect_checked:
+            if self.USE_PYMATGEN:
+                result = self.mprester.api_check()
+            else:
+                result = self.client.get("/v1/api_check", params={"API_KEY": self.API_KEY})
+            self._connect_checked[key] = result["valid_response"]
+        return self._connect_checked[key]
 
     def get_structure_by_id(self, id):
+        if self.cache is not None:
+            atoms = self.cache.get(id, allow_expired=self.offline)
+            if atoms is not None:
+                return [atoms]
+            if self.offline:
+                raise RuntimeError(f"Material Project ID '{id}' is not cached, and network is not used in offline mode.")
+            result = self._fetch_structure_by_id(id)
+            self.cache.put(id, result[0])
+            self.cache.evict()
+            return result
+        return self._fetch_structure_by_id(id)
+
+    def _fetch_structure_by_id(self, id):
         if self.USE_PYMATGEN:
             return self._result_wrapper(self.mprester.get_structure_by_material_id(id), _pymatgen=True)
         else:
-            url = MatProjAPIUrl.format(id, self.API_KEY)
-            url = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0 3578.98 Safari/537.36'})
-            result = urllib.request.urlopen(url)
-            result=self._result_wrapper(result, _pymatgen=False)
+            result = self._result_wrapper(self.client.get(f"/v2/materials/{id}/vasp", params={"API_KEY": self.API_KEY}), _pymatgen=False)
             try:
                 result[0]
                 return result
-            except KeyError:
+            except (KeyError, IndexError, TypeError):
                 raise RuntimeError(f"Material Project ID '{id}' response nothing.")
 
+    def _query_cifs(self, ids):
+        response = self.client.post("/v2/query", data={
+            "criteria": json.dumps({"task_id": {"$in": list(ids)}}),
+            "properties": json.dumps(["task_id", "cif"]),
+        })
+        self._check_response(response)
+        return {item["task_id"]: item["cif"] for item in response["response"]}
+
+    def get_structures_by_ids(self, ids, errors="raise"):
+        """
+        Fetch many structures concurrently. Ids are queried `batch_size` at once over `max_workers` threads,
+        each thread keeps its connection alive.
+
+        Cached structures are not fetched again, see `StructureCache`.
+
+        :param ids: Material Project ids.
+        :param str errors: "raise" raises RuntimeError for ids without structure after all are fetched,
+            "ignore" leaves them out. Ids of a batch which failed (e.g. HTTP error after retries) are logged
+            and treated as without structure, other batches are kept.
+        :return: dict of id -> List[ase.Atoms], in order of ids.
+        """
+        ids = list(dict.fromkeys(ids))
+        results = {}
+        if self.cache is not None:
+            for item in ids:
+                atoms = self.cache.get(item, allow_expired=self.offline)
+                if atoms is not None:
+                    results[item] = [atoms]
+        to_fetch = [] if self.offline else [item for item in ids if item not in results]
+        batch_size = 1 if self.USE_PYMATGEN else self.batch_size
+        batches = [to_fetch[idx:idx + batch_size] for idx in range(0, len(to_fetch), batch_size)]
+
+        def fetch(batch):
+            try:
+                if self.USE_PYMATGEN:
+                    return {item: self._fetch_structure_by_id(item) for item in batch}
+                return {key: self._read_cif(cif) for key, cif in self._query_cifs(batch).items()}
+            except Exception as e:
+                logger.error(f"Fetching Material Project IDs {batch} failed: {e!r}")
+                return {}
+
+        if batches:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for result in executor.map(fetch, batches):
+                    if self.cache is not None:
+                        for item, atoms in result.items():
+                            if atoms:
+                                self.cache.put(item, atoms[0])
+                    results.update(result)
+            if self.cache is not None:
+                self.cache.evict()
+        missing = [item for item in ids if not results.get(item)]
+        if missing and errors == "raise":
+            raise RuntimeError(f"Material Project ID {missing} response nothing.")
+        return {item: results[item] for item in ids if results.get(item)}
+
+    def _check_response(self, result):
+        if not result.get("valid_response", False) and not result.get("api_key_valid", True):
+            raise ValueError(f"Invalid API_KEY: {self.API_KEY}. Check your API_KEY at https://www.materialsproject.org/open!")
+
+    @staticmethod
+    def _read_cif(cif) -> List[ase.atoms.Atoms]:
+        """
+        Parse CIF text in memory.
+        """
+        return ase.io.read(io.StringIO(cif), index=':', format="cif")
+
+    @staticmethod
+    def _read_poscar(poscar) -> List[ase.atoms.Atoms]:
+        """
+        Parse POSCAR text in memory.
+        """
+        return ase.io.read(io.StringIO(poscar), index=':', format="vasp")
+
     def _result_wrapper(self, result, _pymatgen) -> List[ase.atoms.Atoms]:
         """
         Deal with different result using or not using pymatgen.
@@ -66,26 +365,15 @@ class MatProjWrapper:
         :return:
         """
         if _pymatgen:
-            _, fname = tempfile.mkstemp(text=True)
-            with open(fname, "w") as f:
-                f.write(result.to("poscar"))
-            return ase.io.read(fname, index=':', format="vasp")
+            return self._read_poscar(result.to(fmt="poscar"))
         else:
-            import json
-            result = json.load(result)
-            if result["valid_response"]:
-                _, fname = tempfile.mkstemp(text=True)
-                with open(fname, "w") as f:
-                    f.write(result["response"][0]["cif"])
-                return ase.io.read(fname, index=':', format="cif")
-            elif not result["api_key_valid"]:
-                raise ValueError(f"Invalid API_KEY: {self.API_KEY}. Check your API_KEY at https://www.materialsproject.org/open!")
+            if result["valid_response"] and result["response"]:
+                return self._read_cif(result["response"][0]["cif"])
+            self._check_response(result)
+            return []
 
 
 if __name__ == '__main__':
-    import json
-    import tempfile
-
     API_KEY = ""
     w = MatProjWrapper(API_KEY, force_not_use_pymatgen=True)
     result = w.get_structure_by_id("mp-1283030")
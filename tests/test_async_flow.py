@@ -0,0 +1,97 @@
+import asyncio
+import time
+import types
+
+from bandapi.dispatcher.dpdispatcher import Submission
+from bandapi.flow import Flow, run_flows
+
+
+class CountingSubmission(Submission):
+    def __init__(self, checks):
+        self.belonging_jobs = []
+        self.checks = checks
+        self.calls = []
+        self.submission_hash = "hash"
+        self.machine = None
+
+    def _record(name, result=None):
+        def method(self):
+            time.sleep(0.01)  # blocking I/O
+            self.calls.append(name)
+            return result
+        return method
+
+    generate_jobs = _record("generate_jobs")
+    try_recover_from_json = _record("try_recover_from_json")
+    upload_jobs = _record("upload_jobs")
+    handle_unexpected_submission_state = _record("handle_unexpected_submission_state")
+    submission_to_json = _record("submission_to_json")
+    download_jobs = _record("download_jobs")
+    clean_jobs = _record("clean_jobs")
+
+    def check_all_finished(self):
+        self.calls.append("check_all_finished")
+        return self.calls.count("check_all_finished") > self.checks
+
+    def serialize(self):
+        return {"calls": self.calls}
+
+
+def test_async_run_submission_concurrently():
+    submissions = [CountingSubmission(checks=3) for _ in range(20)]
+
+    async def main():
+        return await asyncio.gather(*[item.async_run_submission(period=0.2) for item in submissions])
+
+    start = time.perf_counter()
+    results = asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    assert elapsed < 20 * 3 * 0.2 / 4  # far from running one by one
+    assert results[0]["calls"][:2] == ["generate_jobs", "try_recover_from_json"]
+    assert results[0]["calls"][-2:] == ["download_jobs", "clean_jobs"]
+    assert results[0]["calls"].count("upload_jobs") == 1
+
+
+class DummyFlow(Flow):
+    def __init__(self, name, states=2):
+        super(DummyFlow, self).__init__(use_dpdispatcher=False)
+        self.name = name
+        self.log = []
+        self._flow_state_controler = types.SimpleNamespace(
+            flow_list=[f"state{idx}" for idx in range(states)], flow_list_flag=0, task_content=[name],
+            submit_loop_condition=True, submit_break_condition=False,
+        )
+
+    def prepare(self):
+        self.log.append(("prepare", self.flow_state_controler.flow_list_flag))
+
+    def gather_submission(self):
+        self.log.append(("gather_submission", self.flow_state_controler.flow_list_flag))
+
+    def run_dispatch(self):
+        time.sleep(0.2)
+
+    async def arun_dispatch(self, executor=None):
+        await asyncio.sleep(0.2)
+
+    def run_end(self):
+        controler = self.flow_state_controler
+        self.log.append(("run_end", controler.flow_list_flag))
+        controler.flow_list_flag += 1
+        controler.submit_loop_condition = controler.flow_list_flag < len(controler.flow_list)
+
+
+def test_submit_flows():
+    flows = [DummyFlow(f"mp-{idx}") for idx in range(30)]
+    start = time.perf_counter()
+    results = run_flows(flows, max_concurrent=10)
+    assert time.perf_counter() - start < 30 * 2 * 0.2 / 2
+    assert results == [None] * 30
+    assert flows[0].log == [("prepare", 0), ("gather_submission", 0), ("run_end", 0),
+                            ("prepare", 1), ("gather_submission", 1), ("run_end", 1)]
+
+    def broken():
+        raise RuntimeError("no structure")
+
+    results = run_flows([broken, lambda: DummyFlow("mp-1", states=1)])
+    assert isinstance(results[0], RuntimeError) and results[1] is None
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from bandapi.io.bandstore import BandArchive
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_band_archive(tmp_path, compress):
+    rng = np.random.default_rng(0)
+    data = {f"mp-{idx}": (rng.uniform(-10, 10, size=(1, 5 + idx, 4)), rng.uniform(size=(5 + idx, 3))) for idx in range(5)}
+    with BandArchive(tmp_path / "bands", mode="a", dtype="float64", shard_size=500, compress=compress) as archive:
+        for material_id, (energies, kpoints) in data.items():
+            archive.add(material_id, energies=energies, kpoints=kpoints, fermi_energy=1.0, path="GX", special_points={"G": [0, 0, 0]})
+    archive = BandArchive(tmp_path / "bands")
+    assert len(archive) == 5
+    assert len(archive.index["shards"]) > 1
+    for material_id, (energies, kpoints) in data.items():
+        record = archive[material_id]
+        np.testing.assert_allclose(record.energies, energies)
+        np.testing.assert_allclose(record.kpoints, kpoints)
+        assert record.fermi_energy == 1.0
+        assert record.special_points == {"G": [0.0, 0.0, 0.0]}
+    with pytest.raises(PermissionError):
+        archive.add("mp-5", energies=energies, kpoints=kpoints)
+    with pytest.raises(KeyError):
+        archive["mp-5"]
+
+
+def test_band_archive_append(tmp_path):
+    with BandArchive(tmp_path, mode="a") as archive:
+        archive.add("mp-1", energies=np.zeros([1, 2, 3]), kpoints=np.zeros([2, 3]))
+    with BandArchive(tmp_path, mode="a") as archive:
+        archive.add("mp-2", energies=np.ones([2, 2, 3]), kpoints=np.zeros([2, 3]))
+    archive = BandArchive(tmp_path)
+    assert archive["mp-1"].energies.dtype == np.float32
+    assert archive["mp-2"].energies.shape == (2, 2, 3)
+    assert isinstance(archive["mp-2"].energies.base, np.memmap) or isinstance(archive["mp-2"].energies, np.memmap)
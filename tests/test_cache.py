@@ -0,0 +1,96 @@
+import os
+import pathlib
+import time
+
+from bandapi.flow.cache import ResultCache, task_cache_key
+
+FinishedScfLog = " ELEC=1\n charge density convergence is achieved\n final etot is -211.3 eV\n Total  Time  : 0 h 0 mins 5 secs \n"
+
+
+def _write(path, content):
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    return path
+
+
+def test_task_cache_key(tmpdir):
+    a = {"INPUT": _write(tmpdir / "a" / "INPUT", "scf"), "STRU": _write(tmpdir / "a" / "STRU", "Si")}
+    b = {"STRU": _write(tmpdir / "b" / "STRU", "Si"), "INPUT": _write(tmpdir / "b" / "INPUT", "scf")}
+    assert task_cache_key(a, "abacus") == task_cache_key(b, "abacus")
+    assert task_cache_key(a, "abacus") != task_cache_key(a, "mpirun abacus")
+    _write(tmpdir / "b" / "INPUT", "nscf")
+    assert task_cache_key(a, "abacus") != task_cache_key(b, "abacus")
+
+
+def test_result_cache_restore_and_evict(tmpdir):
+    cache = ResultCache(tmpdir / "cache", max_entries=2)
+    _write(tmpdir / "run" / "OUT.ABACUS" / "running_scf.log", "done")
+    assert not cache.restore("k1", tmpdir / "other" / "OUT.ABACUS")
+    cache.put("k1", tmpdir / "run" / "OUT.ABACUS")
+    assert cache.restore("k1", tmpdir / "other" / "OUT.ABACUS")
+    assert (tmpdir / "other" / "OUT.ABACUS" / "running_scf.log").read() == "done"
+    cache.put("k2", tmpdir / "run" / "OUT.ABACUS")
+    os.utime(cache.get("k2").parent / ResultCache.MetaFile, (time.time() - 100, time.time() - 100))
+    cache.put("k3", tmpdir / "run" / "OUT.ABACUS")
+    assert "k2" not in cache
+    assert "k1" in cache and "k3" in cache
+    # rewriting a task directory does not touch the cache
+    _write(tmpdir / "other" / "OUT.ABACUS" / "running_scf.log", "rerun")
+    _write(tmpdir / "run" / "OUT.ABACUS" / "running_scf.log", "rerun")
+    assert (cache.get("k1") / "running_scf.log").read_text() == "done"
+    _write(tmpdir / "other" / "OUT.ABACUS" / "running_scf.log", "done")
+    # restored copies survive eviction
+    cache.remove("k1")
+    assert (tmpdir / "other" / "OUT.ABACUS" / "running_scf.log").read() == "done"
+
+
+def test_scf_state_uses_result_cache(tmpdir):
+    from ase.build import bulk
+    from bandapi.flow.abacus.calculation_state import AbacusScfState
+    settings = {"potential_name": "SG15", "result_cache": (tmpdir / "cache").strpath, "remote_command": "abacus"}
+    state = AbacusScfState({"mp-149": bulk("Si")}, tmpdir / "campaign1", **settings)
+    state.check_exist_status = {}
+    (tmpdir / "campaign1" / "scf" / "mp-149").ensure(dir=True)
+    state.bakeup(state.task_content)
+    assert len(state.prepare(state.task_content, settings)) == 1
+    _write(tmpdir / "campaign1" / "scf" / "mp-149" / "OUT.ABACUS" / "running_scf.log", " ELEC=1\n")
+    state.store_results()  # crashed run is not cached
+    assert state.get_result_cache().entries() == []
+    state.prepare(state.task_content, settings)
+    _write(tmpdir / "campaign1" / "scf" / "mp-149" / "OUT.ABACUS" / "running_scf.log", FinishedScfLog)
+    state.store_results()
+
+    state = AbacusScfState({"mp-149": bulk("Si")}, tmpdir / "campaign2", **settings)
+    state.check_exist_status = {}
+    (tmpdir / "campaign2" / "scf" / "mp-149").ensure(dir=True)
+    state.bakeup(state.task_content)
+    assert len(state.prepare(state.task_content, settings)) == 0
+    assert (tmpdir / "campaign2" / "scf" / "mp-149" / "OUT.ABACUS" / "running_scf.log").read() == FinishedScfLog
+
+
+def test_scf_state_shares_pseudo(tmpdir):
+    from ase.build import bulk
+    from bandapi.flow.abacus.calculation_state import AbacusScfState
+    from bandapi.io.abacus.input import read_abacus_input
+    from bandapi.io.abacus.potential import AbacusPotential
+    settings = {"potential_name": "SG15", "share_pseudo": True, "pseudo_store": (tmpdir / "store").strpath, "remote_command": "abacus"}
+    state = AbacusScfState({"mp-149": bulk("Si"), "mp-2534": bulk("GaAs", "zincblende", a=5.65)}, tmpdir, **settings)
+    state.check_exist_status = {}
+    state.bakeup(state.task_content)
+    upf = AbacusPotential(pot_name="SG15")["Si"].name
+    assert read_abacus_input(tmpdir / "scf" / "mp-149" / "INPUT")["pseudo_dir"] == "../../pseudo/"
+    assert not (tmpdir / "scf" / "mp-149" / upf).exists()
+    assert state.get_forward_common_files() == sorted(f"pseudo/{AbacusPotential(pot_name='SG15')[item].name}" for item in ["Si", "Ga", "As"])
+    stored = list((tmpdir / "store").visit(fil=lambda item: item.check(file=1)))
+    assert len(stored) == 3
+    assert any(os.path.samefile(tmpdir / "pseudo" / upf, item) for item in stored)
+    tasks = state.prepare(state.task_content, settings)
+    assert all(upf not in task.forward_files for task in tasks)
+
+    settings["share_pseudo"] = False
+    state = AbacusScfState({"mp-149": bulk("Si")}, tmpdir, **settings)
+    state.check_exist_status = {}
+    state.bakeup(state.task_content)
+    assert (tmpdir / "scf" / "mp-149" / upf).exists()
+    assert state.prepare(state.task_content, settings)[0].forward_files == ["INPUT", "STRU", "KPT", upf]
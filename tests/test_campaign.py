@@ -0,0 +1,102 @@
+import multiprocessing
+import sqlite3
+import time
+
+import pytest
+from bandapi.flow.campaign import CampaignQueue, Heartbeat
+
+
+def test_campaign_queue(tmpdir):
+    path = tmpdir / "campaign.sqlite"
+    first = CampaignQueue(path, lease_seconds=0.3, max_attempts=2, worker="first")
+    second = CampaignQueue(path, lease_seconds=0.3, max_attempts=2, worker="second")
+    assert first.add([f"mp-{idx}" for idx in range(5)]) == 5
+    assert second.add(["mp-0", "mp-5", ""]) == 1
+
+    claimed = first.claim(4)
+    assert claimed == ["mp-0", "mp-1", "mp-2", "mp-3"]
+    assert second.claim(4) == ["mp-4", "mp-5"]
+    assert second.claim(4) == []
+    assert second.complete(["mp-4", "mp-5"]) == 2
+    assert first.complete(claimed[:2]) == 2
+    assert second.heartbeat(claimed) == 0  # not held by second
+
+    time.sleep(0.4)  # first crashed, leases of mp-2 and mp-3 expire
+    assert first.counts()["expired"] == 2
+    assert second.claim(4) == ["mp-2", "mp-3"]
+    assert first.heartbeat(claimed[2:]) == 0
+    assert second.fail(["mp-2"], error="RuntimeError") == 1  # second attempt, failed
+    assert second.release(["mp-3"]) == 1
+    assert first.ids("failed") == ["mp-2"]
+    assert first.counts() == {"pending": 1, "leased": 0, "done": 4, "failed": 1, "expired": 0}
+    assert first.reset("failed") == 1
+    assert first.counts()["pending"] == 2
+
+
+def test_campaign_lease(tmpdir):
+    queue = CampaignQueue(tmpdir / "campaign.sqlite", lease_seconds=0.3)
+    queue.add(["mp-0", "mp-1"])
+    with queue.lease(batch_size=1, heartbeat_interval=0.05) as ids:
+        time.sleep(0.5)  # kept by heartbeats
+        assert CampaignQueue(tmpdir / "campaign.sqlite", worker="other").claim(1) == ["mp-1"]
+    assert queue.ids("done") == ids == ["mp-0"]
+    queue.add(["mp-2"])
+    with pytest.raises(RuntimeError):
+        with queue.lease() as ids:
+            raise RuntimeError("ssh")
+    assert queue.ids("pending") == ["mp-2"]
+
+
+def test_campaign_exhausted_lease(tmpdir):
+    queue = CampaignQueue(tmpdir / "campaign.sqlite", lease_seconds=0.1, max_attempts=1)
+    queue.add(["mp-0"])
+    assert queue.claim() == ["mp-0"]
+    time.sleep(0.2)  # crashed on the last attempt
+    assert queue.claim() == []
+    assert queue.ids("failed") == ["mp-0"]
+    assert queue.reset("failed") == 1
+    assert queue.claim() == ["mp-0"]
+
+
+def test_heartbeat_retries(tmpdir, monkeypatch):
+    queue = CampaignQueue(tmpdir / "campaign.sqlite", lease_seconds=60)
+    queue.add(["mp-0"])
+    ids = queue.claim()
+    calls = []
+    heartbeat = queue.heartbeat
+
+    def flaky(ids):
+        calls.append(ids)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return heartbeat(ids)
+
+    monkeypatch.setattr(queue, "heartbeat", flaky)
+    beat = Heartbeat(queue, ids, interval=0.02).start()
+    time.sleep(0.2)
+    beat.stop()
+    assert len(calls) > 2
+
+
+def _worker(path, result):
+    queue = CampaignQueue(path, lease_seconds=60)
+    while True:
+        with queue.lease(batch_size=3) as ids:
+            if not ids:
+                break
+            result.extend(ids)
+
+
+def test_campaign_multiprocess(tmpdir):
+    path = tmpdir / "campaign.sqlite"
+    ids = [f"mp-{idx}" for idx in range(200)]
+    CampaignQueue(path).add(ids)
+    with multiprocessing.Manager() as manager:
+        result = manager.list()
+        workers = [multiprocessing.Process(target=_worker, args=(str(path), result)) for _ in range(4)]
+        for item in workers:
+            item.start()
+        for item in workers:
+            item.join()
+        assert sorted(result) == sorted(ids)
+    assert CampaignQueue(path).counts()["done"] == 200
@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+from ase.build import bulk
+from bandapi.flow.dag import DAGScheduler, FlowDAG, FlowNode
+from bandapi.flow.state import FlowState
+
+# seconds of dispatching of each material in each state
+DURATIONS = {
+    ("slow", "dag-scf"): 0.6, ("slow", "dag-band"): 0.1,
+    ("fast", "dag-scf"): 0.1, ("fast", "dag-band"): 0.1,
+    ("broken", "dag-scf"): 0.1, ("broken", "dag-band"): 0.1,
+}
+
+
+class DagTestState(FlowState):
+    _state = "dag-test"
+
+    def bakeup(self, task_content):
+        pass
+
+    def prepare(self, task_content, task_settings):
+        return [name for name in task_content]
+
+    def result_finished(self, subdir):
+        return subdir != "broken"
+
+    def run_end(self, next_state):
+        self.get_state_settings("log").append((list(self.task_content)[0], self._state, next_state))
+        for name, atoms in self.task_content.items():
+            atoms.info["states"] = atoms.info.get("states", 0) + 1
+
+
+class DagScfState(DagTestState):
+    _state = "dag-scf"
+
+
+class DagBandState(DagTestState):
+    _state = "dag-band"
+
+
+class DagGatherState(DagTestState):
+    _state = "dag-gather"
+    _gather_materials = True
+
+
+class DummyScheduler(DAGScheduler):
+    def __init__(self, *args, **kwargs):
+        super(DummyScheduler, self).__init__(*args, **kwargs)
+        self.times = {}
+
+    async def adispatch(self, node, state, executor=None):
+        start = time.monotonic()
+        await asyncio.sleep(DURATIONS.get(node, 0))
+        self.times[node] = (start, time.monotonic())
+
+
+def make_scheduler(materials, **kwargs):
+    log = []
+    task_content = {name: bulk("Si") for name in materials}
+    scheduler = DummyScheduler(DagTestState, ["dag-scf", "dag-band"], task_content, machine={}, resource={},
+                               task_setup={"log": log}, **kwargs)
+    return scheduler, log
+
+
+def test_flow_dag():
+    dag = FlowDAG.from_flow_list(["a", "b"], ["relax", "scf-charge", "nscf-band"])
+    assert len(dag) == 6
+    assert dag.next_state(FlowNode("a", "relax")) == "scf-charge"
+    assert dag.next_state(FlowNode("a", "nscf-band")) is None
+    assert dag.depths()[FlowNode("b", "nscf-band")] == 2
+    assert dag.successors() is dag.successors()  # not rebuilt for every node
+    dag.add_node(FlowNode("a", "band-data"), [FlowNode("a", "nscf-band")])
+    assert dag.next_state(FlowNode("a", "nscf-band")) == "band-data"
+    durations = {FlowNode("a", "relax"): 5, FlowNode("b", "relax"): 1, FlowNode("b", "scf-charge"): 10}
+    length, path = dag.critical_path(durations)
+    assert length == 11 and path == [FlowNode("b", "relax"), FlowNode("b", "scf-charge"), FlowNode("b", "nscf-band")]
+
+
+def test_dag_pipelining():
+    scheduler, log = make_scheduler(["slow", "fast", "broken"])
+    status = scheduler.run()
+    # band of the fast material does not wait for scf of the slow one
+    assert scheduler.times[("fast", "dag-band")][1] < scheduler.times[("slow", "dag-scf")][1]
+    assert scheduler.wall_time < 0.6 + 0.1 + 0.3
+    assert status[FlowNode("slow", "dag-band")] == "done"
+    assert status[FlowNode("broken", "dag-scf")] == "failed"
+    assert status[FlowNode("broken", "dag-band")] == "skipped"
+    assert ("fast", "dag-scf", "dag-band") in log and ("fast", "dag-band", None) in log
+    assert ("broken", "dag-band", None) not in log
+
+
+def test_dag_priority():
+    scheduler, log = make_scheduler(["fast", "slow", "broken"], max_concurrent=1)
+    scheduler.run()
+    # started material is finished before a new material begins
+    assert [item[:2] for item in log][:2] == [("fast", "dag-scf"), ("fast", "dag-band")]
+
+
+def test_dag_gather():
+    log = []
+    task_content = {name: bulk("Si") for name in ["slow", "fast", "broken"]}
+    scheduler = DummyScheduler(DagTestState, ["dag-scf", "dag-band", "dag-gather"], task_content, machine={}, resource={},
+                               task_setup={"log": log})
+    gather = FlowNode(None, "dag-gather")
+    assert scheduler.dag.dependencies[gather] == tuple(FlowNode(name, "dag-band") for name in task_content)
+    assert scheduler.dag.next_state(FlowNode("fast", "dag-band")) == "dag-gather"
+    status = scheduler.run()
+    # one node over the materials done, after all of them ended
+    assert status[gather] == "done"
+    assert [item for item in log if item[1] == "dag-gather"] == [("slow", "dag-gather", None)]
+    assert scheduler.times[gather][0] >= scheduler.times[FlowNode("slow", "dag-band")][1]
+    assert task_content["fast"].info["states"] == 3
+
+    scheduler = DummyScheduler(DagTestState, ["dag-scf", "dag-gather"], {"broken": bulk("Si")}, machine={}, resource={},
+                               task_setup={"log": []})
+    assert scheduler.run()[gather] == "skipped"
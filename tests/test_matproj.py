@@ -0,0 +1,142 @@
+import io
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from ase.build import bulk
+from bandapi.third_part.matproj import MatProjWrapper
+
+
+def _cif(atoms):
+    import ase.io
+    buffer = io.BytesIO()
+    ase.io.write(buffer, atoms, format="cif")
+    return buffer.getvalue().decode()
+
+
+STRUCTURES = {"mp-149": _cif(bulk("Si")), "mp-13": _cif(bulk("Fe")), "mp-2534": _cif(bulk("GaAs", "zincblende", a=5.65))}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    connections = set()
+    requests = []
+    fail_next = 0
+
+    def _send(self, status, payload):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        StubHandler.connections.add(self.client_address)
+        StubHandler.requests.append(self.path)
+        path = urllib.parse.urlsplit(self.path).path
+        if path == "/rest/v1/api_check":
+            self._send(200, {"valid_response": True})
+        elif path.startswith("/rest/v2/materials/"):
+            mp_id = path.split("/")[4]
+            response = [{"cif": STRUCTURES[mp_id]}] if mp_id in STRUCTURES else []
+            self._send(200, {"valid_response": True, "response": response})
+        else:
+            self._send(404, {})
+
+    def do_POST(self):
+        StubHandler.connections.add(self.client_address)
+        StubHandler.requests.append(self.path)
+        data = urllib.parse.parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        if StubHandler.fail_next:
+            StubHandler.fail_next -= 1
+            return self._send(503, {})
+        ids = json.loads(data["criteria"][0])["task_id"]["$in"]
+        response = [{"task_id": item, "cif": STRUCTURES[item]} for item in ids if item in STRUCTURES]
+        self._send(200, {"valid_response": True, "response": response})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    StubHandler.connections = set()
+    StubHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/rest"
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_structure_by_id(stub_server):
+    wrapper = MatProjWrapper("key", force_not_use_pymatgen=True, api_url=stub_server)
+    assert wrapper.test_connet()
+    assert wrapper.test_connet()
+    assert StubHandler.requests.count("/rest/v1/api_check?API_KEY=key") == 1
+    assert wrapper.get_structure_by_id("mp-149")[0].get_chemical_formula() == "Si2"
+    assert wrapper.get_structure_by_id("mp-13")[0].get_chemical_formula() == "Fe"
+    assert len(StubHandler.connections) == 1
+    with pytest.raises(RuntimeError):
+        wrapper.get_structure_by_id("mp-0")
+
+
+def test_get_structures_by_ids(stub_server):
+    wrapper = MatProjWrapper("key", force_not_use_pymatgen=True, api_url=stub_server, batch_size=2, max_workers=2, rate_limit=100)
+    StubHandler.fail_next = 1
+    wrapper.client.backoff = 0.01
+    structures = wrapper.get_structures_by_ids(["mp-2534", "mp-149", "mp-13", "mp-149"])
+    assert list(structures) == ["mp-2534", "mp-149", "mp-13"]
+    assert structures["mp-2534"][0].get_chemical_formula() == "AsGa"
+    assert StubHandler.requests.count("/rest/v2/query") == 3  # 2 batches and 1 retry
+    with pytest.raises(RuntimeError):
+        wrapper.get_structures_by_ids(["mp-149", "mp-0"])
+    assert list(wrapper.get_structures_by_ids(["mp-149", "mp-0"], errors="ignore")) == ["mp-149"]
+    StubHandler.fail_next = 4  # one batch fails after its retries
+    wrapper.max_workers = 1
+    structures = wrapper.get_structures_by_ids(["mp-2534", "mp-149", "mp-13"], errors="ignore")
+    assert list(structures) == ["mp-13"]
+    with pytest.raises(RuntimeError):
+        StubHandler.fail_next = 4
+        wrapper.get_structures_by_ids(["mp-2534", "mp-149", "mp-13"])
+
+
+def test_structure_cache_offline(stub_server, tmpdir):
+    import os
+    import time
+    from bandapi.third_part.matproj import StructureCache
+    wrapper = MatProjWrapper("key", force_not_use_pymatgen=True, api_url=stub_server, cache=tmpdir / "cache")
+    fetched = wrapper.get_structures_by_ids(["mp-149", "mp-13"])
+    assert StubHandler.requests.count("/rest/v2/query") == 1
+    cached = wrapper.get_structures_by_ids(["mp-149", "mp-13"])
+    assert StubHandler.requests.count("/rest/v2/query") == 1
+    assert (cached["mp-149"][0].positions == fetched["mp-149"][0].positions).all()
+    assert (cached["mp-149"][0].cell[:] == fetched["mp-149"][0].cell[:]).all()
+
+    offline = MatProjWrapper("key", force_not_use_pymatgen=True, api_url="http://127.0.0.1:9/rest", cache=tmpdir / "cache", offline=True)
+    assert offline.test_connet()
+    assert offline.get_structure_by_id("mp-13")[0].get_chemical_formula() == "Fe"
+    with pytest.raises(RuntimeError):
+        offline.get_structures_by_ids(["mp-2534"])
+
+    cache = StructureCache(tmpdir / "cache", ttl=60, max_entries=1)
+    os.utime(tmpdir / "cache" / "mp-149.npz", (time.time() - 100, time.time() - 100))
+    assert cache.evict() == ["mp-149"]
+    assert "mp-13" in cache
+    assert StructureCache(tmpdir / "cache", ttl=-1).get("mp-13") is None
+
+
+def test_parse_in_memory(tmpdir, monkeypatch):
+    import tempfile
+    monkeypatch.setattr(tempfile, "tempdir", str(tmpdir))
+    for _ in range(20):
+        atoms = MatProjWrapper._read_cif(STRUCTURES["mp-2534"])[0]
+    assert atoms.get_chemical_formula() == "AsGa"
+    poscar = io.StringIO()
+    atoms.write(poscar, format="vasp")
+    assert MatProjWrapper._read_poscar(poscar.getvalue())[0].get_chemical_formula() == "AsGa"
+    assert tmpdir.listdir() == []
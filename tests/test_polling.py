@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from bandapi.dispatcher.polling import PollingPolicy, TagFileWatcher
+
+
+def test_polling_policy_backoff():
+    policy = PollingPolicy(initial=2, maximum=10, factor=2, jitter=0)
+    assert [policy.next_interval() for _ in range(5)] == [2, 4, 8, 10, 10]
+    policy.reset()
+    assert policy.next_interval() == 2
+
+    fixed = PollingPolicy.from_setting(5)
+    assert [fixed.next_interval() for _ in range(3)] == [5, 5, 5]
+    assert PollingPolicy.from_setting({"initial": 1, "factor": 3, "jitter": 0}).next_interval() == 1
+
+    jittered = PollingPolicy(initial=10, maximum=10, jitter=0.2)
+    assert all(8 <= jittered.next_interval() <= 12 for _ in range(50))
+
+
+def test_polling_policy_runtime_hints():
+    policy = PollingPolicy(initial=100, maximum=100, jitter=0, minimum=1, runtime_hints=[30])
+    assert policy.next_interval() == pytest.approx(31, abs=0.1)  # right after expected finish
+    policy._start -= 40
+    assert policy.next_interval() == 100
+
+
+def test_tag_file_watcher(tmpdir):
+    (tmpdir / "old_task_tag_finished").write("")
+    with TagFileWatcher(tmpdir, scan_interval=0.05) as watcher:
+        assert not watcher.wait(0.2)
+        (tmpdir / "job" / "abc").ensure(dir=True)
+        timer = threading.Timer(0.2, lambda: (tmpdir / "job" / "abc" / "hash_task_tag_finished").write(""))
+        timer.start()
+        start = time.monotonic()
+        assert watcher.wait(10)
+        assert time.monotonic() - start < 5
+        timer.join()
+
+
+def test_tag_file_watcher_shared_and_async(tmpdir):
+    from bandapi.dispatcher import polling
+
+    async def main():
+        watchers = [TagFileWatcher(tmpdir, scan_interval=0.05).start() for _ in range(20)]
+        assert len(polling._monitors) == 1
+        assert not await watchers[0].await_change(0.2)
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.2, lambda: (tmpdir / "hash_task_tag_finished").write(""))
+        start = time.monotonic()
+        threads = threading.active_count()
+        # all waiting at once, without a thread each
+        assert all(await asyncio.gather(*(watcher.await_change(10) for watcher in watchers)))
+        assert time.monotonic() - start < 5
+        assert threading.active_count() <= threads
+        for watcher in watchers:
+            watcher.stop()
+        assert polling._monitors == {}
+
+    asyncio.run(main())
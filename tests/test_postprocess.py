@@ -0,0 +1,48 @@
+import json
+
+import numpy as np
+from ase.build import bulk
+
+from bandapi.flow.abacus.postprocess import band_gap_summary, postprocess_band_data
+from bandapi.io.bandstore import BandArchive
+from test_read_abacus import _write_nscf_log
+
+
+def test_band_gap_summary():
+    bands = np.array([[[-2.0, -1.0, 1.0], [-1.5, -0.5, 2.0]]])
+    assert band_gap_summary(bands) == {"vbm": -0.5, "cbm": 1.0, "band_gap": 1.5}
+    assert band_gap_summary(bands + 0.8)["band_gap"] == 0.0
+
+
+def test_postprocess_band_data(tmp_path):
+    kpoints = np.array([[0.0, 0.0, 0.0], [0.5, 0.0, 0.5]])
+    bands = np.array([[[-2.0, 3.0, 6.0], [-1.0, 4.0, 7.0]]])
+    for subdir in ["mp-1", "mp-2"]:
+        (tmp_path / "nscf-band" / subdir / "OUT.ABACUS").mkdir(parents=True)
+        (tmp_path / "scf-charge" / subdir / "OUT.ABACUS").mkdir(parents=True)
+        (tmp_path / "scf-charge" / subdir / "OUT.ABACUS" / "running_scf.log").write_text(" E_Fermi 0.1 1.0\n")
+    _write_nscf_log(tmp_path / "nscf-band" / "mp-1" / "OUT.ABACUS" / "running_nscf.log", kpoints, bands)
+    task_content = {"mp-1": bulk("Si"), "mp-2": bulk("Si")}
+    results = postprocess_band_data(tmp_path, task_content, max_workers=2, plot=False)
+    assert results["mp-1"]["band_gap"] == 4.0
+    assert results["mp-1"]["fermi_energy"] == 1.0
+    assert "FileNotFoundError" in results["mp-2"]["error"]
+    assert json.loads((tmp_path / "band-data" / "band_summary.json").read_text())["mp-1"]["nk"] == 2
+    assert (tmp_path / "band-data" / "mp-1" / "BAND").exists()
+    results = postprocess_band_data(tmp_path, task_content, max_workers=2, plot=False)  # run again
+    assert results["mp-1"]["band_gap"] == 4.0
+    assert sorted(item.name for item in (tmp_path / "nscf-band" / "mp-1" / "OUT.ABACUS").iterdir()) == ["running_nscf.log"]
+
+
+def test_postprocess_band_data_archive(tmp_path):
+    kpoints = np.array([[0.0, 0.0, 0.0], [0.5, 0.0, 0.5]])
+    bands = np.array([[[-2.0, 3.0, 6.0], [-1.0, 4.0, 7.0]]])
+    (tmp_path / "nscf-band" / "mp-1" / "OUT.ABACUS").mkdir(parents=True)
+    (tmp_path / "scf-charge" / "mp-1" / "OUT.ABACUS").mkdir(parents=True)
+    (tmp_path / "scf-charge" / "mp-1" / "OUT.ABACUS" / "running_scf.log").write_text(" E_Fermi 0.1 1.0\n")
+    _write_nscf_log(tmp_path / "nscf-band" / "mp-1" / "OUT.ABACUS" / "running_nscf.log", kpoints, bands)
+    postprocess_band_data(tmp_path, {"mp-1": bulk("Si")}, max_workers=1, plot=False, archive=tmp_path / "bands")
+    assert not (tmp_path / "band-data" / "mp-1" / "BAND").exists()
+    record = BandArchive(tmp_path / "bands")["mp-1"]
+    np.testing.assert_allclose(record.energies, bands)
+    assert record.fermi_energy == 1.0
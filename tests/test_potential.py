@@ -22,3 +22,26 @@ def test_abacus_SG15_with_ase():
 def test_abacus_SG15_not_exist():
     with pytest.raises(KeyError):
         pathlib.Path(AbacusPotential(pot_name="SG15")["X"]).exists()
+
+
+def test_potential_registry(tmpdir):
+    import numpy as np
+    from bandapi.io.abacus.potential import PotentialRegistry, get_potential_registry
+    registry = get_potential_registry()
+    assert AbacusPotential(pot_name="SG15_ONCV").library is registry.library("sg15")
+    paths = registry.paths("SG15", np.array([[14, 8], [14, 14]]))
+    assert paths.shape == (2, 2)
+    assert paths[0, 0] == registry.path("SG15", "Si") == AbacusPotential(pot_name="SG15")[14]
+    assert paths[0, 0].is_absolute()
+    assert registry.sha256("SG15", 14) == registry.sha256("SG15", "Si")
+    with pytest.raises(KeyError):
+        registry.paths("SG15", [14, 118])
+
+    (tmpdir / "Si.pz-vbc.UPF").write("Si")
+    (tmpdir / "O_ONCV_PBE-1.0.upf").write("O")
+    (tmpdir / "readme").write("")
+    user_registry = PotentialRegistry()
+    library = user_registry.register_library("mine", tmpdir, aliases=["my_lib"])
+    assert library.files == {"O": "O_ONCV_PBE-1.0.upf", "Si": "Si.pz-vbc.UPF"}
+    assert user_registry.path("MY_LIB", 8) == pathlib.Path(tmpdir) / "O_ONCV_PBE-1.0.upf"
+    assert user_registry.path("SG15", "C").exists()
@@ -0,0 +1,291 @@
+import numpy as np
+import pytest
+
+from bandapi.io.abacus.chg import pack_abacus_chg, read_abacus_chg, unpack_abacus_chg, verify_packed_chg
+from bandapi.io.abacus.out import LogFollower, LogIndex, iter_band_in_log, read_band_in_dat, read_band_in_log, read_band_structure, read_stru, read_stru_trajectory
+
+
+def _write_nscf_log(path, kpoints, bands):
+    """
+    Write a minimal ABACUS nscf log with band energies `bands` of shape (nspin, nk, nbands).
+    """
+    lines = [" READING GENERAL INFORMATION", f" nkstot = {len(kpoints)}", "", " KPOINTS DIRECT_X DIRECT_Y DIRECT_Z WEIGHT"]
+    for idx, kpoint in enumerate(kpoints):
+        lines.append(f" {idx + 1} {kpoint[0]} {kpoint[1]} {kpoint[2]} 0.1")
+    for ispin, spin_bands in enumerate(bands):
+        for ik, kpoint in enumerate(kpoints):
+            lines.append(f" k-points{ik + 1}({len(kpoints)}): {kpoint[0]} {kpoint[1]} {kpoint[2]}")
+            for ib, value in enumerate(spin_bands[ik]):
+                lines.append(f" spin{ispin + 1}_final_band {ib + 1} {value}")
+    lines.append(" E_Fermi 0.4 5.4")
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+@pytest.fixture
+def band_data():
+    kpoints = np.array([[0.0, 0.0, 0.0], [0.25, 0.0, 0.25], [0.5, 0.0, 0.5]])
+    bands = np.sort(np.random.default_rng(0).uniform(-10, 10, size=(2, 3, 6)), axis=-1).round(4)
+    return kpoints, bands
+
+
+def test_iter_band_in_log(tmp_path, band_data):
+    kpoints, bands = band_data
+    log_file = _write_nscf_log(tmp_path / "running_nscf.log", kpoints, bands[:1])
+    blocks = list(iter_band_in_log(log_file))
+    assert len(blocks) == 3
+    assert [item.ik for item in blocks] == [0, 1, 2]
+    assert blocks[1].nk == 3
+    np.testing.assert_allclose(blocks[1].kpoint, kpoints[1])
+    np.testing.assert_allclose(blocks[2].energies, bands[0, 2])
+
+
+def test_read_band_in_log(tmp_path, band_data):
+    kpoints, bands = band_data
+    log_file = _write_nscf_log(tmp_path / "running_nscf.log", kpoints, bands[:1])
+    kpathArray, bandArray = read_band_in_log(log_file, outputfile=tmp_path / "BAND")
+    np.testing.assert_allclose(kpathArray, kpoints)
+    np.testing.assert_allclose(bandArray, bands[:1])
+    assert (tmp_path / "BAND").read_text().splitlines()[0].split()[1:] == [str(item) for item in bands[0, 0]]
+
+
+def test_read_band_in_log_spin(tmp_path, band_data):
+    kpoints, bands = band_data
+    log_file = _write_nscf_log(tmp_path / "running_nscf.log", kpoints, bands)
+    _, bandArray = read_band_in_log(log_file)
+    assert bandArray.shape == (2, 3, 6)
+    np.testing.assert_allclose(bandArray, bands)
+    assert read_band_in_log(log_file, _nspin=2)[1].shape == (2, 3, 6)
+    log_file = _write_nscf_log(tmp_path / "running_nscf.log", kpoints, bands[:1])
+    with pytest.raises(ValueError, match="Expect 2 spin channels"):
+        read_band_in_log(log_file, _nspin=2)
+    log_file.write_text(" nspin = 2\n" + log_file.read_text())  # spin 2 is missing
+    with pytest.raises(ValueError, match="nspin = 2"):
+        read_band_in_log(log_file)
+
+
+def test_read_band_in_log_energy_window(tmp_path, band_data):
+    kpoints, bands = band_data
+    log_file = _write_nscf_log(tmp_path / "running_nscf.log", kpoints, bands[:1])
+    _, bandArray = read_band_in_log(log_file, energy_window=(-1, 1), fermi_energy=1.0)
+    keep = ((bands[:1] >= 0) & (bands[:1] <= 2)).any(axis=(0, 1))
+    np.testing.assert_allclose(bandArray, bands[:1][:, :, keep.argmax():len(keep) - keep[::-1].argmax()])
+
+
+def test_log_index(tmp_path, band_data):
+    kpoints, bands = band_data
+    log_file = _write_nscf_log(tmp_path / "running_nscf.log", kpoints, bands)
+    with open(log_file, "a") as f:
+        f.write(" ELEC= 1\n E_Fermi 0.5 6.8\n")
+    log_index = LogIndex(log_file)
+    assert log_index.count("nkstot") == 1
+    assert log_index.count("final_band") == 6
+    assert log_index.count("scf_iteration") == 1
+    assert log_index.fermi_energies() == [5.4, 6.8]
+    assert log_index.last_fermi_energy() == 6.8
+    assert LogIndex(log_file, build=False).last_fermi_energy() == 6.8
+    np.testing.assert_allclose(log_index.kpoints(), kpoints)
+    np.testing.assert_allclose(log_index.read_band()[1], bands)
+
+
+def test_log_index_save_and_load(tmp_path, band_data):
+    kpoints, bands = band_data
+    log_file = _write_nscf_log(tmp_path / "running_nscf.log", kpoints, bands[:1])
+    index_file = LogIndex(log_file).save()
+    assert index_file.exists()
+    assert LogIndex.load(log_file).offsets == LogIndex(log_file).offsets
+    with open(log_file, "a") as f:
+        f.write(" E_Fermi 0.5 6.8\n")
+    assert LogIndex.load(log_file).count("E_Fermi") == 2
+
+
+def _write_bands_dat(path, bands):
+    for ispin, spin_bands in enumerate(bands):
+        np.savetxt(path / f"BANDS_{ispin + 1}.dat", np.concatenate([np.arange(1, spin_bands.shape[0] + 1)[:, None], spin_bands], axis=-1))
+
+
+def test_read_band_in_dat(tmp_path, band_data):
+    _, bands = band_data
+    _write_bands_dat(tmp_path, bands)
+    bandArray = read_band_in_dat([tmp_path / "BANDS_1.dat", tmp_path / "BANDS_2.dat"])
+    np.testing.assert_allclose(bandArray, bands)
+    lines = (tmp_path / "BANDS_1.dat").read_text().splitlines()
+    for broken in ["", "\n".join(lines[:-1] + [lines[-1].rsplit(" ", 1)[0]]), "\n".join(lines[:-1] + ["1 nan? 2"])]:
+        (tmp_path / "BANDS_1.dat").write_text(broken)
+        with pytest.raises(ValueError):
+            read_band_in_dat([tmp_path / "BANDS_1.dat"])
+
+
+def test_read_band_structure(tmp_path, band_data):
+    kpoints, bands = band_data
+    _write_nscf_log(tmp_path / "running_nscf.log", kpoints, bands)
+    kpathArray, bandArray = read_band_structure(tmp_path)
+    np.testing.assert_allclose(bandArray, bands)
+    _write_bands_dat(tmp_path, bands + 1)
+    kpathArray, bandArray = read_band_structure(tmp_path)
+    np.testing.assert_allclose(kpathArray, kpoints)
+    np.testing.assert_allclose(bandArray, bands + 1)
+
+
+def test_log_follower(tmp_path):
+    log_file = tmp_path / "running_scf.log"
+    follower = LogFollower(log_file)
+    assert follower.poll() == []
+    drho = []
+    follower.register("drho", lambda event: drho.append(event.value))
+    log_file.write_text(" PW ALGORITHM ---- ION=   1  ELEC=   1----\n Density error is 0.0753\n E_Kohn")
+    events = follower.poll()
+    assert [item.name for item in events] == ["ionic_step", "scf_iteration", "drho"]
+    assert drho == [0.0753]
+    with open(log_file, "a") as f:
+        f.write("Sham -15.6 -212.9\n E_Fermi 0.45 6.2\n PW ALGORITHM ---- ION=   1  ELEC=   2----\n")
+    events = follower.poll()
+    assert [(item.name, item.value) for item in events] == [
+        ("total_energy", -212.9), ("fermi_energy", 6.2), ("scf_iteration", 2)
+    ]
+    assert follower.offset == log_file.stat().st_size
+    with pytest.raises(KeyError):
+        follower.register("unknown", print)
+
+
+STRU_DIRECT = """ATOMIC_SPECIES
+Si 28.085 Si_ONCV_PBE-1.0.upf
+O 15.999 O_ONCV_PBE-1.0.upf
+
+LATTICE_CONSTANT
+{lat_const}
+
+LATTICE_VECTORS
+1.0 0.0 0.0
+0.0 1.0 0.0
+0.0 0.0 1.0
+
+ATOMIC_POSITIONS
+Direct
+
+Si
+1.5
+2
+0.0 0.0 0.0 0 0 0
+0.5 0.5 {z} 1 1 1
+
+O
+0.0
+1
+0.25 0.25 0.25 1 0 1
+"""
+
+
+def test_read_stru(tmp_path):
+    from ase.units import Bohr
+    (tmp_path / "STRU").write_text(STRU_DIRECT.format(lat_const=10 / Bohr, z=0.5))
+    atoms = read_stru(tmp_path / "STRU")
+    assert atoms.get_chemical_symbols() == ["Si", "Si", "O"]
+    np.testing.assert_allclose(atoms.cell[:], np.eye(3) * 10)
+    np.testing.assert_allclose(atoms.positions, [[0, 0, 0], [5, 5, 5], [2.5, 2.5, 2.5]])
+    np.testing.assert_allclose(atoms.get_initial_magnetic_moments(), [1.5, 1.5, 0])
+    assert len(atoms.constraints) == 2
+    atoms.set_positions(atoms.positions + 1)
+    np.testing.assert_allclose(atoms.positions, [[0, 0, 0], [6, 6, 6], [3.5, 2.5, 3.5]])
+
+
+def test_read_stru_keywords(tmp_path):
+    from ase.units import Bohr
+    content = STRU_DIRECT.format(lat_const=10 / Bohr, z=0.5)
+    content = content.replace("0.0 0.0 0.0 0 0 0", "0.0 0.0 0.0 m 0 0 0 v 0.1 0.0 0.0 mag 2.0")
+    content = content.replace("0.5 0.5 0.5 1 1 1", "0.5 0.5 0.5 1 1 1 angle1 90 angle2 0")
+    content = content.replace("0.25 0.25 0.25 1 0 1", "0.25 0.25 0.25 mag 0.0 0.0 1.0 m 1 0 1")
+    (tmp_path / "STRU").write_text(content)
+    atoms = read_stru(tmp_path / "STRU")
+    np.testing.assert_allclose(atoms.positions, [[0, 0, 0], [5, 5, 5], [2.5, 2.5, 2.5]])
+    np.testing.assert_allclose(atoms.get_initial_magnetic_moments(), [[0, 0, 2.0], [0, 0, 1.5], [0, 0, 1.0]])
+    assert len(atoms.constraints) == 2
+    (tmp_path / "STRU").write_text(content.replace(" mag 0.0 0.0 1.0", " mag 0.5"))
+    np.testing.assert_allclose(read_stru(tmp_path / "STRU").get_initial_magnetic_moments(), [2.0, 1.5, 0.5])
+    (tmp_path / "STRU").write_text(content.replace("m 1 0 1", "m 1 0"))
+    with pytest.raises(ValueError):
+        read_stru(tmp_path / "STRU")
+
+
+def test_read_stru_trajectory(tmp_path):
+    from ase.units import Bohr
+    for step in range(1, 4):
+        (tmp_path / f"STRU_ION{step}_D").write_text(STRU_DIRECT.format(lat_const=10 / Bohr, z=0.5 + step / 100))
+    (tmp_path / "STRU_ION_D").write_text(STRU_DIRECT.format(lat_const=10 / Bohr, z=0.5))
+    symbols, cells, positions = read_stru_trajectory(tmp_path)
+    assert symbols == ["Si", "Si", "O"]
+    assert cells.shape == (3, 3, 3)
+    assert positions.shape == (3, 3, 3)
+    np.testing.assert_allclose(positions[:, 1, 2], [5.1, 5.2, 5.3])
+
+
+CHG_TEXT = """
+ 10.2
+ 0.5 0.5 0
+ 0.5 0 0.5
+ 0 0.5 0.5
+ Si
+ 2
+Direct
+ 0 0 0
+ 0.25 0.25 0.25
+ 1
+ 0.4562 (fermi energy)
+  2 3 4
+"""
+
+
+def test_charge_density_pack(tmp_path):
+    values = np.random.default_rng(0).uniform(size=24)
+    chg_file = tmp_path / "SPIN1_CHG"
+    chg_file.write_text(CHG_TEXT + "\n".join(" " + " ".join(f"{item:.9e}" for item in values[idx:idx + 5]) for idx in range(0, 24, 5)) + "\n")
+    chg = read_abacus_chg(chg_file)
+    assert chg.shape == (2, 3, 4)
+    assert chg.precision == 9
+    assert chg.header == CHG_TEXT
+    np.testing.assert_allclose(chg.values, values, rtol=1e-9)
+    packed_file = pack_abacus_chg(chg_file)
+    assert packed_file.name == "SPIN1_CHG.npz"
+    assert verify_packed_chg(packed_file)
+    chg_file.unlink()
+    unpack_abacus_chg(packed_file)
+    unpacked = read_abacus_chg(chg_file)
+    assert unpacked.header == CHG_TEXT
+    np.testing.assert_array_equal(unpacked.values, chg.values)
+    broken = chg_file.read_text().replace(f"{values[7]:.9e}", "nan?", 1)
+    chg_file.write_text(broken)
+    with pytest.raises(ValueError):
+        read_abacus_chg(chg_file)
+
+
+def test_unpack_script_without_bandapi(tmp_path):
+    import subprocess
+    import sys
+    from bandapi.io.abacus.chg import UnpackScript, render_abacus_chg
+    values = np.random.default_rng(1).uniform(size=24)
+    chg_file = tmp_path / "SPIN1_CHG"
+    chg_file.write_text(CHG_TEXT + "\n".join(" " + " ".join(f"{item:.6e}" for item in values[idx:idx + 8]) for idx in range(0, 24, 8)) + "\n")
+    for dtype in [np.float64, np.float32]:
+        packed_file = pack_abacus_chg(chg_file, dtype=dtype)
+        (tmp_path / "OUT.ABACUS").mkdir(exist_ok=True)
+        remote_file = tmp_path / "OUT.ABACUS" / "SPIN1_CHG"
+        packed_file.replace(remote_file.with_name("SPIN1_CHG.npz"))
+        code = ("import runpy, sys; sys.modules['numpy'] = sys.modules['bandapi'] = None; "
+                f"sys.argv = ['unpack_chg.py', 'OUT.ABACUS/SPIN1_CHG.npz']; runpy.run_path({str(UnpackScript)!r}, run_name='__main__')")
+        subprocess.run([sys.executable, "-c", code], cwd=tmp_path, check=True)
+        chg = read_abacus_chg(chg_file)
+        assert remote_file.read_bytes() == render_abacus_chg(chg._replace(values=chg.values.astype(dtype)))
+
+
+def test_check_abacus_log(tmp_path):
+    from bandapi.io.abacus.out import RelaxConvergedPattern, ScfConvergedPattern, ScfNotConvergedPattern, check_abacus_log
+    log_file = tmp_path / "running_scf.log"
+    assert not check_abacus_log(log_file)
+    log_file.write_text(" ELEC=1\n")  # written when ABACUS starts
+    assert not check_abacus_log(log_file)
+    log_file.write_text(" ELEC=20\n !! CONVERGENCE HAS NOT BEEN ACHIEVED !!\n Total  Time  : 0 h 0 mins 5 secs \n")
+    assert check_abacus_log(log_file)
+    assert not check_abacus_log(log_file, converged=ScfConvergedPattern, not_converged=ScfNotConvergedPattern)
+    log_file.write_text(" charge density convergence is achieved\n Total  Time  : 0 h 0 mins 5 secs \n")
+    assert check_abacus_log(log_file, converged=ScfConvergedPattern, not_converged=ScfNotConvergedPattern)
+    assert not check_abacus_log(log_file, converged=RelaxConvergedPattern)
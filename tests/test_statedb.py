@@ -0,0 +1,78 @@
+import pathlib
+
+from ase.build import bulk
+from bandapi.flow.abacus import AbacusBandState, AbacusScfStateWithCharge
+from bandapi.flow.statedb import FlowStateDB
+from bandapi.flow.task_content import NamedAtomsContentDict
+
+
+FinishedLog = " charge density convergence is achieved\n Total  Time  : 0 h 0 mins 5 secs \n"
+
+
+def make_result(root, state, material, name, content=None):
+    file = pathlib.Path(root) / state / material / "OUT.ABACUS" / name
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_text(f"{state} {material}" if content is None else content)
+    return file
+
+
+def make_charge(root, material):
+    make_result(root, "scf-charge", material, "running_scf.log", FinishedLog)
+    make_result(root, "scf-charge", material, "SPIN1_CHG")
+
+
+def test_state_db(tmpdir):
+    db = FlowStateDB(tmpdir / "state.sqlite")
+    db.mark(["mp-0", "mp-1"], "scf-charge", "running")
+    assert db.status("mp-0", "scf-charge") == "running"
+    db.mark(["mp-0"], "scf-charge", "done", submission_hash="abc", checksums={"mp-0": {"OUT.ABACUS/SPIN1_CHG": "123"}})
+    db.mark(["mp-1"], "scf-charge", "failed")
+    record = db.get("mp-0", "scf-charge")
+    assert record["status"] == "done" and record["submission_hash"] == "abc"
+    assert record["started"] <= record["finished"]
+    assert record["checksums"] == {"OUT.ABACUS/SPIN1_CHG": "123"}
+    assert db.get("mp-0", "nscf-band") is None
+    assert db.finished("scf-charge", [f"mp-{idx}" for idx in range(1000)]) == {"mp-0"}
+    assert db.counts() == {"scf-charge": {"done": 1, "failed": 1}}
+
+    make_charge(tmpdir, "mp-2")
+    make_result(tmpdir, "scf-charge", "mp-3", "SPIN1_CHG")  # log of a crashed scf
+    make_result(tmpdir, "nscf-band", "mp-2", "running_nscf.log", FinishedLog)
+    make_result(tmpdir, "nscf-band", "mp-2", "BANDS_1.dat")
+    make_result(tmpdir, "nscf-band", "mp-3", "running_nscf.log")  # started but not finished
+    summary = db.rebuild(tmpdir, {"scf-charge": AbacusScfStateWithCharge, "nscf-band": AbacusBandState})
+    assert summary == {"scf-charge": 1, "nscf-band": 1}
+    assert db.finished("scf-charge") == {"mp-0", "mp-2"}
+    assert db.finished("nscf-band") == {"mp-2"}
+    assert sorted(db.get("mp-2", "scf-charge")["checksums"]) == ["OUT.ABACUS/SPIN1_CHG", "OUT.ABACUS/running_scf.log"]
+
+
+def test_state_db_resume(tmpdir):
+    content = NamedAtomsContentDict({"mp-0": bulk("Si"), "mp-1": bulk("Si")})
+    settings = {"potential_name": "SG15", "flow_work_root": tmpdir, "state_db": tmpdir / "state.sqlite"}
+    make_charge(tmpdir, "mp-0")  # on disk but not recorded
+
+    state = AbacusScfStateWithCharge(content, **settings)
+    state.flow_begin_test()
+    assert state.check_exist_status == {}
+    assert state.pending_subdirs() == ["mp-0", "mp-1"]
+    make_charge(tmpdir, "mp-1")
+    state.submission_hash = "abc"
+    state.record_results()
+
+    state = AbacusScfStateWithCharge(content, **settings)
+    state.flow_begin_test()
+    assert state.check_exist_status == {"mp-0": True, "mp-1": True}
+    db = state.get_state_db()
+    assert db.get("mp-1", "scf-charge")["submission_hash"] == "abc"
+
+    band = AbacusBandState(content, **settings)
+    band.flow_begin_test()  # charge density is copied for unfinished nscf
+    assert band.pending_subdirs() == ["mp-0", "mp-1"]
+    assert (tmpdir / "nscf-band" / "mp-1" / "OUT.ABACUS" / "SPIN1_CHG").exists()
+    make_result(tmpdir, "nscf-band", "mp-0", "running_nscf.log")  # written at start, the run crashed
+    make_result(tmpdir, "nscf-band", "mp-1", "running_nscf.log", FinishedLog)
+    make_result(tmpdir, "nscf-band", "mp-1", "BANDS_1.dat")
+    band.record_results()
+    assert db.status("mp-0", "nscf-band") == "failed"
+    assert db.status("mp-1", "nscf-band") == "done"
@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+import pytest
+
+spglib = pytest.importorskip("spglib")
+
+
+def _noisy_si():
+    from ase.build import bulk
+    atoms = bulk("Si", "diamond", a=5.43)
+    atoms.positions[1] += [1e-4, -1e-4, 0.0]
+    return atoms
+
+
+def test_irreducible_kpoints():
+    from ase.build import bulk
+    from bandapi.flow.abacus.symmetry import irreducible_kpoints, reduce_kpt_args, symmetrize_atoms
+    atoms = symmetrize_atoms(_noisy_si(), symprec=1e-3)
+    assert np.allclose(atoms.get_scaled_positions()[1], [0.25, 0.25, 0.25])
+    nfull, kpoints = irreducible_kpoints(atoms, [4, 4, 4])
+    assert nfull == 64
+    assert kpoints.shape[0] < 64
+    assert np.isclose(kpoints[:, 3].sum(), 1.0)
+    kpt_args, reduction = reduce_kpt_args(atoms, {"number_of_kpt": 0, "mode": "Gamma", "content": [4, 4, 4, 0, 0, 0]})
+    assert kpt_args["mode"] == "Direct"
+    assert kpt_args["number_of_kpt"] == reduction.number_of_irreducible == kpoints.shape[0]
+    assert "Fd-3m" in reduction.spacegroup
+
+
+@pytest.mark.parametrize("symmetry_mode,symmetry_flag", [("abacus", 1), ("kpoints", 1)])
+def test_scf_state_symmetry_mode(tmpdir, symmetry_mode, symmetry_flag):
+    from bandapi.flow.abacus.calculation_state import AbacusScfState
+    from bandapi.io.abacus.input import read_abacus_input
+    from bandapi.io.abacus.kpt import read_abacus_kpt
+    state = AbacusScfState({"mp-149": _noisy_si()}, tmpdir, potential_name="SG15",
+                           symmetry_mode=symmetry_mode, symprec=1e-3, kpointfix=True, kpointscope=4)
+    state.check_exist_status = {}
+    (tmpdir / "scf" / "mp-149").ensure(dir=True)
+    state.bakeup(state.task_content)
+    assert read_abacus_input(tmpdir / "scf" / "mp-149" / "INPUT")["symmetry"] == symmetry_flag
+    kpt_args = read_abacus_kpt(tmpdir / "scf" / "mp-149" / "KPT")
+    assert kpt_args["number_of_kpt"] == (0 if symmetry_mode == "abacus" else 8)
+    report = json.load(open(tmpdir / "scf" / "kpoint_reduction.json"))
+    assert report["mp-149"]["number_of_full"] == 64
+    assert report["mp-149"]["number_of_irreducible"] == 8
+
+
+def test_magnetic_symmetry():
+    from ase.build import bulk
+    from bandapi.flow.abacus.symmetry import irreducible_kpoints, symmetrize_atoms
+    atoms = bulk("Ni", "fcc", a=3.52, cubic=True)
+    _, nonmagnetic = irreducible_kpoints(atoms, [4, 4, 4])
+    atoms.set_initial_magnetic_moments([2.0, -2.0, -2.0, 2.0])  # layered antiferromagnetic, tetragonal
+    _, magnetic = irreducible_kpoints(atoms, [4, 4, 4])
+    assert magnetic.shape[0] > nonmagnetic.shape[0]
+    symmetrized = symmetrize_atoms(atoms, symprec=1e-3)
+    assert list(symmetrized.get_atomic_numbers()) == [28] * 4
+    assert list(symmetrized.get_initial_magnetic_moments()) == [2.0, -2.0, -2.0, 2.0]
+    atoms.set_initial_magnetic_moments(None)
+    atoms.set_initial_magnetic_moments([[0, 0, 2.0], [0, 0, -2.0], [0, 0, -2.0], [0, 0, 2.0]])
+    with pytest.raises(ValueError):
+        irreducible_kpoints(atoms, [4, 4, 4])
@@ -0,0 +1,89 @@
+import pytest
+from ase.build import bulk, molecule
+from bandapi.flow.task_content import AtomsSource, DirectorySource, LazyAtomsContentDict
+
+
+class CountingSource(AtomsSource):
+    def __init__(self):
+        self.calls = []
+
+    def load_many(self, names):
+        self.calls.append(list(names))
+        return {name: bulk("Cu", a=3.6 + int(name[3:]) * 0.01) for name in names if name != "mp-404"}
+
+
+def test_lazy_content_bounded_and_chunked():
+    source = CountingSource()
+    content = LazyAtomsContentDict([f"mp-{idx}" for idx in range(10)], source, max_cached=3, chunk_size=4)
+    assert len(content) == 10 and "mp-3" in content and source.calls == []
+    chunks = list(content.iter_chunks())
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert source.calls == [[f"mp-{idx}" for idx in range(4)], [f"mp-{idx}" for idx in range(4, 8)], ["mp-8", "mp-9"]]
+    assert len(content._cached) == 3
+    assert content["mp-9"].cell[0, 1] == pytest.approx((3.6 + 0.09) / 2)
+    assert len(source.calls) == 3  # still cached
+    content["mp-0"]
+    assert source.calls[-1] == ["mp-0"]
+
+
+def test_lazy_content_overrides_are_spilled(tmpdir):
+    source = CountingSource()
+    content = LazyAtomsContentDict(["mp-1", "mp-2", "mp-3"], source, max_cached=1, spill_dir=tmpdir)
+    relaxed = bulk("Cu", a=4.0)
+    relaxed.set_initial_magnetic_moments([1.0])
+    content["mp-1"] = relaxed
+    [name for name, _ in content.items()]
+    assert len(tmpdir.listdir()) == 1
+    assert content["mp-1"].cell[0, 1] == pytest.approx(2.0)
+    assert content["mp-1"].get_initial_magnetic_moments()[0] == 1.0
+    assert ["mp-1"] not in source.calls
+    with pytest.raises(TypeError):
+        content["mp-2"] = molecule("H2O")
+    del content["mp-1"]
+    assert list(content) == ["mp-2", "mp-3"]
+
+
+def test_lazy_content_threads(tmpdir):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    class SlowSource(CountingSource):
+        def load_many(self, names):
+            time.sleep(0.001)
+            return super(SlowSource, self).load_many(names)
+
+    names = [f"mp-{idx}" for idx in range(40)]
+    content = LazyAtomsContentDict(names, SlowSource(), max_cached=5, spill_dir=tmpdir)
+    for name in names[::2]:
+        content[name] = bulk("Cu", a=5.0)
+
+    def read(name):
+        return content[name].cell[0, 1]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        cells = list(executor.map(read, names * 5))
+    assert cells == [2.5 if int(name[3:]) % 2 == 0 else pytest.approx((3.6 + int(name[3:]) * 0.01) / 2) for name in names * 5]
+    assert len(content._cached) <= 5
+
+
+def test_directory_source(tmpdir):
+    bulk("Si").write(str(tmpdir / "mp-149.cif"))
+    content = LazyAtomsContentDict(["mp-149", "mp-404"], DirectorySource(tmpdir))
+    assert content["mp-149"].get_chemical_formula() == "Si2"
+    with pytest.raises(RuntimeError):
+        list(content.items())
+    with pytest.raises(KeyError):
+        content["mp-404"]
+    content = LazyAtomsContentDict(["mp-149", "mp-404"], DirectorySource(tmpdir), missing="skip")
+    assert [name for name, _ in content.items()] == ["mp-149"]
+
+
+def test_run_end_does_not_load_structures(tmpdir, monkeypatch):
+    from bandapi.flow.abacus import calculation_state
+    monkeypatch.setattr(calculation_state, "read_stru", lambda file: bulk("Cu", a=3.7))
+    source = CountingSource()
+    content = LazyAtomsContentDict(["mp-1", "mp-2"], source)
+    state = calculation_state.AbacusRelaxState(content, tmpdir, potential_name="SG15")
+    assert state.run_end(next_state="scf-charge")
+    assert source.calls == []
+    assert content["mp-2"].cell[0, 1] == pytest.approx(1.85)
@@ -54,4 +54,125 @@ def test_write_input_with_wrong_key(tmpdir):
     }
     with pytest.raises(KeyError) as e:
         write_abacus_input(tmpdir, input_para_dict=input_dict, input_name=input_name)
-        assert isinstance(ImportError, e.type)
\ No newline at end of file
+        assert isinstance(ImportError, e.type)
+
+def test_read_input_round_trip(tmpdir):
+    from bandapi.io.abacus.input import read_abacus_input, render_abacus_input, validate_abacus_input
+    input_dict = {
+        "pseudo_dir": "./",
+        "calculation": "scf",
+        "ntype": 1,
+        "ecutwfc": 50,
+        "dr2": 1.0e-7,
+        "smearing": "gaussian",
+        "sigma": 0.002,
+        "out_charge": 1
+    }
+    write_abacus_input(tmpdir, input_para_dict=input_dict)
+    read_dict = read_abacus_input(tmpdir / "INPUT")
+    assert read_dict == input_dict
+    assert list(read_dict) == ["pseudo_dir", "calculation", "ntype", "ecutwfc", "dr2", "out_charge", "smearing", "sigma"]
+    assert render_abacus_input(read_dict) == open(tmpdir / "INPUT", "rb").read()
+    assert validate_abacus_input({"ntype": "2", "ecutwfc": "60.5"}) == {"ntype": 2, "ecutwfc": 60.5}
+    with pytest.raises(TypeError):
+        validate_abacus_input({"ntype": "2.5"})
+    with pytest.raises(KeyError):
+        validate_abacus_input({"wrong_key": 1})
+
+    from bandapi.io.abacus.input import parse_abacus_input
+    content = render_abacus_input(validate_abacus_input({"dr2": "1.0e-9", "ecutwfc": "60.00", "nbands": "08", "ntype": "2"}))
+    assert b"1.0e-9\n" in content and b"60.00\n" in content and b" 08\n" in content
+    parsed = parse_abacus_input(content)
+    assert parsed == {"ntype": 2, "nbands": 8, "ecutwfc": 60.0, "dr2": 1e-9}
+    assert render_abacus_input(parsed) == content
+    hand_edited = "INPUT_PARAMETERS\nntype 1   # one element\necutwfc   45.50\ndr2 1E-08\nsmearing gauss\n"
+    rendered = render_abacus_input(parse_abacus_input(hand_edited))
+    assert parse_abacus_input(rendered) == parse_abacus_input(hand_edited)
+    assert render_abacus_input(parse_abacus_input(rendered)) == rendered
+    assert [line.split()[-1] for line in rendered.decode().splitlines() if line.startswith(("ecutwfc", "dr2"))] == ["45.50", "1E-08"]
+
+
+def test_write_and_read_kpt(tmpdir):
+    import numpy as np
+    from bandapi.io.abacus.kpt import read_abacus_kpt, write_abacus_kpt
+    kpoints = np.array([[0.0, 0.0, 0.0, 0.125], [0.5, 0.25, 0.0, 0.375], [0.5, 0.5, 0.5, 0.5]])
+    write_abacus_kpt(tmpdir, kpt_para_dict={"number_of_kpt": 3, "mode": "Direct", "content": kpoints})
+    assert open(tmpdir / "KPT").read() == "K_POINTS\n3\nDirect\n0.0 0.0 0.0 0.125\n0.5 0.25 0.0 0.375\n0.5 0.5 0.5 0.5\n\n"
+    kpt_dict = read_abacus_kpt(tmpdir / "KPT")
+    assert kpt_dict["mode"] == "Direct"
+    np.testing.assert_array_equal(kpt_dict["content"], kpoints)
+
+    write_abacus_kpt(tmpdir, kpt_para_dict={"number_of_kpt": 2, "mode": "Cartesian", "content": kpoints[:2, :3].tolist()})
+    np.testing.assert_allclose(read_abacus_kpt(tmpdir / "KPT")["content"][:, 3], [0.5, 0.5])
+
+    write_abacus_kpt(tmpdir, kpt_para_dict={"number_of_kpt": 2, "mode": "Line", "content": [[0.5, 0.0, 0.5, 20], [0.0, 0.0, 0.0, 1]]})
+    assert open(tmpdir / "KPT").read() == "K_POINTS\n2\nLine\n0.5 0.0 0.5 20\n0.0 0.0 0.0 1\n\n"
+
+    write_abacus_kpt(tmpdir, kpt_para_dict={"number_of_kpt": 0, "mode": "Gamma", "content": [2, 2, 2, 0, 0, 0]})
+    assert read_abacus_kpt(tmpdir / "KPT") == {"number_of_kpt": 0, "mode": "Gamma", "content": [2, 2, 2, 0, 0, 0]}
+
+    with pytest.raises(ValueError):
+        write_abacus_kpt(tmpdir, kpt_para_dict={"number_of_kpt": 4, "mode": "Direct", "content": kpoints})
+
+    from bandapi.io.abacus.kpt import parse_abacus_kpt
+    labelled = parse_abacus_kpt("K_POINTS\n2\nLine\n0.5 0.0 0.5 20 # X\n0.0 0.0 0.0 1 # G\n")
+    np.testing.assert_array_equal(labelled["content"], [[0.5, 0.0, 0.5, 20], [0.0, 0.0, 0.0, 1]])
+    for broken in ["K_POINTS\n2\nLine\n0.5 0.0 0.5\n0.0 0.0 0.0 1 20\n", "K_POINTS\n2\nLine\n0.5 0.0 0.5 20\n", "K_POINTS\n1\nLine\n0.5 x 0.5 20\n"]:
+        with pytest.raises(ValueError):
+            parse_abacus_kpt(broken)
+
+
+def test_write_stru(tmpdir):
+    import numpy as np
+    from bandapi.io.abacus.out import read_stru
+    from bandapi.io.abacus.stru import write_abacus_stru
+    pos_si = np.array([[0, 0, 0, 1, 1, 1], [0.25, 0.25, 0.25, 1, 1, 1]])
+    stru_dict = {
+        "label_list": ["Si", "O"],
+        "mass_list": ["1.000", "1.000"],
+        "pseudo_file_list": ["Si.pz-vbc.UPF", "O.pz-vbc.UPF"],
+        "lattice_constant": 10.0,
+        "lattice_matrix": [[0.5, 0.5, 0.0], [0.5, 0.0, 0.5], [0.0, 0.5, 0.5]],
+        "coordinate_type": "Direct",
+        "atom_type_list": ["Si", "O"],
+        "magnetism_list": [0.0, 0],
+        "number_of_atoms_list": [2, 1],
+        "pos_list": [pos_si, [[0.5, 0.5, 0.5, 0, 1, 1]]]
+    }
+    write_abacus_stru(tmpdir, stru_para_dict=stru_dict, precision=6)
+    content = open(tmpdir / "STRU").read()
+    assert "0.250000 0.250000 0.250000 1 1 1\n" in content
+    assert "0.500000 0.500000 0.500000 0 1 1\n" in content
+    atoms = read_stru(tmpdir / "STRU")
+    assert atoms.get_chemical_symbols() == ["Si", "Si", "O"]
+    np.testing.assert_allclose(atoms.cell[:], np.array(stru_dict["lattice_matrix"]) * 10.0)
+    np.testing.assert_allclose(atoms.positions[1], [2.5, 2.5, 2.5])
+
+
+def test_write_stru_wrong_number(tmpdir):
+    from bandapi.io.abacus.stru import generate_atomic_positions_lines
+    with pytest.raises(ValueError):
+        generate_atomic_positions_lines({
+            "coordinate_type": "Direct",
+            "atom_type_list": ["Si"],
+            "magnetism_list": [0.0],
+            "number_of_atoms_list": [2],
+            "pos_list": [[[0, 0, 0, 1, 1, 1]]]
+        })
+
+
+def test_render_and_pack_tasks(tmpdir):
+    import tarfile
+    from bandapi.io.abacus.input import render_abacus_input
+    from bandapi.io.abacus.task import hash_rendered_task, pack_rendered_tasks, render_abacus_task, write_rendered_tasks
+    input_dict = {"calculation": "scf", "ntype": 1}
+    kpt_dict = {"number_of_kpt": 0, "mode": "Gamma", "content": [2, 2, 2, 0, 0, 0]}
+    rendered = render_abacus_task(input_para_dict=input_dict, kpt_para_dict=kpt_dict)
+    assert rendered["INPUT"] == render_abacus_input(input_dict)
+    assert rendered["KPT"] == b"K_POINTS\n0\nGamma\n2 2 2 0 0 0\n\n"
+    assert hash_rendered_task(rendered) == hash_rendered_task(dict(reversed(list(rendered.items()))))
+    write_rendered_tasks({"scf/mp-1": rendered, "scf/mp-2": rendered}, root=tmpdir)
+    assert open(tmpdir / "scf" / "mp-2" / "KPT", "rb").read() == rendered["KPT"]
+    pack_rendered_tasks({"scf/mp-1": rendered}, tmpdir / "tasks.tgz")
+    with tarfile.open(tmpdir / "tasks.tgz") as tar:
+        assert tar.extractfile("scf/mp-1/INPUT").read() == rendered["INPUT"]